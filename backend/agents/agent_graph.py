@@ -1,54 +1,72 @@
-from typing import Dict
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
 from langgraph.graph import StateGraph, END
 
 from langgraph.graph import StateGraph, END
 from langgraph.graph.message import add_messages
 from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
 
 from .state_models import State
 from .chat_agent import ChatAgent
 from .strategist_agent import StrategistAgent
 from .voice_agent import VoiceAgent
 from .analyst_agent import AnalystAgent
-from . import firebase
+from .job_timing import JobTimeline
+from .cancellation import CancelToken, run_cancellable
+from . import firebase, metrics
+from .state_sink import UserStateSink
+
+# Job timelines kept per graph, for the most recently used threads
+MAX_TIMELINES = 32
 
 class AgentGraph:
 
-    def __init__(self, user_id = 'user1', service_category = 'movers'):
+    def __init__(self, user_id = 'user1', service_category = 'movers', status_writer: Optional[Callable[..., None]] = None):
+        """
+        Args:
+            status_writer: Writes the user's status document, `status_writer(user_id, data, merge=...)`;
+                Firestore by default
+        """
         self.user_id = user_id
         self.service_category = service_category
+        self.timelines: "OrderedDict[str, JobTimeline]" = OrderedDict()
+        self._timelines_lock = threading.Lock()
+        self.cancel_token = CancelToken()
+        # The session's own sink, closed by its token, so an abandoned job can't write over the next session's
+        self.sink = UserStateSink(user_id, writer=status_writer, cancel_token=self.cancel_token)
 
         # Initialize agents with service category
-        chat_agent = ChatAgent(user_id, service_category)
-        strategist_agent = StrategistAgent(user_id, service_category)
-        voice_agent = VoiceAgent(user_id, service_category)
-        analyst_agent = AnalystAgent(user_id, service_category)
+        chat_agent = ChatAgent(user_id, service_category, sink=self.sink)
+        strategist_agent = StrategistAgent(user_id, service_category, sink=self.sink)
+        analyst_agent = AnalystAgent(user_id, service_category, sink=self.sink)
+        # The analyst folds in each call as it finishes, instead of waiting for all of them
+        voice_agent = VoiceAgent(user_id, service_category, call_listener=analyst_agent, sink=self.sink)
 
         # Create workflow graph
         workflow = StateGraph(State)
 
         # Add nodes
-        workflow.add_node("chat", chat_agent)
-        workflow.add_node("strategist", strategist_agent)
-        workflow.add_node("voice", voice_agent)
-        workflow.add_node("analyst", analyst_agent)
-
-        # define when to continue the chat, or move on to the strategist agent
-        def should_continue_chat(state: State) -> str:
+        workflow.add_node("chat", self._step("chat", chat_agent))
+        workflow.add_node("providers", self._step("providers", strategist_agent.select_providers))
+        workflow.add_node("strategist", self._step("strategist", strategist_agent.plan_strategy))
+        workflow.add_node("voice", self._step("voice", voice_agent))
+        workflow.add_node("analyst", self._step("analyst", analyst_agent))
+
+        # define when to continue the chat, or move on to the strategist agent.
+        # Provider filtering and the negotiation strategy don't depend on each other,
+        # so they run as parallel branches and the voice agent starts once both are done
+        def should_continue_chat(state: State):
             if state.get("customer_info"):
-                return "strategist"
+                return ["providers", "strategist"]
             elif not isinstance(state.get("messages")[-1], HumanMessage):
                 return END
             return "chat"
 
-        # define when to make calls
-        def should_make_calls(state: State) -> str:
-            if state.get("selected_movers"):
-                print("\n MOVING ON TO VOICE AGENT \n")
-                return "voice"
-            return "strategist"
-
         # define when to analyze the call transcripts
         def should_analyze(state: State) -> str:
             if state.get("call_transcripts"):
@@ -58,8 +76,8 @@ class AgentGraph:
 
 
         # Add edges
-        workflow.add_conditional_edges("chat", should_continue_chat, ["chat", "strategist", END])
-        workflow.add_conditional_edges("strategist", should_make_calls, ["voice"])
+        workflow.add_conditional_edges("chat", should_continue_chat, ["chat", "providers", "strategist", END])
+        workflow.add_edge(["providers", "strategist"], "voice")
         workflow.add_conditional_edges("voice", should_analyze, ["analyst"])
         workflow.add_edge("analyst", END)
 
@@ -69,10 +87,67 @@ class AgentGraph:
         memory = MemorySaver() # to change this into a sqlitessaver and connect to the DB
         self.graph = workflow.compile(checkpointer=memory) #, interrupt_before=["tools"]
 
-        firebase.update_data(self.user_id, data = { 
+        self.sink.replace({
             "status": firebase.AppStatus.INFO_COLLECTION,
             "service_category": service_category
-        }, merge=False)
+        })
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """
+        Stop the session's running job: the current step stops at its next check, and
+        its LLM requests, queued calls and live calls are dropped. Its status updates are
+        dropped too, after waiting for a write in flight, so blocking: call it off the
+        event loop. False if already cancelled.
+        """
+        if not self.cancel_token.cancel(reason):
+            return False
+        metrics.JOBS_CANCELLED.labels(reason).inc()
+        return True
+
+    def _step(self, name: str, node: Callable) -> Callable:
+        """
+        Wrap a graph node so it is timed, can be cancelled and the user's status document
+        is written once per step.
+        """
+        accepts_config = len(inspect.signature(node).parameters) > 1
+
+        def step(state: State, config: RunnableConfig) -> Dict:
+            timeline = self.timeline(config["configurable"].get("thread_id"))
+            if name == "chat":
+                # A job runs from the chat turn that completes the customer info to the analyst
+                timeline.reset()
+            started = time.perf_counter()
+            try:
+                with metrics.GRAPH_NODE_LATENCY.labels(name).time():
+                    args = (state, config) if accepts_config else (state,)
+                    return run_cancellable(self.cancel_token, node, *args)
+            finally:
+                timeline.record(name, started, time.perf_counter())
+                # A cancelled session's sink is closed; the user's document belongs to the next session
+                if not self.cancel_token.cancelled:
+                    if name == "analyst":
+                        self._report_timing(timeline)
+                    self.sink.flush()
+
+        return step
+
+    def timeline(self, thread_id: str) -> JobTimeline:
+        """The timeline of a thread's jobs; only the MAX_TIMELINES most recently used threads are kept."""
+        with self._timelines_lock:
+            timeline = self.timelines.get(thread_id)
+            if timeline is None:
+                timeline = self.timelines[thread_id] = JobTimeline()
+            self.timelines.move_to_end(thread_id)
+            while len(self.timelines) > MAX_TIMELINES:
+                self.timelines.popitem(last=False)
+            return timeline
+
+    def _report_timing(self, timeline: JobTimeline):
+        report = timeline.report()
+        metrics.GRAPH_JOB_LATENCY.labels("serial").observe(report["serialMs"] / 1000)
+        metrics.GRAPH_JOB_LATENCY.labels("critical_path").observe(report["criticalPathMs"] / 1000)
+        print(f"Job timing: {report}")
+        self.sink.update({ "timing": report })
 
 
 if __name__ == "__main__":
@@ -1,14 +1,68 @@
-from typing import Dict
-from langchain_openai import ChatOpenAI
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from langchain_core.messages import AIMessage
 from langchain_core.prompts import ChatPromptTemplate
 
 from .config import Config
-from . import firebase
-from ..prompts.prompt_manager import prompt_manager
+from .llm import chat_model
+from . import blob_store, firebase
+from .state_sink import UserStateSink, sink_for
+from prompts.prompt_manager import prompt_manager
+from .prompt_layout import analyst_prompt, analyst_update_prompt
+
+STREAM_UPDATE_SECONDS = 0.5
+NO_CALLS_YET = "No calls yet."
+
+class RunningAnalysis:
+    """
+    The analysis of one job, updated with each call as it finishes while the next
+    calls are still running. Calls are folded in one at a time on a worker thread,
+    each from the analysis so far plus the latest call, and the draft is streamed
+    into the status document.
+    """
+
+    def __init__(self, analyst: "AnalystAgent", customer_info):
+        self.analyst = analyst
+        self.customer_info = customer_info
+        self.analysis: Optional[str] = None
+        self.calls = 0
+        self.failed = False
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="analyst")
+
+    def add(self, provider_name: str, transcript: Optional[str], summary: str):
+        self.calls += 1
+        call = f"Provider: {provider_name}\nSummary:\n{summary}"
+        if transcript:
+            call += f"\nTranscript:\n{transcript}"
+        # Folds run under the job's cancel token, like the node that made the call
+        self._executor.submit(contextvars.copy_context().run, self._fold, call)
+
+    def _fold(self, call: str):
+        if self.failed:
+            return
+        try:
+            response = self.analyst._stream_recommendation(self.analyst.update_prompt, {
+                "customer_info": self.customer_info,
+                "analysis": self.analysis or NO_CALLS_YET,
+                "call": call,
+            })
+            self.analysis = response.content
+        except BaseException as e:
+            # The analyst node falls back to one pass over all transcripts
+            self.failed = True
+            print(f"Running analysis failed: {e!r}")
+
+    def finish(self) -> Optional[str]:
+        """Wait for the calls still being folded in; the analysis of every call, or None if a fold failed."""
+        self._executor.shutdown(wait=True)
+        return None if self.failed else self.analysis
+
 
 class AnalystAgent:
     def __init__(self, user_id: str, service_category: str = 'movers', model: str = Config.ANALYST_MODEL):
-        self.llm = ChatOpenAI(model=model)
+        self.llm = chat_model(model, "analyst")
         self.user_id = user_id
         self.service_category = service_category
         
@@ -21,37 +75,71 @@ class AnalystAgent:
         ])
 
 class AnalystAgent:
-    def __init__(self, user_id: str, service_category: str = 'movers', model: str = Config.ANALYST_MODEL):
-        self.llm = ChatOpenAI(model=model)
+    def __init__(self, user_id: str, service_category: str = 'movers', model: str = Config.ANALYST_MODEL,
+                 sink: Optional[UserStateSink] = None):
+        self.llm = chat_model(model, "analyst")
         self.user_id = user_id
         self.service_category = service_category
-        
-        # Load service-specific analyst prompt
-        analyst_prompt = prompt_manager.get_prompt(service_category, 'analyst_system')
-        
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", analyst_prompt),
-            ("human", "Customer Info: {customer_info}\nCall Transcripts: {transcripts}")
-        ])
+        self.sink = sink or sink_for(user_id)
+        self.prompt = analyst_prompt(service_category)
+        self.update_prompt = analyst_update_prompt(service_category)
+        self._running: Optional[RunningAnalysis] = None
+
+    def begin(self, customer_info):
+        """Start the running analysis of a job, before its first call (see add_call)."""
+        if self._running is not None:
+            self._running.finish()
+        self._running = RunningAnalysis(self, customer_info)
+
+    def add_call(self, provider_name: str, transcript: Optional[str], summary: str):
+        """Fold a finished call into the running analysis, without waiting for it."""
+        if self._running is not None:
+            self._running.add(provider_name, transcript, summary)
 
     def __call__(self, state: Dict) -> Dict:
         customer_info = state.get("customer_info", None)
-        transcripts = state.get("call_transcripts", None)
+        transcripts = blob_store.deref(state.get("call_transcripts"))
 
         print(f"Analysing quotes")
 
-        chain = self.prompt | self.llm
-        response = chain.invoke({"customer_info": customer_info,"transcripts": transcripts})
+        self.sink.update({ "status": firebase.AppStatus.ANALYSING })
+        # Usually only the last call is still being folded in when the voice agent is done
+        running, self._running = self._running, None
+        analysis = running.finish() if running is not None else None
+        if analysis is not None and running.calls == len(transcripts or []):
+            response = AIMessage(content=analysis)
+        else:
+            response = self._stream_recommendation(self.prompt, {"customer_info": customer_info, "transcripts": transcripts})
 
         print(f"FINAL RECOMMENDATION: {response.content}")
 
-        firebase.update_data(self.user_id, {
+        self.sink.update({
             "status": firebase.AppStatus.COMPLETED,
             "recommendation": response.content,
             # "messages": response,
         })
+        self.sink.update({ "writeStats": self.sink.stats() })
+        print(f"Firestore writes for this job: {self.sink.stats()}")
 
         return {
             "messages": response,
             "final_recommendation": response.content
-        }
\ No newline at end of file
+        }
+
+    def _stream_recommendation(self, prompt, inputs: Dict) -> AIMessage:
+        """
+        Stream the recommendation into the status document as it is generated, so the
+        user starts reading before the analysis is complete. Partial text is pushed at
+        most every STREAM_UPDATE_SECONDS; the sink merges the pushes into few writes.
+        """
+        chain = prompt | self.llm
+        response = None
+        pushed_at = time.monotonic()
+        for chunk in chain.stream(inputs):
+            response = chunk if response is None else response + chunk
+            if time.monotonic() - pushed_at >= STREAM_UPDATE_SECONDS:
+                self.sink.update({ "recommendation": response.content })
+                pushed_at = time.monotonic()
+        if response is not None:
+            self.sink.update({ "recommendation": response.content })
+        return AIMessage(content=response.content if response is not None else "")
\ No newline at end of file
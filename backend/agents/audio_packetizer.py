@@ -0,0 +1,182 @@
+"""
+Outbound audio packetizing for the OpenAI -> Twilio direction.
+
+The Realtime API streams `response.audio.delta` events of arbitrary, often small,
+size. Sending each one as its own media message (followed by a mark) multiplies the
+websocket message rate toward Twilio. The packetizer buffers the decoded μ-law bytes
+and releases them in chunks that are a whole number of frames of `frame_ms`
+(8 bytes per ms at 8 kHz), so small deltas are merged and large ones go out as-is.
+What is left at the end of a response is flushed on `response.audio.done`.
+
+The packetizer also counts how much audio of the current assistant item has been
+released, so a barge-in truncate never claims more audio was played than was sent.
+
+Run `python -m agents.audio_packetizer` to compare messages/sec and CPU per call
+against per-delta sending, on a synthetic stream or a recorded one (`--recording`).
+"""
+
+import base64
+from typing import List, Optional
+
+MULAW_BYTES_PER_MS = 8  # 8 kHz, one byte per sample
+MIN_FRAME_MS = 20
+MAX_FRAME_MS = 100
+
+class AudioPacketizer:
+    def __init__(self, frame_ms: int = 60):
+        """
+        Args:
+            frame_ms: Target frame duration, between MIN_FRAME_MS and MAX_FRAME_MS
+        """
+        if not MIN_FRAME_MS <= frame_ms <= MAX_FRAME_MS:
+            raise ValueError(f"frame_ms must be between {MIN_FRAME_MS} and {MAX_FRAME_MS}, got {frame_ms}")
+        self.frame_bytes = frame_ms * MULAW_BYTES_PER_MS
+        self._pending = bytearray()
+        self._item_id: Optional[str] = None
+        self.item_bytes_released = 0
+        self.deltas_in = 0
+        self.chunks_out = 0
+
+    def push(self, delta: str, item_id: Optional[str] = None) -> List[str]:
+        """
+        Add a base64 audio delta.
+
+        Returns:
+            List[str]: Base64 payloads ready to send, empty while less than a frame is buffered
+        """
+        if item_id and item_id != self._item_id:
+            self._item_id = item_id
+            self.item_bytes_released = 0
+        self.deltas_in += 1
+        self._pending += base64.b64decode(delta)
+        ready = len(self._pending) - len(self._pending) % self.frame_bytes
+        if not ready:
+            return []
+        return [self._release(ready)]
+
+    def flush(self) -> List[str]:
+        """Release whatever is buffered, e.g. when the response's audio is done."""
+        if not self._pending:
+            return []
+        return [self._release(len(self._pending))]
+
+    def reset(self) -> int:
+        """Drop buffered audio on barge-in. Returns the dropped duration in ms."""
+        dropped_ms = len(self._pending) // MULAW_BYTES_PER_MS
+        self._pending.clear()
+        return dropped_ms
+
+    def _release(self, size: int) -> str:
+        chunk = bytes(self._pending[:size])
+        del self._pending[:size]
+        self.item_bytes_released += size
+        self.chunks_out += 1
+        return base64.b64encode(chunk).decode("ascii")
+
+    @property
+    def item_ms_released(self) -> int:
+        """Milliseconds of the current assistant item handed out for sending."""
+        return self.item_bytes_released // MULAW_BYTES_PER_MS
+
+    def truncate_offset(self, elapsed_ms: int, unsent_ms: int = 0) -> int:
+        """
+        The `audio_end_ms` for a conversation.item.truncate: the time elapsed on the
+        Twilio clock, capped at the audio of the item that was released and not
+        dropped from the send queue (`unsent_ms`) afterwards.
+        """
+        return max(0, min(elapsed_ms, self.item_ms_released - unsent_ms))
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import json
+    import random
+    import sys
+    import time
+
+    from .media_relay import RelaySender
+    from . import metrics
+
+    parser = argparse.ArgumentParser(description="Messages/sec and CPU toward Twilio, per-delta vs packetized")
+    parser.add_argument("--recording", help="JSONL of Realtime events; response.audio.delta events are replayed")
+    parser.add_argument("--calls", type=int, default=50)
+    parser.add_argument("--call-seconds", type=int, default=120, help="Synthetic AI audio per call")
+    parser.add_argument("--frame-ms", type=int, nargs="*", default=[20, 40, 60, 100])
+    args = parser.parse_args()
+
+    def synthetic_deltas(seconds: int) -> List[dict]:
+        """Deltas of 2-40 ms in responses of 2-8 s, like the Realtime API streams them."""
+        rng = random.Random(7)
+        events, remaining, response = [], seconds * 1000, 0
+        while remaining > 0:
+            response += 1
+            response_ms = min(remaining, rng.randint(2000, 8000))
+            remaining -= response_ms
+            while response_ms > 0:
+                delta_ms = min(response_ms, rng.choice((2, 5, 10, 20, 25, 40)))
+                response_ms -= delta_ms
+                audio = bytes(rng.getrandbits(8) for _ in range(delta_ms * MULAW_BYTES_PER_MS))
+                events.append({"type": "response.audio.delta", "item_id": f"item_{response}",
+                               "delta": base64.b64encode(audio).decode("ascii")})
+            events.append({"type": "response.audio.done", "item_id": f"item_{response}"})
+        return events
+
+    if args.recording:
+        with open(args.recording) as f:
+            events = [event for event in map(json.loads, f)
+                      if event.get("type") in ("response.audio.delta", "response.audio.done")]
+    else:
+        events = synthetic_deltas(args.call_seconds)
+    audio_ms = sum(len(base64.b64decode(e["delta"])) for e in events if "delta" in e) // MULAW_BYTES_PER_MS
+
+    async def run_call(frame_ms: Optional[int]) -> int:
+        sent = 0
+
+        async def send(message: str):
+            nonlocal sent
+            sent += 1
+            await asyncio.sleep(0)
+
+        async def send_mark():
+            await send(json.dumps({"event": "mark", "streamSid": "MZ-bench", "mark": {"name": "responsePart"}}))
+
+        render = lambda payload: json.dumps({"event": "media", "streamSid": "MZ-bench", "media": {"payload": payload}})
+        if frame_ms is None:
+            # Previous behaviour: a media message and a mark for every delta
+            for event in events:
+                if "delta" in event:
+                    await send(render(event["delta"]))
+                    await send_mark()
+            return sent
+
+        sender = RelaySender(send, metrics.OPENAI_TO_TWILIO, render_audio=render, after_audio=send_mark)
+        packetizer = AudioPacketizer(frame_ms)
+        for event in events:
+            if "delta" in event:
+                payloads = packetizer.push(event["delta"], event.get("item_id"))
+            else:
+                payloads = packetizer.flush()
+            for payload in payloads:
+                sender.put_audio(payload)
+            await asyncio.sleep(0)
+        while sender.depth:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await sender.close()
+        return sent
+
+    async def run(frame_ms: Optional[int]):
+        wall, cpu = time.perf_counter(), time.process_time()
+        messages = 0
+        for _ in range(args.calls):
+            messages += await run_call(frame_ms)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        name = "per delta" if frame_ms is None else f"packetized {frame_ms} ms"
+        print(f"{name:<18} {messages / args.calls:8.0f} msgs/call "
+              f"{messages / args.calls / (audio_ms / 1000):6.1f} msgs/s of audio "
+              f"{cpu / args.calls * 1000:7.2f} ms CPU/call  ({wall:.2f}s wall)", file=sys.stderr)
+
+    print(f"{sum('delta' in e for e in events)} deltas, {audio_ms / 1000:.1f}s of audio per call", file=sys.stderr)
+    for frame_ms in [None, *args.frame_ms]:
+        asyncio.run(run(frame_ms))
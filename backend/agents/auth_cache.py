@@ -0,0 +1,233 @@
+"""
+Cached Firebase ID-token verification.
+
+Verified tokens are kept in a bounded LRU cache keyed by the token hash until the
+token's `exp`, so repeated requests with the same token skip signature checks.
+Callers get their own copy of the claims, so one request can't alter another's. The
+Google public key set is prefetched and refreshed in the background according to
+its Cache-Control max-age, so verification of a new token never waits on the network.
+
+Run `python -m agents.auth_cache` for a benchmark against a locally signed token.
+"""
+
+import copy
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import jwt
+import requests
+from cryptography import x509
+
+GOOGLE_CERTS_URL = "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com"
+DEFAULT_MAX_AGE = 3600
+MIN_REFRESH_INTERVAL = 60
+CLOCK_SKEW_SECONDS = 5
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+class VerifiedTokenCache:
+    """Thread-safe LRU cache of decoded token claims, honoring each token's expiry."""
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._revocation_hooks: List[Callable[[str], None]] = []
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str) -> Optional[Dict]:
+        key = token_key(token)
+        with self._lock:
+            claims = self._entries.get(key)
+            if claims is None:
+                self.misses += 1
+                return None
+            if claims.get("exp", 0) <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(claims)
+
+    def put(self, token: str, claims: Dict):
+        key = token_key(token)
+        claims = copy.deepcopy(claims)
+        with self._lock:
+            self._entries[key] = claims
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def add_revocation_hook(self, hook: Callable[[str], None]):
+        """Register a callback invoked with the uid whenever a user's tokens are revoked."""
+        self._revocation_hooks.append(hook)
+
+    def revoke_token(self, token: str):
+        with self._lock:
+            self._entries.pop(token_key(token), None)
+
+    def revoke_uid(self, uid: str) -> int:
+        """Drop every cached token of a user, e.g. after auth.revoke_refresh_tokens(uid)."""
+        with self._lock:
+            keys = [key for key, claims in self._entries.items() if claims.get("uid") == uid]
+            for key in keys:
+                del self._entries[key]
+        for hook in self._revocation_hooks:
+            hook(uid)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class PublicKeySet:
+    """Google's token signing keys, prefetched and refreshed by a background thread."""
+
+    def __init__(self, url: str = GOOGLE_CERTS_URL):
+        self.url = url
+        self._keys: Dict[str, object] = {}
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def set_keys(self, keys: Dict[str, object], max_age: int = DEFAULT_MAX_AGE):
+        with self._lock:
+            self._keys = dict(keys)
+            self._expires_at = time.time() + max_age
+
+    def get(self, kid: str):
+        return self._keys.get(kid)
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._keys) and time.time() < self._expires_at
+
+    def refresh(self) -> int:
+        """Fetch the certificates and return their Cache-Control max-age in seconds."""
+        response = requests.get(self.url, timeout=10)
+        response.raise_for_status()
+        keys = {
+            kid: x509.load_pem_x509_certificate(cert.encode("utf-8")).public_key()
+            for kid, cert in response.json().items()
+        }
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        max_age = int(match.group(1)) if match else DEFAULT_MAX_AGE
+        self.set_keys(keys, max_age)
+        return max_age
+
+    def start(self):
+        """Prefetch the keys now and keep them fresh in the background."""
+        if self._refresher is not None:
+            return
+        self._refresher = threading.Thread(target=self._run, name="firebase-key-refresher", daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                max_age = self.refresh()
+                # Refresh well before the keys expire
+                wait = max(MIN_REFRESH_INTERVAL, max_age * 0.8)
+            except Exception as e:
+                print(f"Error refreshing Firebase public keys: {e}")
+                wait = MIN_REFRESH_INTERVAL
+            self._stop.wait(wait)
+
+class TokenVerifier:
+    """
+    Verifies Firebase ID tokens locally against the prefetched key set, with a cache
+    of already verified tokens. Falls back to `fallback` (e.g. auth.verify_id_token)
+    when the key set is not ready or doesn't know the token's key id.
+    """
+
+    def __init__(self, project_id: str, key_set: Optional[PublicKeySet] = None,
+                 cache: Optional[VerifiedTokenCache] = None, fallback: Optional[Callable[[str], Dict]] = None):
+        self.project_id = project_id
+        self.key_set = key_set or PublicKeySet()
+        self.cache = cache or VerifiedTokenCache()
+        self.fallback = fallback
+
+    def verify(self, token: str) -> Dict:
+        claims = self.cache.get(token)
+        if claims is not None:
+            return claims
+
+        claims = self._verify_signature(token)
+        self.cache.put(token, claims)
+        return claims
+
+    def _verify_signature(self, token: str) -> Dict:
+        kid = jwt.get_unverified_header(token).get("kid")
+        key = self.key_set.get(kid) if self.key_set.ready else None
+        if key is None:
+            if self.fallback is None:
+                raise ValueError(f"Unknown signing key: {kid}")
+            return dict(self.fallback(token))
+
+        claims = jwt.decode(
+            token,
+            key=key,
+            algorithms=["RS256"],
+            audience=self.project_id,
+            issuer=f"https://securetoken.google.com/{self.project_id}",
+            leeway=CLOCK_SKEW_SECONDS,
+            options={"require": ["exp", "iat", "sub"]},
+        )
+        if not claims.get("sub"):
+            raise ValueError("Token has an empty subject")
+        claims["uid"] = claims["sub"]
+        return claims
+
+
+if __name__ == "__main__":
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    project_id = "bench-project"
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    now = int(time.time())
+    token = jwt.encode(
+        {
+            "iss": f"https://securetoken.google.com/{project_id}",
+            "aud": project_id,
+            "sub": "bench-user",
+            "iat": now,
+            "exp": now + 3600,
+        },
+        private_key,
+        algorithm="RS256",
+        headers={"kid": "bench-key"},
+    )
+
+    key_set = PublicKeySet()
+    key_set.set_keys({"bench-key": private_key.public_key()})
+    verifier = TokenVerifier(project_id, key_set)
+
+    iterations = 2000
+    start = time.perf_counter()
+    for _ in range(iterations):
+        verifier.cache.clear()
+        verifier.verify(token)
+    uncached = (time.perf_counter() - start) / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        verifier.verify(token)
+    cached = (time.perf_counter() - start) / iterations
+
+    print(f"signature verification: {uncached * 1e6:.1f} us/request")
+    print(f"cached verification:    {cached * 1e6:.1f} us/request")
+    print(f"speedup:                {uncached / cached:.0f}x")
@@ -0,0 +1,325 @@
+"""
+Headless batch runs of pre-collected customer requests through the agent graph.
+
+Each input row is one job: the customer's chat messages and a service category.
+Input can be JSON lines, e.g.
+
+    {"id": "r-001", "category": "movers", "messages": ["I want to move from SF to Miami, ..."]}
+
+or a CSV with `id`, `category` and `message` columns. A `messages` column holding a
+JSON list works too. Rows without an id are numbered by position, and rows without
+a category are movers. A row that can't be parsed becomes an "error" result and
+the run goes on with the next one.
+
+Jobs run on a bounded pool of worker threads, each in its own AgentGraph with the
+job id in its user and thread id. At most `workers` jobs run at once, and only a
+few more are read ahead. The dialer is shared by the process, so calls from all
+workers are paced together.
+
+Like any graph run, a job writes its status document to Firestore, under
+users/batch-<id>, which needs the Firebase credentials. With `--status-writes
+memory` the documents are kept in memory instead and dropped after each job,
+with the final status in the job's result.
+
+Each finished job is written as one line of the JSONL output and flushed to disk
+right away. The output doubles as the checkpoint. A run with `--resume` skips the
+jobs that already have an "ok" or "needs_input" line and runs failed ones again,
+so the last line of a job id is its current result. A line cut short by a crash
+is dropped.
+
+    python -m agents.batch_runner requests.jsonl --out results.jsonl --workers 8 [--resume] [--status-writes memory]
+
+Run it from the backend directory. At the end it prints throughput and the latency of
+each graph stage.
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Dict, Iterator, List, Optional, Set
+
+from .firestore_async import merge_fields
+from .log import get_logger
+
+logger = get_logger("batch_runner")
+
+DEFAULT_CATEGORY = "movers"
+# Results that need no rerun on resume; failed jobs are tried again
+FINISHED_STATUSES = ("ok", "needs_input")
+# Jobs read ahead per worker, so a large input isn't all queued at once
+READ_AHEAD = 2
+
+@dataclass
+class BatchRequest:
+    id: str
+    category: str
+    messages: List[str]
+    user_id: str
+    # Why the row couldn't be parsed; such a request is reported, not run
+    error: Optional[str] = None
+
+def _request(row: Dict, position: int) -> BatchRequest:
+    messages = row.get("messages")
+    if isinstance(messages, str):
+        messages = json.loads(messages) if messages.strip().startswith("[") else [messages]
+    if not messages and row.get("message"):
+        messages = [row["message"]]
+    if not messages:
+        raise ValueError(f"Request {position} has no messages")
+    request_id = str(row.get("id") or position)
+    return BatchRequest(
+        id=request_id,
+        category=row.get("category") or row.get("service_category") or DEFAULT_CATEGORY,
+        messages=[str(message) for message in messages],
+        user_id=row.get("user_id") or f"batch-{request_id}",
+    )
+
+def _parsed(parse: Callable[[], Dict], position: int) -> BatchRequest:
+    """The request of a row, or a request carrying the parse error, so one bad row doesn't stop the batch."""
+    row: Dict = {}
+    try:
+        row = parse()
+        if not isinstance(row, dict):
+            raise ValueError(f"Request {position} is not an object")
+        return _request(row, position)
+    except ValueError as e:
+        request_id = str(row.get("id") or position)
+        return BatchRequest(id=request_id, category=row.get("category") or DEFAULT_CATEGORY, messages=[],
+                            user_id=row.get("user_id") or f"batch-{request_id}", error=str(e))
+
+def read_requests(path: str) -> Iterator[BatchRequest]:
+    """The jobs of a JSON lines or CSV file, by extension."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            for position, row in enumerate(csv.DictReader(f), 1):
+                yield _parsed(lambda: row, position)
+        else:
+            position = 0
+            for line in f:
+                if line.strip():
+                    position += 1
+                    yield _parsed(lambda: json.loads(line), position)
+
+class ResultWriter:
+    """The JSONL output, appended to one flushed line per job from any worker thread."""
+
+    def __init__(self, path: str, resume: bool):
+        """
+        Args:
+            path: The output file, which is also the checkpoint
+            resume: Keep the finished jobs already in the file instead of starting a new one
+        """
+        self.path = path
+        self.finished: Set[str] = set()
+        self._lock = threading.Lock()
+        if resume and os.path.exists(path):
+            self._load()
+        self._file = open(path, "a" if resume else "w", encoding="utf-8")
+
+    def _load(self):
+        valid_bytes = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    break
+                valid_bytes += len(line)
+                if result.get("status") in FINISHED_STATUSES:
+                    self.finished.add(result["id"])
+                else:
+                    self.finished.discard(result["id"])
+        # Drop whatever a crash left half-written after the last complete line
+        with open(self.path, "r+b") as f:
+            f.truncate(valid_bytes)
+
+    def write(self, result: Dict):
+        line = json.dumps(result, ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+class MemoryStatusDocuments:
+    """The jobs' `users/{uid}` status documents, kept in memory instead of Firestore."""
+
+    def __init__(self):
+        self.documents: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def write(self, user_id: str, data: Dict, merge: bool = True):
+        with self._lock:
+            if merge:
+                merge_fields(self.documents.setdefault(user_id, {}), data)
+            else:
+                self.documents[user_id] = dict(data)
+
+    def pop(self, user_id: str) -> Dict:
+        with self._lock:
+            return self.documents.pop(user_id, {})
+
+def run_graph_job(request: BatchRequest, status_documents: Optional[MemoryStatusDocuments] = None) -> Dict:
+    """
+    Run one request through a fresh AgentGraph, as the chat UI would with these messages.
+
+    Args:
+        status_documents: Keep the job's status document here instead of writing it to Firestore
+    """
+    from langchain_core.messages import HumanMessage
+    from . import blob_store
+    from .agent_graph import AgentGraph
+
+    status_writer = status_documents.write if status_documents is not None else None
+    agent_graph = AgentGraph(request.user_id, request.category, status_writer=status_writer)
+    thread_id = f"{request.id}-{uuid.uuid4().hex[:8]}"
+    config = {"configurable": {"thread_id": thread_id}}
+    state: Dict = {}
+    try:
+        for message in request.messages:
+            state = agent_graph.graph.invoke({"messages": [HumanMessage(content=message)]}, config=config)
+    finally:
+        document = status_documents.pop(request.user_id) if status_documents is not None else None
+    timeline = agent_graph.timelines.get(thread_id)
+    recommendation = state.get("final_recommendation")
+    transcripts = blob_store.deref(state.get("call_transcripts"), [])
+    result = {
+        # Without a recommendation the chat agent is still asking for customer details
+        "status": "ok" if recommendation else "needs_input",
+        "reply": state["messages"][-1].content if state.get("messages") else None,
+        "recommendation": recommendation,
+        "numberOfCalls": len(transcripts),
+        "timing": timeline.report() if timeline else {},
+    }
+    if document is not None:
+        result["documentStatus"] = document.get("status")
+    return result
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class BatchRunner:
+    def __init__(self, output: ResultWriter, workers: int = 4, run_job: Callable[[BatchRequest], Dict] = run_graph_job):
+        """
+        Args:
+            output: Where the results go
+            workers: Jobs run at the same time
+            run_job: Runs one request, returning its result fields
+        """
+        self.output = output
+        self.workers = workers
+        self.run_job = run_job
+        self.results: List[Dict] = []
+        self.skipped = 0
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def _run(self, request: BatchRequest) -> Dict:
+        started = time.perf_counter()
+        if request.error is not None:
+            logger.warning("Batch request can't be parsed", extra={"job": request.id, "error": request.error})
+            result = {"status": "error", "error": f"ValueError: {request.error}"}
+        else:
+            try:
+                result = self.run_job(request)
+            except Exception as e:
+                logger.exception("Batch job failed", extra={"job": request.id})
+                result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        result = {"id": request.id, "category": request.category, "userId": request.user_id,
+                  **result, "wallMs": round((time.perf_counter() - started) * 1000, 1), "finishedAt": time.time()}
+        self.output.write(result)
+        with self._lock:
+            self.results.append(result)
+        return result
+
+    def run(self, requests: Iterator[BatchRequest]):
+        """Run the requests not yet finished in the output, keeping at most workers * READ_AHEAD queued."""
+        started = time.perf_counter()
+        pending: Set[Future] = set()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as executor:
+            try:
+                for request in requests:
+                    if request.id in self.output.finished:
+                        self.skipped += 1
+                        continue
+                    if len(pending) >= self.workers * READ_AHEAD:
+                        _, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    pending.add(executor.submit(self._run, request))
+                wait(pending)
+            except KeyboardInterrupt:
+                # Finished jobs are already in the output; a rerun with --resume picks up the rest
+                logger.warning("Interrupted, waiting for the running jobs")
+                for future in pending:
+                    future.cancel()
+                raise
+            finally:
+                self.elapsed = time.perf_counter() - started
+
+    def report(self) -> Dict:
+        """Throughput of this run, and latency per graph stage over its finished jobs."""
+        statuses: Dict[str, int] = {}
+        for result in self.results:
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        stages: Dict[str, List[float]] = {}
+        for result in self.results:
+            timing = result.get("timing") or {}
+            for node, ms in (timing.get("nodesMs") or {}).items():
+                stages.setdefault(node, []).append(ms)
+            if "criticalPathMs" in timing:
+                stages.setdefault("job (critical path)", []).append(timing["criticalPathMs"])
+        if self.results:
+            stages["job (wall)"] = [result["wallMs"] for result in self.results]
+        return {
+            "jobs": len(self.results),
+            "skipped": self.skipped,
+            "statuses": statuses,
+            "elapsedSeconds": round(self.elapsed, 2),
+            "jobsPerMinute": round(len(self.results) / self.elapsed * 60, 2) if self.elapsed > 0 else 0.0,
+            "stagesMs": {
+                node: {"count": len(values), "p50": round(_percentile(values, 0.5), 1),
+                       "p95": round(_percentile(values, 0.95), 1), "max": round(max(values), 1)}
+                for node, values in stages.items()
+            },
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Run a file of customer requests through the agent graph")
+    parser.add_argument("input", help="JSON lines or CSV of requests")
+    parser.add_argument("--out", default="batch_results.jsonl", help="JSON lines of results, also the checkpoint")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--resume", action="store_true", help="Skip the jobs already finished in --out")
+    parser.add_argument("--status-writes", choices=("firestore", "memory"), default="firestore",
+                        help="Where the jobs' status documents go; memory keeps production Firestore untouched")
+    args = parser.parse_args()
+
+    writer = ResultWriter(args.out, args.resume)
+    run_job = run_graph_job
+    if args.status_writes == "memory":
+        run_job = partial(run_graph_job, status_documents=MemoryStatusDocuments())
+    runner = BatchRunner(writer, args.workers, run_job)
+    try:
+        runner.run(read_requests(args.input))
+    finally:
+        writer.close()
+        report = runner.report()
+        print(f"{report['jobs']} jobs in {report['elapsedSeconds']:.1f} s ({report['jobsPerMinute']:.1f} jobs/min), "
+              f"{report['skipped']} already done, {report['statuses']}", file=sys.stderr)
+        for node, stats in report["stagesMs"].items():
+            print(f"  {node:<20} n={stats['count']:<5d} p50 {stats['p50']:>9.1f} ms | p95 {stats['p95']:>9.1f} ms "
+                  f"| max {stats['max']:>9.1f} ms", file=sys.stderr)
+        print(f"Results in {args.out}", file=sys.stderr)
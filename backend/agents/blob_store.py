@@ -0,0 +1,212 @@
+"""
+Content-addressed store for the large values of the graph state.
+
+The strategy text, the provider records and the call transcripts are kept out of
+the LangGraph state: nodes `put` them here and put only the returned reference
+(`blob:<sha256 prefix>`) in their state update. The checkpointer then copies a few
+dozen bytes per field on every step instead of the full values, so checkpoint size
+and serialization time stay flat as jobs grow. Nodes read values back with `deref`,
+which also passes through inline values from checkpoints written before the store.
+
+Blobs live in a SQLite database (BLOB_STORE_DB) shared by every process on the
+host, like the call store, and expire after BLOB_STORE_TTL_SECONDS. Expired blobs
+are purged as new ones are stored, at most every PURGE_INTERVAL_SECONDS per process.
+
+Run `python -m agents.blob_store` to compare checkpoint sizes and serialization
+times of inline and referenced state.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any
+
+REF_PREFIX = "blob:"
+PURGE_INTERVAL_SECONDS = 300
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+class BlobStore:
+    def __init__(self, path: str, ttl_seconds: float = 24 * 3600, cache_size: int = 64):
+        """
+        Args:
+            path: SQLite database file, shared by every process using the store
+            ttl_seconds: How long a blob is kept after it was last written
+            cache_size: Decoded values kept in memory, most recently used first
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._local = threading.local()
+        self._purged_at = 0.0
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS blobs (ref TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS blobs_updated_at ON blobs (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections can't be shared across threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _remember(self, ref: str, value: Any):
+        with self._cache_lock:
+            self._cache[ref] = value
+            self._cache.move_to_end(ref)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def put(self, value: Any) -> str:
+        """Store a JSON-serializable value and return its reference."""
+        data = json.dumps(value, ensure_ascii=False, default=str, separators=(",", ":")).encode("utf-8")
+        ref = REF_PREFIX + hashlib.sha256(data).hexdigest()[:32]
+        # Identical values share a blob; rewriting it only refreshes its expiry
+        self._connect().execute(
+            "INSERT OR REPLACE INTO blobs (ref, data, updated_at) VALUES (?, ?, ?)", (ref, data, time.time())
+        )
+        self._remember(ref, value)
+        if time.monotonic() - self._purged_at >= PURGE_INTERVAL_SECONDS:
+            self.purge_expired()
+        return ref
+
+    def get(self, ref: str) -> Any:
+        with self._cache_lock:
+            if ref in self._cache:
+                self._cache.move_to_end(ref)
+                return self._cache[ref]
+        row = self._connect().execute("SELECT data FROM blobs WHERE ref = ?", (ref,)).fetchone()
+        if row is None:
+            raise KeyError(f"Unknown or expired blob {ref}")
+        value = json.loads(row[0])
+        self._remember(ref, value)
+        return value
+
+    def deref(self, value: Any, default: Any = None) -> Any:
+        """The value behind a reference; inline values and None pass through."""
+        if value is None:
+            return default
+        return self.get(value) if is_ref(value) else value
+
+    def purge_expired(self) -> int:
+        self._purged_at = time.monotonic()
+        cursor = self._connect().execute(
+            "DELETE FROM blobs WHERE updated_at < ?", (time.time() - self.ttl_seconds,)
+        )
+        return cursor.rowcount
+
+@lru_cache(maxsize=None)
+def get_blob_store() -> BlobStore:
+    from .config import Config
+    return BlobStore(Config.BLOB_STORE_DB, Config.BLOB_STORE_TTL_SECONDS)
+
+def put(value: Any) -> str:
+    return get_blob_store().put(value)
+
+def deref(value: Any, default: Any = None) -> Any:
+    return get_blob_store().deref(value, default)
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import random
+    import statistics
+    import sys
+    import tempfile
+    from typing import Annotated, Optional as Opt, TypedDict
+
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.graph import END, StateGraph
+    from langgraph.graph.message import add_messages
+
+    parser = argparse.ArgumentParser(description="Checkpoint size and serialization time, inline vs referenced state")
+    parser.add_argument("--providers", type=int, nargs="*", default=[5, 20, 80])
+    parser.add_argument("--chat-turns", type=int, default=8)
+    args = parser.parse_args()
+
+    class BenchState(TypedDict):
+        messages: Annotated[list, add_messages]
+        customer_info: Opt[dict]
+        selected_movers: Opt[Any]
+        negotiation_strategy: Opt[Any]
+        call_transcripts: Opt[Any]
+        final_recommendation: Opt[str]
+
+    rng = random.Random(5)
+    words = "we can do the move on the tenth for about twelve hundred dollars including packing and two movers".split()
+
+    def text(n_words: int) -> str:
+        return " ".join(rng.choice(words) for _ in range(n_words))
+
+    def build(providers: int, referenced: bool, store: BlobStore):
+        records = [{"name": f"Mover {index}", "phone": f"+1555000{index:04d}", "rating": 4.5,
+                    "specialties": text(12), "min_price": 900, "max_price": 4000, "notes": text(60)}
+                   for index in range(providers)]
+        strategy = text(400)
+        transcripts = [text(900) for _ in range(providers)]
+        wrap = store.put if referenced else (lambda value: value)
+
+        def chat(state):
+            return {"messages": AIMessage(content=text(40)), "customer_info": {"name": "Dean", "notes": text(80)}}
+
+        def strategist(state):
+            if referenced:
+                return {"selected_movers": wrap(records), "negotiation_strategy": wrap(strategy)}
+            # The old node: mutate and return the whole state, strategy as the full message
+            state["selected_movers"] = records
+            state["negotiation_strategy"] = AIMessage(content=strategy)
+            return state
+
+        def voice(state):
+            movers = store.deref(state["selected_movers"])
+            return {"call_transcripts": wrap(transcripts[:len(movers)])}
+
+        def analyst(state):
+            store.deref(state["call_transcripts"])
+            return {"messages": AIMessage(content=text(200)), "final_recommendation": text(200)}
+
+        workflow = StateGraph(BenchState)
+        for name, node in (("chat", chat), ("strategist", strategist), ("voice", voice), ("analyst", analyst)):
+            workflow.add_node(name, node)
+        workflow.set_entry_point("chat")
+        workflow.add_edge("chat", "strategist")
+        workflow.add_edge("strategist", "voice")
+        workflow.add_edge("voice", "analyst")
+        workflow.add_edge("analyst", END)
+        memory = MemorySaver()
+        return workflow.compile(checkpointer=memory), memory
+
+    def measure(providers: int, referenced: bool, store: BlobStore):
+        graph, memory = build(providers, referenced, store)
+        config = {"configurable": {"thread_id": "bench"}}
+        history = [HumanMessage(content=text(30)) for _ in range(args.chat_turns)]
+        graph.invoke({"messages": history}, config=config)
+        sizes, times = [], []
+        for saved in memory.list(config):
+            started = time.perf_counter()
+            _, data = memory.serde.dumps_typed(saved.checkpoint)
+            times.append((time.perf_counter() - started) * 1000)
+            sizes.append(len(data))
+        return max(sizes), sum(sizes), statistics.mean(times)
+
+    store = BlobStore(os.path.join(tempfile.mkdtemp(prefix="blob_bench"), "blobs.db"))
+    for providers in args.providers:
+        inline = measure(providers, False, store)
+        referenced = measure(providers, True, store)
+        print(f"{providers:>3} providers | largest checkpoint {inline[0] / 1024:8.1f} KB -> {referenced[0] / 1024:5.1f} KB"
+              f" | all checkpoints {inline[1] / 1024:8.1f} KB -> {referenced[1] / 1024:5.1f} KB"
+              f" | serialize per step {inline[2]:6.2f} ms -> {referenced[2]:5.2f} ms", file=sys.stderr)
@@ -0,0 +1,173 @@
+"""
+Call state shared between the API process and the media-gateway workers.
+
+Placing a call (voice_server.initiate_call_with_prompt) and relaying its audio
+(handle_media_stream) can happen in different processes, so the per-call prompt,
+user and dial time are stored by call SID instead of in module globals. Entries
+expire after CALL_STATE_TTL_SECONDS; expired ones are purged as new calls are stored.
+
+CALL_STATE_STORE picks where the state lives:
+
+- "sqlite" (default): a SQLite database in WAL mode (CALL_STATE_DB), which every
+  process on the host can read and write concurrently. Only for a media gateway on
+  the same host as the API, e.g. `media_gateway.py` next to uvicorn in one container;
+- "firestore": the `callState` collection, for a media gateway that runs as its own
+  service. The API refuses the SQLite store when MEDIA_GATEWAY_HOST names another host.
+
+`gateway_worker_for` is the call-affinity rule shared by the TwiML endpoint, which
+puts the worker in the stream URL, and the media gateway's front router.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from typing import Dict, Optional
+
+# Seconds between opportunistic purges of expired entries, per process
+PURGE_INTERVAL_SECONDS = 300
+
+class CallStateStore:
+    def __init__(self, path: str, ttl_seconds: float = 6 * 3600):
+        """
+        Args:
+            path: SQLite database file, shared by every process using the store
+            ttl_seconds: How long a call's state is kept after its last update
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._purged_at = 0.0
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS calls (call_sid TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS calls_updated_at ON calls (updated_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections can't be shared across threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def put(self, call_sid: str, **fields) -> Dict:
+        """Merge `fields` into the call's state and return the result."""
+        connection = self._connect()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT data FROM calls WHERE call_sid = ?", (call_sid,)).fetchone()
+            data = json.loads(row[0]) if row else {}
+            data.update(fields)
+            connection.execute(
+                "INSERT OR REPLACE INTO calls (call_sid, data, updated_at) VALUES (?, ?, ?)",
+                (call_sid, json.dumps(data), time.time()),
+            )
+        self._purge_if_due()
+        return data
+
+    def get(self, call_sid: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT data, updated_at FROM calls WHERE call_sid = ?", (call_sid,)
+        ).fetchone()
+        if row is None or time.time() - row[1] > self.ttl_seconds:
+            return None
+        return json.loads(row[0])
+
+    def delete(self, call_sid: str):
+        self._connect().execute("DELETE FROM calls WHERE call_sid = ?", (call_sid,))
+
+    def purge_expired(self) -> int:
+        self._purged_at = time.monotonic()
+        cursor = self._connect().execute(
+            "DELETE FROM calls WHERE updated_at < ?", (time.time() - self.ttl_seconds,)
+        )
+        return cursor.rowcount
+
+    def _purge_if_due(self):
+        if time.monotonic() - self._purged_at >= PURGE_INTERVAL_SECONDS:
+            self.purge_expired()
+
+class FirestoreCallStateStore:
+    """The call state in Firestore, shared by an API and a media gateway on different hosts."""
+
+    COLLECTION = "callState"
+
+    def __init__(self, ttl_seconds: float = 6 * 3600):
+        self.ttl_seconds = ttl_seconds
+        self._purged_at = 0.0
+
+    def _document(self, call_sid: str):
+        from . import firebase
+        return firebase.get_db().document(f"{self.COLLECTION}/{call_sid}")
+
+    def put(self, call_sid: str, **fields) -> Dict:
+        """Merge `fields` into the call's state and return them; the other stored fields are kept."""
+        self._document(call_sid).set({"data": fields, "updated_at": time.time()}, merge=True)
+        self._purge_if_due()
+        return fields
+
+    def get(self, call_sid: str) -> Optional[Dict]:
+        snapshot = self._document(call_sid).get()
+        if not snapshot.exists:
+            return None
+        stored = snapshot.to_dict()
+        if time.time() - stored.get("updated_at", 0) > self.ttl_seconds:
+            return None
+        return stored.get("data") or {}
+
+    def delete(self, call_sid: str):
+        self._document(call_sid).delete()
+
+    def purge_expired(self) -> int:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        from . import firebase
+
+        self._purged_at = time.monotonic()
+        db = firebase.get_db()
+        expired = db.collection(self.COLLECTION).where(
+            filter=FieldFilter("updated_at", "<", time.time() - self.ttl_seconds)
+        ).stream()
+        deleted = 0
+        batch = db.batch()
+        for snapshot in expired:
+            batch.delete(snapshot.reference)
+            deleted += 1
+            if deleted % 500 == 0:
+                batch.commit()
+                batch = db.batch()
+        if deleted % 500:
+            batch.commit()
+        return deleted
+
+    def _purge_if_due(self):
+        if time.monotonic() - self._purged_at >= PURGE_INTERVAL_SECONDS:
+            try:
+                self.purge_expired()
+            except Exception as e:
+                from .log import get_logger
+                get_logger("call_store").warning("Purging expired call state failed", extra={"error": str(e)})
+
+@lru_cache(maxsize=None)
+def get_call_store():
+    from .config import Config
+    if Config.CALL_STATE_STORE == "firestore":
+        return FirestoreCallStateStore(Config.CALL_STATE_TTL_SECONDS)
+    if Config.CALL_STATE_STORE != "sqlite":
+        raise ValueError(f"Unknown CALL_STATE_STORE: {Config.CALL_STATE_STORE}")
+    if Config.MEDIA_GATEWAY_HOST:
+        # The gateway runs elsewhere and can't read a SQLite file on this host
+        raise ValueError("MEDIA_GATEWAY_HOST is set, so call state must be shared through Firestore: "
+                         "set CALL_STATE_STORE=firestore in the API and the media gateway")
+    return CallStateStore(Config.CALL_STATE_DB, Config.CALL_STATE_TTL_SECONDS)
+
+def gateway_worker_for(call_sid: Optional[str], workers: int) -> int:
+    """The media-gateway worker that relays a call: a stable hash of its SID."""
+    if not call_sid or workers <= 1:
+        return 0
+    return zlib.crc32(call_sid.encode()) % workers
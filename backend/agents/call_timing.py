@@ -0,0 +1,132 @@
+"""
+Per-call latency tracing for the realtime voice bridge.
+
+A CallTimeline records the moments that matter for conversational latency:
+dial, pickup, first AI audio, each user turn (speech stop -> first AI audio) and
+each barge-in (speech start -> truncate/clear sent). The compact summary is stored
+with the call record, and every sample also feeds Prometheus histograms and an
+in-process aggregator for percentiles across recent calls.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from . import metrics
+
+DIAL_TO_PICKUP = "dial_to_pickup"
+PICKUP_TO_FIRST_AUDIO = "pickup_to_first_audio"
+TURN_GAP = "turn_gap"
+INTERRUPTION = "interruption"
+STAGES = (DIAL_TO_PICKUP, PICKUP_TO_FIRST_AUDIO, TURN_GAP, INTERRUPTION)
+
+def _now_ms() -> float:
+    return time.time() * 1000
+
+def percentile(samples: List[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class TimingAggregator:
+    """Keeps the most recent samples per stage and reports their percentiles."""
+
+    def __init__(self, max_samples: int = 1000):
+        self._samples: Dict[str, Deque[float]] = {stage: deque(maxlen=max_samples) for stage in STAGES}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, value_ms: float):
+        with self._lock:
+            self._samples[stage].append(value_ms)
+        metrics.CALL_LATENCY.labels(stage).observe(value_ms / 1000)
+
+    def percentiles(self) -> Dict[str, Dict]:
+        with self._lock:
+            snapshot = {stage: list(samples) for stage, samples in self._samples.items()}
+        return {
+            stage: {
+                "count": len(samples),
+                "p50": percentile(samples, 50),
+                "p90": percentile(samples, 90),
+                "p99": percentile(samples, 99),
+            }
+            for stage, samples in snapshot.items()
+        }
+
+aggregator = TimingAggregator()
+
+class CallTimeline:
+    def __init__(self, call_sid: Optional[str], dialed_at_ms: Optional[float] = None):
+        self.call_sid = call_sid
+        self.dialed_at_ms = dialed_at_ms
+        self.picked_up_at_ms: Optional[float] = None
+        self.first_audio_at_ms: Optional[float] = None
+        self.greeting_ms: Optional[int] = None
+        self.turn_gaps_ms: List[float] = []
+        self.interruptions_ms: List[float] = []
+        self.interruption_detection_ms: List[float] = []
+        self._speech_stopped_at_ms: Optional[float] = None
+        self._speech_started_at_ms: Optional[float] = None
+
+    def _record(self, stage: str, value_ms: float) -> float:
+        value_ms = round(value_ms, 1)
+        aggregator.add(stage, value_ms)
+        return value_ms
+
+    def on_pickup(self):
+        """The media stream started, i.e. the callee answered."""
+        self.picked_up_at_ms = _now_ms()
+        if self.dialed_at_ms is not None:
+            self._record(DIAL_TO_PICKUP, self.picked_up_at_ms - self.dialed_at_ms)
+
+    def on_audio_delta(self):
+        """An audio delta from the model is about to be played to the callee."""
+        now = _now_ms()
+        if self.first_audio_at_ms is None:
+            self.first_audio_at_ms = now
+            if self.picked_up_at_ms is not None:
+                self._record(PICKUP_TO_FIRST_AUDIO, now - self.picked_up_at_ms)
+        if self._speech_stopped_at_ms is not None:
+            self.turn_gaps_ms.append(self._record(TURN_GAP, now - self._speech_stopped_at_ms))
+            self._speech_stopped_at_ms = None
+
+    def on_greeting(self, duration_ms: int):
+        """The pre-rendered greeting was sent; it is the call's first audio."""
+        self.greeting_ms = duration_ms
+        self.on_audio_delta()
+
+    def on_speech_stopped(self):
+        self._speech_stopped_at_ms = _now_ms()
+
+    def on_speech_started(self, detection_lag_ms: Optional[float] = None):
+        """
+        The caller started speaking. `detection_lag_ms` is how far behind the live
+        audio the speech start was reported, when the event carries `audio_start_ms`.
+        """
+        self._speech_started_at_ms = _now_ms()
+        self._speech_stopped_at_ms = None
+        if detection_lag_ms is not None:
+            self.interruption_detection_ms.append(round(detection_lag_ms, 1))
+
+    def on_interruption_handled(self):
+        """The truncate and clear for a barge-in have been sent."""
+        if self._speech_started_at_ms is not None:
+            self.interruptions_ms.append(self._record(INTERRUPTION, _now_ms() - self._speech_started_at_ms))
+            self._speech_started_at_ms = None
+
+    def summary(self) -> Dict:
+        """The compact timeline stored with the call record."""
+        def delta(start, end):
+            return round(end - start, 1) if start is not None and end is not None else None
+
+        return {
+            "dialToPickupMs": delta(self.dialed_at_ms, self.picked_up_at_ms),
+            "pickupToFirstAudioMs": delta(self.picked_up_at_ms, self.first_audio_at_ms),
+            "greetingMs": self.greeting_ms,
+            "turnGapsMs": self.turn_gaps_ms,
+            "interruptionsMs": self.interruptions_ms,
+            "interruptionDetectionMs": self.interruption_detection_ms,
+        }
@@ -0,0 +1,159 @@
+"""
+Cooperative cancellation of jobs, calls and LLM requests.
+
+Each AgentGraph session owns a CancelToken. `/api/chat/new` cancels the old
+session's token before it replaces the session. The token reaches:
+
+- graph steps: every node runs through `run_cancellable`, in the graph's own
+  thread. The node stops at its next check, between LLM tokens or polls, and
+  a result it returns after the cancel is dropped;
+- LLM requests: the CancellationCallback of every chat model (llm.py) fails
+  requests that start after the cancel and stops streams at the next token;
+- the dialer: queued, parked and retrying calls are dropped, and a live call is
+  hung up through Twilio. The status poller of the call returns right away;
+- the session's state sink: it is closed once a status write in flight has
+  finished, and drops the abandoned job's later updates;
+- the websocket relay: hanging up cancels the call's token in `call_token`, which
+  stops the relay of a media stream in the same process. A relay in another
+  gateway process ends when Twilio closes the hung-up stream.
+
+Code reads the token that applies to it with `current_token()`. Like the call
+SID in log records, the token lives in a context variable, which
+`run_cancellable` sets while the node runs. A check that finds the token
+cancelled raises Cancelled. Like asyncio.CancelledError, Cancelled derives from
+BaseException, so the `except Exception` fallbacks of the agents don't swallow
+it. Freed resources are counted in CANCEL_RECLAIMED, together with the time
+since the cancel.
+"""
+
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from . import metrics
+from .log import get_logger
+
+logger = get_logger("cancellation")
+
+class Cancelled(BaseException):
+    """The work was cancelled; derives from BaseException so generic error handling lets it through."""
+
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__(reason)
+        self.reason = reason
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self.reason: Optional[str] = None
+        self.cancelled_at: Optional[float] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "cancelled") -> bool:
+        """Cancel and run the registered callbacks; False if it was already cancelled."""
+        with self._lock:
+            if self._event.is_set():
+                return False
+            self.reason = reason
+            self.cancelled_at = time.monotonic()
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.warning("Cancel callback failed", extra={"error": str(e)})
+        return True
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Sleep up to `timeout`, waking early on cancel; True if cancelled."""
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Call `callback()` on cancel, from the cancelling thread, or right away if already cancelled.
+
+        Returns:
+            A function that unregisters the callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+def reclaimed(token: Optional[CancelToken], resource: str):
+    """Count a resource freed by a cancel, e.g. a worker slot, an LLM request or a live call."""
+    metrics.CANCEL_RECLAIMED.labels(resource).inc()
+    if token is not None and token.cancelled_at is not None:
+        metrics.CANCEL_RECLAIM_LATENCY.labels(resource).observe(time.monotonic() - token.cancelled_at)
+
+_current_token: contextvars.ContextVar = contextvars.ContextVar("cancel_token", default=None)
+
+def current_token() -> Optional[CancelToken]:
+    """The token of the work running in this thread or task, if any."""
+    return _current_token.get()
+
+def bind_token(token: Optional[CancelToken]):
+    """Make `token` the current one for the rest of this task or thread."""
+    _current_token.set(token)
+
+def check_cancelled():
+    """Raise Cancelled if the current token was cancelled."""
+    token = current_token()
+    if token is not None:
+        token.raise_if_cancelled()
+
+def run_cancellable(token: CancelToken, fn: Callable, *args, **kwargs):
+    """
+    Run `fn` in the calling thread with `token` as the current token. It stops at
+    its next check once the token is cancelled; a result that comes back after the
+    cancel is dropped, and either way the caller gets Cancelled.
+    """
+    token.raise_if_cancelled()
+    context = contextvars.copy_context()
+    context.run(bind_token, token)
+    try:
+        result = context.run(fn, *args, **kwargs)
+    except Cancelled:
+        reclaimed(token, "graph_step")
+        raise
+    if token.cancelled:
+        reclaimed(token, "graph_step")
+        raise Cancelled(token.reason)
+    return result
+
+# Tokens of the media streams relayed by this process, by call SID
+_call_tokens: Dict[str, CancelToken] = {}
+_call_tokens_lock = threading.Lock()
+
+def call_token(call_sid: str) -> CancelToken:
+    """The token of a call's media stream, created when the relay starts."""
+    with _call_tokens_lock:
+        return _call_tokens.setdefault(call_sid, CancelToken())
+
+def release_call(call_sid: str):
+    with _call_tokens_lock:
+        _call_tokens.pop(call_sid, None)
+
+def cancel_call(call_sid: str, reason: str = "hung_up") -> bool:
+    """Stop the relay of a call's media stream, if this process is relaying it."""
+    with _call_tokens_lock:
+        token = _call_tokens.get(call_sid)
+    return token is not None and token.cancel(reason)
@@ -0,0 +1,490 @@
+"""
+Record and replay of the pipeline's external I/O, for offline benchmarks.
+
+A run against live OpenAI, Twilio and Firebase is noisy and costs money. With
+CASSETTE_MODE=record, every exchange with those services is appended to the
+cassette at CASSETTE_PATH:
+
+- LLM calls: each chain's chat model (`chat_model`) is a CassetteChatOpenAI.
+  Invocations store the result and streams store every chunk with its offset;
+- Twilio REST requests, through CassetteHttpClient;
+- Realtime sessions: the events the model sent, with their offset from connect;
+- sync Firestore reads, writes and watches. The client from `firebase.get_db` is
+  wrapped, so the graph's writes, the quote cache and the call watch are covered.
+
+With CASSETTE_MODE=replay the same calls are answered from the cassette and
+nothing goes over the network. Each answer waits its recorded duration times
+CASSETTE_LATENCY_SCALE: 1 keeps the original timing and 0 replays as fast as the
+CPU allows. Async Firestore writes go to an InMemoryAsyncFirestore.
+
+A request is matched by kind (llm, twilio, realtime, firestore), group (the chain,
+the REST route, the Firestore operation) and a hash of its content. Requests that
+differ from the recording, e.g. because a prompt carries a timestamp, get the next
+unplayed record of their group instead. Polls that outlast the recording get the
+last answer again.
+
+The file is gzip-compressed JSON lines, one record per exchange. Records are
+appended in batches as the run goes and at exit.
+
+    python -m agents.cassette_cli record --message "..." --out run.jsonl.gz
+    python -m agents.cassette_cli replay run.jsonl.gz --runs 1000 --latency-scale 0 --profile
+
+run an AgentGraph job against the live services, and then offline from the cassette.
+Run both from the backend directory.
+"""
+
+import asyncio
+import atexit
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+
+from .log import get_logger
+
+logger = get_logger("cassette")
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+
+# Twilio resource SIDs, e.g. CA followed by 32 hex digits
+SID_PATTERN = re.compile(r"\b[A-Z]{2}[0-9a-f]{32}\b")
+
+class CassetteMiss(LookupError):
+    """Replay asked for an exchange the cassette doesn't have."""
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+
+def request_key(*parts: Any) -> str:
+    return hashlib.sha256(_dumps(parts).encode("utf-8")).hexdigest()[:24]
+
+class Cassette:
+    def __init__(self, path: str, mode: str, latency_scale: float = 1.0, flush_every: int = 50):
+        """
+        Args:
+            path: The gzip JSON lines file, appended to when recording
+            mode: RECORD or REPLAY
+            latency_scale: Factor on the recorded durations in replay, 0 for no waiting
+            flush_every: Records kept in memory before they are appended to the file
+        """
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.flush_every = flush_every
+        self.records: List[Dict] = []
+        self._pending: List[Dict] = []
+        self._lock = threading.Lock()
+        if mode == REPLAY:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                self.records = [json.loads(line) for line in f if line.strip()]
+            self.rewind()
+        else:
+            # A new recording replaces the old one; save() only appends
+            open(path, "wb").close()
+            atexit.register(self.save)
+
+    def rewind(self):
+        """Start replaying from the first record again, e.g. before the next run."""
+        with self._lock:
+            self._by_key: Dict[Tuple[str, str, str], Deque[int]] = defaultdict(deque)
+            self._by_group: Dict[Tuple[str, str], Deque[int]] = defaultdict(deque)
+            for index, record in enumerate(self.records):
+                self._by_key[(record["kind"], record["group"], record["key"])].append(index)
+                self._by_group[(record["kind"], record["group"])].append(index)
+            self._played = set()
+            self._last: Dict[Tuple[str, str], int] = {}
+            self.stats = {"exact": 0, "order": 0, "repeat": 0, "miss": 0}
+
+    def record(self, kind: str, group: str, key: str, response: Any, ms: float, request: Any = None):
+        record = {"kind": kind, "group": group, "key": key, "ms": round(ms, 3), "response": response}
+        if request is not None:
+            record["request"] = request
+        with self._lock:
+            self.records.append(record)
+            self._pending.append(record)
+            flush = len(self._pending) >= self.flush_every
+        if flush:
+            self.save()
+
+    def save(self):
+        """Append the records not yet written, as one more gzip member of the file."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                for record in pending:
+                    f.write(_dumps(record) + "\n")
+
+    def _take(self, queue: Deque[int]) -> Optional[int]:
+        while queue:
+            index = queue.popleft()
+            if index not in self._played:
+                return index
+        return None
+
+    def play(self, kind: str, group: str, key: str, repeat: bool = False) -> Dict:
+        """
+        The recorded exchange for a request, without waiting.
+
+        Args:
+            repeat: Answer with the group's last record once it has none left, for polls
+        """
+        with self._lock:
+            index = self._take(self._by_key[(kind, group, key)])
+            result = "exact"
+            if index is None:
+                index = self._take(self._by_group[(kind, group)])
+                result = "order"
+            if index is None and repeat and (kind, group) in self._last:
+                index = self._last[(kind, group)]
+                result = "repeat"
+            if index is None:
+                self.stats["miss"] += 1
+                raise CassetteMiss(f"No recorded {kind} exchange left for {group}")
+            self._played.add(index)
+            self._last[(kind, group)] = index
+            self.stats[result] += 1
+            return self.records[index]
+
+    def delay(self, ms: float) -> float:
+        """Seconds to wait in replay for an exchange that took `ms`."""
+        return max(0.0, ms * self.latency_scale / 1000)
+
+    def replay(self, kind: str, group: str, key: str, repeat: bool = False) -> Any:
+        record = self.play(kind, group, key, repeat)
+        if self.latency_scale > 0:
+            time.sleep(self.delay(record["ms"]))
+        return record["response"]
+
+    async def replay_async(self, kind: str, group: str, key: str, repeat: bool = False) -> Any:
+        record = self.play(kind, group, key, repeat)
+        if self.latency_scale > 0:
+            await asyncio.sleep(self.delay(record["ms"]))
+        return record["response"]
+
+_cassette: Optional[Cassette] = None
+_configured = False
+
+def set_cassette(cassette: Optional[Cassette]):
+    """Use this cassette instead of the one from the config, or none."""
+    global _cassette, _configured
+    _cassette = cassette
+    _configured = True
+
+def get_cassette() -> Optional[Cassette]:
+    """The process-wide cassette, or None when CASSETTE_MODE is off."""
+    global _cassette, _configured
+    if not _configured:
+        from .config import Config
+        if Config.CASSETTE_MODE != OFF:
+            _cassette = Cassette(Config.CASSETTE_PATH, Config.CASSETTE_MODE, Config.CASSETTE_LATENCY_SCALE)
+            logger.info("Cassette in use", extra={"mode": _cassette.mode, "path": _cassette.path})
+        _configured = True
+    return _cassette
+
+# LLM
+
+def _dump_result(result: ChatResult) -> Dict:
+    return {
+        "generations": [{"message": message_to_dict(generation.message), "info": generation.generation_info}
+                        for generation in result.generations],
+        "llm_output": result.llm_output,
+    }
+
+def _load_result(data: Dict) -> ChatResult:
+    messages = messages_from_dict([generation["message"] for generation in data["generations"]])
+    return ChatResult(
+        generations=[ChatGeneration(message=message, generation_info=generation["info"])
+                     for message, generation in zip(messages, data["generations"])],
+        llm_output=data["llm_output"],
+    )
+
+def _load_chunk(data: Dict) -> ChatGenerationChunk:
+    return ChatGenerationChunk(message=messages_from_dict([data["message"]])[0], generation_info=data["info"])
+
+class CassetteChatOpenAI(ChatOpenAI):
+    """ChatOpenAI that records its calls to the cassette, or answers them from it."""
+
+    cassette_chain: str = "llm"
+
+    def _key(self, messages, stop, kwargs) -> str:
+        return request_key(self.model_name, [message_to_dict(message) for message in messages], stop, kwargs)
+
+    def _request(self, messages) -> Dict:
+        return {"model": self.model_name, "messages": len(messages)}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        cassette = get_cassette()
+        key = self._key(messages, stop, kwargs)
+        if cassette.mode == REPLAY:
+            return _load_result(cassette.replay("llm", self.cassette_chain, key))
+        started = time.perf_counter()
+        result = super()._generate(messages, stop, run_manager, **kwargs)
+        cassette.record("llm", self.cassette_chain, key, _dump_result(result),
+                        (time.perf_counter() - started) * 1000, self._request(messages))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        cassette = get_cassette()
+        key = self._key(messages, stop, kwargs)
+        if cassette.mode == REPLAY:
+            return _load_result(await cassette.replay_async("llm", self.cassette_chain, key))
+        started = time.perf_counter()
+        result = await super()._agenerate(messages, stop, run_manager, **kwargs)
+        cassette.record("llm", self.cassette_chain, key, _dump_result(result),
+                        (time.perf_counter() - started) * 1000, self._request(messages))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        cassette = get_cassette()
+        key = self._key(messages, stop, kwargs)
+        if cassette.mode == REPLAY:
+            record = cassette.play("llm", self.cassette_chain, key)
+            started = time.perf_counter()
+            for offset_ms, data in record["response"]["chunks"]:
+                if cassette.latency_scale > 0:
+                    time.sleep(max(0.0, started + cassette.delay(offset_ms) - time.perf_counter()))
+                chunk = _load_chunk(data)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+                yield chunk
+            return
+
+        started = time.perf_counter()
+        chunks = []
+        for chunk in super()._stream(messages, stop, run_manager, **kwargs):
+            chunks.append([(time.perf_counter() - started) * 1000,
+                           {"message": message_to_dict(chunk.message), "info": chunk.generation_info}])
+            yield chunk
+        cassette.record("llm", self.cassette_chain, key, {"chunks": chunks},
+                        (time.perf_counter() - started) * 1000, self._request(messages))
+
+# Twilio
+
+def twilio_http_client():
+    """A Twilio HTTP client that records the REST requests to the cassette, or answers them from it."""
+    from twilio.http.http_client import TwilioHttpClient
+    from twilio.http.response import Response
+
+    class CassetteHttpClient(TwilioHttpClient):
+        def request(self, method, url, params=None, data=None, headers=None, auth=None, timeout=None,
+                    allow_redirects=False):
+            cassette = get_cassette()
+            path = urlsplit(url).path
+            group = f"{method.upper()} {SID_PATTERN.sub('{sid}', path)}"
+            key = request_key(method.upper(), path, params, data)
+            if cassette.mode == REPLAY:
+                response = cassette.replay("twilio", group, key, repeat=method.upper() == "GET")
+                return Response(response["status"], response["text"], response["headers"])
+            started = time.perf_counter()
+            response = super().request(method, url, params, data, headers, auth, timeout, allow_redirects)
+            cassette.record("twilio", group, key,
+                            {"status": response.status_code, "text": response.text, "headers": dict(response.headers or {})},
+                            (time.perf_counter() - started) * 1000)
+            return response
+
+    return CassetteHttpClient()
+
+# Realtime
+
+class RecordingRealtime:
+    """A Realtime websocket that keeps the events the model sent, with their offset from connect."""
+
+    def __init__(self, ws, cassette: Cassette, connect_ms: float):
+        self._ws = ws
+        self._cassette = cassette
+        self._connect_ms = connect_ms
+        self._started = time.perf_counter()
+        self._events: List[List] = []
+        self._saved = False
+
+    @property
+    def open(self) -> bool:
+        return self._ws.open
+
+    async def send(self, message):
+        await self._ws.send(message)
+
+    def __aiter__(self):
+        return self._receive()
+
+    async def _receive(self):
+        try:
+            async for message in self._ws:
+                self._events.append([(time.perf_counter() - self._started) * 1000, message])
+                yield message
+        finally:
+            self._save()
+
+    async def close(self):
+        await self._ws.close()
+        self._save()
+
+    def _save(self):
+        if not self._saved:
+            self._saved = True
+            self._cassette.record("realtime", "session", "session", {"events": self._events}, self._connect_ms)
+
+class ReplayRealtime:
+    """A Realtime websocket that sends the recorded events at their offsets and ignores what it is sent."""
+
+    def __init__(self, events: List[List], cassette: Cassette):
+        self._events = events
+        self._cassette = cassette
+        self.open = True
+
+    async def send(self, message):
+        pass
+
+    def __aiter__(self):
+        return self._receive()
+
+    async def _receive(self):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for offset_ms, message in self._events:
+            if self._cassette.latency_scale > 0:
+                await asyncio.sleep(max(0.0, started + self._cassette.delay(offset_ms) - loop.time()))
+            if not self.open:
+                return
+            yield message
+        self.open = False
+
+    async def close(self):
+        self.open = False
+
+async def connect_realtime(connect: Callable):
+    """
+    Open the Realtime websocket with `connect()`, or through the cassette when one is in use.
+    Sessions are replayed in the order they were recorded.
+    """
+    cassette = get_cassette()
+    if cassette is None:
+        return await connect()
+    if cassette.mode == REPLAY:
+        return ReplayRealtime((await cassette.replay_async("realtime", "session", "session"))["events"], cassette)
+    started = time.perf_counter()
+    ws = await connect()
+    return RecordingRealtime(ws, cassette, (time.perf_counter() - started) * 1000)
+
+# Firestore
+
+class _Snapshot:
+    def __init__(self, data: Optional[Dict]):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return json.loads(_dumps(self._data)) if self._data is not None else None
+
+class _Watch:
+    def __init__(self, unsubscribe: Callable):
+        self._unsubscribe = unsubscribe
+
+    def unsubscribe(self):
+        self._unsubscribe()
+
+class _CassetteCollection:
+    def __init__(self, client: "CassetteFirestore", path: str):
+        self._client = client
+        self.path = path
+
+    def document(self, document_id: str) -> "_CassetteDocument":
+        return _CassetteDocument(self._client, f"{self.path}/{document_id}")
+
+class _CassetteDocument:
+    def __init__(self, client: "CassetteFirestore", path: str):
+        self._client = client
+        self.path = path
+
+    def collection(self, name: str) -> _CassetteCollection:
+        return _CassetteCollection(self._client, f"{self.path}/{name}")
+
+    def _real(self):
+        return self._client._client.document(self.path)
+
+    def get(self):
+        cassette = self._client._cassette
+        if cassette.mode == REPLAY:
+            return _Snapshot(cassette.replay("firestore", "get", self.path, repeat=True))
+        started = time.perf_counter()
+        snapshot = self._real().get()
+        cassette.record("firestore", "get", self.path, snapshot.to_dict() if snapshot.exists else None,
+                        (time.perf_counter() - started) * 1000)
+        return snapshot
+
+    def set(self, data: Dict, merge: bool = False):
+        cassette = self._client._cassette
+        if cassette.mode == REPLAY:
+            cassette.replay("firestore", "set", self.path)
+            return
+        started = time.perf_counter()
+        result = self._real().set(data, merge=merge)
+        cassette.record("firestore", "set", self.path, None, (time.perf_counter() - started) * 1000)
+        return result
+
+    def on_snapshot(self, callback: Callable):
+        """Only the snapshots' data is kept, with their offset from the start of the watch."""
+        cassette = self._client._cassette
+        if cassette.mode == REPLAY:
+            record = cassette.play("firestore", "watch", self.path)
+            timers = []
+            for offset_ms, data in record["response"]["events"]:
+                timer = threading.Timer(cassette.delay(offset_ms), callback, ([_Snapshot(data)], [], None))
+                timer.daemon = True
+                timer.start()
+                timers.append(timer)
+            return _Watch(lambda: [timer.cancel() for timer in timers])
+
+        started = time.perf_counter()
+        events = []
+
+        def on_snapshot(snapshots, changes, read_time):
+            for snapshot in snapshots:
+                events.append([(time.perf_counter() - started) * 1000, snapshot.to_dict() if snapshot.exists else None])
+            callback(snapshots, changes, read_time)
+
+        watch = self._real().on_snapshot(on_snapshot)
+
+        def unsubscribe():
+            watch.unsubscribe()
+            cassette.record("firestore", "watch", self.path, {"events": events}, 0.0)
+
+        return _Watch(unsubscribe)
+
+class CassetteFirestore:
+    """
+    The sync Firestore client as seen through the cassette: document reads, writes
+    and watches are recorded or replayed. Anything else goes to the real client
+    when recording and isn't available in replay.
+    """
+
+    def __init__(self, cassette: Cassette, client=None):
+        self._cassette = cassette
+        self._client = client
+
+    def collection(self, name: str) -> _CassetteCollection:
+        return _CassetteCollection(self, name)
+
+    def document(self, path: str) -> _CassetteDocument:
+        return _CassetteDocument(self, path)
+
+    def __getattr__(self, name):
+        if self._client is None:
+            raise CassetteMiss(f"Firestore {name} isn't recorded")
+        return getattr(self._client, name)
+
@@ -0,0 +1,97 @@
+"""
+Record an AgentGraph job's I/O to a cassette, or replay it offline:
+
+    python -m agents.cassette_cli record --message "..." --out run.jsonl.gz
+    python -m agents.cassette_cli replay run.jsonl.gz --runs 1000 --latency-scale 0 --profile
+
+Run both from the backend directory. The CLI lives apart from `agents.cassette` so
+that the cassette it installs is the one the agents read, not a `__main__` copy.
+"""
+
+import argparse
+import cProfile
+import os
+import pstats
+import statistics
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+from .cassette import RECORD, REPLAY, Cassette, set_cassette
+
+def main():
+    parser = argparse.ArgumentParser(description="Record an AgentGraph job's I/O to a cassette, or replay it offline")
+    commands = parser.add_subparsers(dest="command", required=True)
+    record_parser = commands.add_parser("record", help="Run a job against the live services and record it")
+    record_parser.add_argument("--message", action="append", required=True, help="A user chat message, repeatable")
+    record_parser.add_argument("--user", default="cassette-user")
+    record_parser.add_argument("--category", default="movers")
+    record_parser.add_argument("--out", default="cassette.jsonl.gz")
+    replay_parser = commands.add_parser("replay", help="Replay a recorded job")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--runs", type=int, default=1)
+    replay_parser.add_argument("--latency-scale", type=float, default=0.0)
+    replay_parser.add_argument("--profile", action="store_true", help="Print the CPU hot spots of the replays")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        cassette = Cassette(args.out, RECORD)
+        messages, user_id, category = args.message, args.user, args.category
+    else:
+        cassette = Cassette(args.path, REPLAY, args.latency_scale)
+        job = next(record for record in cassette.records if record["kind"] == "input")["response"]
+        messages, user_id, category = job["messages"], job["user_id"], job["category"]
+        # The OpenAI and Twilio clients want credentials even when nothing is sent
+        os.environ.setdefault("OPENAI_API_KEY", "replay")
+        os.environ.setdefault("TWILIO_ACCOUNT_SID", "AC" + "0" * 32)
+        os.environ.setdefault("TWILIO_AUTH_TOKEN", "replay")
+    set_cassette(cassette)
+
+    from langchain_core.messages import HumanMessage
+    from .agent_graph import AgentGraph
+
+    def run_job():
+        agent_graph = AgentGraph(user_id, category)
+        config = {"configurable": {"thread_id": str(uuid.uuid4())}}
+        for message in messages:
+            agent_graph.graph.invoke({"messages": [HumanMessage(content=message)]}, config=config)
+
+    if args.command == "record":
+        cassette.record("input", "job", "job", {"messages": messages, "user_id": user_id, "category": category}, 0.0)
+        started = time.perf_counter()
+        run_job()
+        cassette.save()
+        kinds = defaultdict(int)
+        for record in cassette.records:
+            kinds[record["kind"]] += 1
+        print(f"Recorded {dict(kinds)} in {time.perf_counter() - started:.1f} s to {args.out} "
+              f"({os.path.getsize(args.out) / 1024:.0f} KiB)", file=sys.stderr)
+        sys.exit(0)
+
+    recorded_ms = sum(record["ms"] for record in cassette.records)
+    profiler = cProfile.Profile() if args.profile else None
+    durations = []
+    misses = 0
+    for _ in range(args.runs):
+        cassette.rewind()
+        started = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        run_job()
+        if profiler:
+            profiler.disable()
+        durations.append((time.perf_counter() - started) * 1000)
+        misses += cassette.stats["miss"]
+
+    durations.sort()
+    print(f"{args.runs} replays of {len(cassette.records)} records ({recorded_ms / 1000:.1f} s of recorded I/O) "
+          f"at latency scale {args.latency_scale}", file=sys.stderr)
+    print(f"run ms: mean {statistics.mean(durations):.1f} | p50 {durations[len(durations) // 2]:.1f} "
+          f"| p95 {durations[int(len(durations) * 0.95)]:.1f} | max {durations[-1]:.1f}", file=sys.stderr)
+    print(f"matches in the last run: {cassette.stats}, misses over all runs: {misses}", file=sys.stderr)
+    if profiler:
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(30)
+
+if __name__ == "__main__":
+    main()
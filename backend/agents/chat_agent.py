@@ -1,39 +1,22 @@
-
-import os
-from typing import List, Dict, Optional, TypedDict, Annotated, Tuple
-from datetime import datetime
-import operator
-import json
-from pydantic import BaseModel
-
-from dotenv import load_dotenv
-from openai import OpenAI
-from pydantic import BaseModel
-from langgraph.graph import StateGraph, END
-from langgraph.graph.message import add_messages
-from graphviz import Digraph
-from contextlib import contextmanager
-from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.checkpoint.memory import MemorySaver
-from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
-from itertools import chain
-
-from typing import Dict
-from langchain_openai import ChatOpenAI
+from typing import Dict, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableConfig
-from firebase_admin.firestore import firestore
+from langchain_core.messages import AIMessage, HumanMessage
 
 from .config import Config
+from .llm import chat_model
 from .state_models import CustomerInfo
 from . import firebase
-from ..prompts.prompt_manager import prompt_manager
+from .state_sink import UserStateSink, sink_for
+from prompts.prompt_manager import prompt_manager
 
 class ChatAgent:
-    def __init__(self, user_id: str, service_category: str = 'movers', model: str = Config.CHAT_MODEL):
-        self.llm = ChatOpenAI(model=model)
+    def __init__(self, user_id: str, service_category: str = 'movers', model: str = Config.CHAT_MODEL,
+                 sink: Optional[UserStateSink] = None):
+        self.llm = chat_model(model, "chat")
         self.user_id = user_id
         self.service_category = service_category
+        self.sink = sink or sink_for(user_id)
         
         # Load service-specific prompt
         chat_prompt = prompt_manager.get_prompt(service_category, 'chat_system')
@@ -53,14 +36,14 @@ class ChatAgent:
 
         message_list = list(map(lambda x: { "role": "user" if isinstance(x, HumanMessage) else "assistant", "content": x.content }, messages))
         response_message = { "role": "assistant", "content": response.content if not response.tool_calls else "We have everything we need to get started on your quotes" }
-        firebase.update_data(self.user_id, { "messages": message_list + [response_message] })
+        self.sink.update({ "messages": message_list + [response_message] })
 
         customer_info = None
         if isinstance(response, AIMessage) and response.tool_calls:
             # if "DONE" in response.content:
             print("\n Information collected \n")
             customer_info = self._extract_customer_info(response.tool_calls[0]["args"])
-            firebase.update_status(self.user_id, firebase.AppStatus.STRATEGIZING)
+            self.sink.update({ "status": firebase.AppStatus.STRATEGIZING })
 
         # Update state with response
         return {
@@ -86,6 +69,6 @@ class ChatAgent:
         prompt = ChatPromptTemplate.from_messages([("human", extraction_prompt)])
         chain = prompt | self.llm.with_structured_output(CustomerInfo)
         customer_info: CustomerInfo = chain.invoke({"request": content})
-        firebase.update_data(self.user_id, { "customerInfo": customer_info.model_dump() })
+        self.sink.update({ "customerInfo": customer_info.model_dump() })
         return customer_info
 
@@ -10,6 +10,79 @@ class Config:
     MAX_CALL_TURNS = 5
     RECORDING_DURATION = 10
 
+    # Media relay: audio frames queued per direction before MEDIA_AUDIO_POLICY
+    # (merge, drop_oldest or drop_newest) applies to a lagging peer
+    MEDIA_QUEUE_MAX_FRAMES = int(os.getenv('MEDIA_QUEUE_MAX_FRAMES', 50))
+    MEDIA_AUDIO_POLICY = os.getenv('MEDIA_AUDIO_POLICY', 'merge')
+    # Outbound audio deltas are merged into frames of this duration (20-100 ms)
+    MEDIA_OUTBOUND_FRAME_MS = int(os.getenv('MEDIA_OUTBOUND_FRAME_MS', 60))
+
+    # Local voice-activity detection on the callee's audio: barge-in before the server's
+    # speech_started, and silence frames forwarded, thinned or dropped outside speech.
+    # The hangover must exceed the server VAD's 500 ms silence duration
+    MEDIA_VAD = os.getenv('MEDIA_VAD', 'false').lower() == 'true'
+    MEDIA_VAD_BARGE_IN = os.getenv('MEDIA_VAD_BARGE_IN', 'true').lower() == 'true'
+    MEDIA_VAD_SILENCE = os.getenv('MEDIA_VAD_SILENCE', 'thin')
+    MEDIA_VAD_THIN_EVERY = int(os.getenv('MEDIA_VAD_THIN_EVERY', 5))
+    MEDIA_VAD_HANGOVER_MS = int(os.getenv('MEDIA_VAD_HANGOVER_MS', 800))
+
+    # Realtime endpoint, overridable to point the relay at a local fake
+    OPENAI_REALTIME_URL = os.getenv('OPENAI_REALTIME_URL', 'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01')
+
+    # Media gateway: worker processes behind the front router, and where call state is shared:
+    # "sqlite" for a gateway on the API's host, "firestore" for a gateway that runs as its own service
+    MEDIA_GATEWAY_WORKERS = int(os.getenv('MEDIA_GATEWAY_WORKERS', 1))
+    MEDIA_GATEWAY_HOST = os.getenv('MEDIA_GATEWAY_HOST')
+    CALL_STATE_STORE = os.getenv('CALL_STATE_STORE', 'sqlite').lower()
+    CALL_STATE_DB = os.getenv('CALL_STATE_DB', '/tmp/servicesaver_calls.db')
+    CALL_STATE_TTL_SECONDS = int(os.getenv('CALL_STATE_TTL_SECONDS', 6 * 3600))
+
+    # Outbound dialer: Twilio call creation rate, concurrent calls per provider number,
+    # and retries of busy / unanswered calls with exponential backoff per number
+    DIALER_CALLS_PER_SECOND = float(os.getenv('DIALER_CALLS_PER_SECOND', 1))
+    DIALER_BURST = int(os.getenv('DIALER_BURST', 1))
+    DIALER_MAX_CALLS_PER_NUMBER = int(os.getenv('DIALER_MAX_CALLS_PER_NUMBER', 1))
+    DIALER_MAX_ATTEMPTS = int(os.getenv('DIALER_MAX_ATTEMPTS', 3))
+    DIALER_BACKOFF_SECONDS = float(os.getenv('DIALER_BACKOFF_SECONDS', 60))
+    DIALER_BACKOFF_MAX_SECONDS = float(os.getenv('DIALER_BACKOFF_MAX_SECONDS', 900))
+    # Twilio REST endpoint, overridable to point the dialer at a local fake
+    TWILIO_API_BASE_URL = os.getenv('TWILIO_API_BASE_URL')
+
+    # Quotes shared across users' comparable jobs, off unless enabled: how long they
+    # are used, and the confidence (freshness, number of calls, agreement) needed to skip a call
+    QUOTE_CACHE = os.getenv('QUOTE_CACHE', 'false').lower() == 'true'
+    QUOTE_CACHE_TTL_HOURS = float(os.getenv('QUOTE_CACHE_TTL_HOURS', 72))
+    QUOTE_CACHE_MIN_CONFIDENCE = float(os.getenv('QUOTE_CACHE_MIN_CONFIDENCE', 0.6))
+
+    # Opening lines rendered offline (python -m agents.greeting_cache), played at pickup
+    GREETING_CACHE = os.getenv('GREETING_CACHE', 'true').lower() == 'true'
+    GREETING_CACHE_DIR = os.getenv('GREETING_CACHE_DIR', '/tmp/servicesaver_greetings')
+
+    # Simulated provider calls (USE_SIMULATION_MODE): "llm" role-plays the provider, "template"
+    # is offline and deterministic for load tests, seeded, with an optional artificial call duration
+    SIMULATOR_BACKEND = os.getenv('SIMULATOR_BACKEND', 'llm')
+    SIMULATOR_SEED = int(os.getenv('SIMULATOR_SEED', 0))
+    SIMULATOR_LATENCY_MS = float(os.getenv('SIMULATOR_LATENCY_MS', 0))
+
+    # Record/replay of the LLM, Twilio, Realtime and Firestore I/O (off, record or replay) for
+    # offline benchmarks; replayed exchanges wait their recorded duration times the latency scale
+    CASSETTE_MODE = os.getenv('CASSETTE_MODE', 'off').lower()
+    CASSETTE_PATH = os.getenv('CASSETTE_PATH', '/tmp/servicesaver_cassette.jsonl.gz')
+    CASSETTE_LATENCY_SCALE = float(os.getenv('CASSETTE_LATENCY_SCALE', 1.0))
+
+    # Large graph state values (strategy, providers, transcripts) stored outside the checkpoints
+    BLOB_STORE_DB = os.getenv('BLOB_STORE_DB', '/tmp/servicesaver_blobs.db')
+    BLOB_STORE_TTL_SECONDS = int(os.getenv('BLOB_STORE_TTL_SECONDS', 24 * 3600))
+
+    # Call transcripts: segments per chunk document, and whether full chunks are compressed
+    TRANSCRIPT_CHUNK_SEGMENTS = int(os.getenv('TRANSCRIPT_CHUNK_SEGMENTS', 50))
+    TRANSCRIPT_COMPRESS = os.getenv('TRANSCRIPT_COMPRESS', 'true').lower() == 'true'
+
+    # Live call summaries: fold new turns once at least this many arrived and this long after the last fold
+    LIVE_SUMMARY = os.getenv('LIVE_SUMMARY', 'true').lower() == 'true'
+    LIVE_SUMMARY_MIN_SEGMENTS = int(os.getenv('LIVE_SUMMARY_MIN_SEGMENTS', 2))
+    LIVE_SUMMARY_INTERVAL_SECONDS = float(os.getenv('LIVE_SUMMARY_INTERVAL_SECONDS', 8))
+
     # LLM Models
     CHAT_MODEL = "gpt-4o-mini"
     VOICE_MODEL = "gpt-4o-mini"
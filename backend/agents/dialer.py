@@ -0,0 +1,309 @@
+"""
+Outbound dialer shared by every job in the process.
+
+Jobs don't call Twilio directly. They submit calls to the Dialer, which:
+
+- orders waiting calls in a priority queue. The voice agent passes its job's start
+  time, so calls of older jobs go first.
+- paces call creation with a token bucket, DIALER_CALLS_PER_SECOND with bursts of
+  DIALER_BURST, to stay under Twilio's calls-per-second limit. A 429 from Twilio
+  empties the bucket and requeues the call without counting an attempt.
+- holds at most DIALER_MAX_CALLS_PER_NUMBER live calls per provider number.
+  Calls to a number that is at its cap are parked until one of its calls ends, so
+  they don't block calls to other numbers.
+- retries busy and unanswered calls up to DIALER_MAX_ATTEMPTS. Each retry waits
+  DIALER_BACKOFF_SECONDS, doubling per consecutive miss of that number up to
+  DIALER_BACKOFF_MAX_SECONDS, with jitter.
+
+A call's slot is held until its outcome is known, which `wait_for_end` reports.
+A call submitted with a cancel token fails with Cancelled as soon as the token is
+cancelled. A queued, parked or backing-off call is then dropped, and a live call is
+hung up through `hang_up`.
+The Dialer is asyncio-based. BackgroundDialer runs it on its own event loop
+thread for the synchronous graph nodes.
+
+Run `python -m tests.dialer_harness` to exercise it against a local fake Twilio
+REST server.
+"""
+
+import asyncio
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from . import metrics
+from .cancellation import Cancelled, CancelToken, bind_token, reclaimed
+from .config import Config
+from .log import get_logger
+
+logger = get_logger("dialer")
+
+RETRY_STATUSES = {"busy", "no-answer"}
+RATE_LIMITED = "rate_limited"
+
+def is_rate_limited(error: Exception) -> bool:
+    """Twilio rejected the request for exceeding a rate limit (TwilioRestException status 429)."""
+    return getattr(error, "status", None) == 429
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: Tokens added per second
+            burst: Most tokens the bucket holds
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> float:
+        """Wait for a token and return how long that took, in seconds."""
+        started = time.monotonic()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return time.monotonic() - started
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def drain(self):
+        """Drop the available tokens, e.g. after the provider reported a rate limit."""
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+
+@dataclass(order=True)
+class DialRequest:
+    priority: float
+    seq: int
+    to_number: str = field(compare=False)
+    call_kwargs: Dict = field(compare=False, default_factory=dict)
+    future: Optional[asyncio.Future] = field(compare=False, default=None)
+    attempts: int = field(compare=False, default=0)
+    submitted_at: float = field(compare=False, default_factory=time.monotonic)
+    cancel_token: Optional[CancelToken] = field(compare=False, default=None)
+    # SID of the attempt's call while it is live, to hang up on cancel
+    call_sid: Optional[str] = field(compare=False, default=None)
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_token is not None and self.cancel_token.cancelled
+
+@dataclass
+class DialResult:
+    call_sid: Optional[str]
+    status: str
+    attempts: int
+    # From submitting the call to placing its last attempt: queueing, pacing and backoff
+    wait_seconds: float = 0.0
+    error: Optional[str] = None
+
+class Dialer:
+    def __init__(self, place_call: Callable[..., Awaitable[str]], wait_for_end: Callable[[str], Awaitable[str]],
+                 calls_per_second: float = Config.DIALER_CALLS_PER_SECOND, burst: int = Config.DIALER_BURST,
+                 max_calls_per_number: int = Config.DIALER_MAX_CALLS_PER_NUMBER,
+                 max_attempts: int = Config.DIALER_MAX_ATTEMPTS, backoff_seconds: float = Config.DIALER_BACKOFF_SECONDS,
+                 backoff_max_seconds: float = Config.DIALER_BACKOFF_MAX_SECONDS, rng: Optional[random.Random] = None,
+                 hang_up: Optional[Callable[[str], Awaitable[None]]] = None):
+        """
+        Args:
+            place_call: Places a call, `await place_call(to_number, **call_kwargs)`, and returns its SID
+            wait_for_end: Waits for a placed call to end and returns its final Twilio status
+            hang_up: Ends a live call of a cancelled request, `await hang_up(call_sid)`
+        """
+        self.place_call = place_call
+        self.wait_for_end = wait_for_end
+        self.hang_up = hang_up
+        self.pacer = TokenBucket(calls_per_second, burst)
+        self.max_calls_per_number = max_calls_per_number
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.rng = rng or random.Random()
+
+        self.queue: "asyncio.PriorityQueue[DialRequest]" = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._active: Dict[str, int] = defaultdict(int)
+        self._parked: Dict[str, Deque[DialRequest]] = defaultdict(deque)
+        self._misses: Dict[str, int] = defaultdict(int)
+        self._waiting = 0
+        self._tasks = set()
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+        self.outcomes: Dict[str, int] = defaultdict(int)
+
+    async def dial(self, to_number: str, priority: Optional[float] = None, cancel_token: Optional[CancelToken] = None,
+                   **call_kwargs) -> DialResult:
+        """Submit a call and wait for its final outcome, after any retries, or raise Cancelled."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        request = DialRequest(
+            time.time() if priority is None else priority, next(self._seq), to_number, call_kwargs, future,
+            cancel_token=cancel_token,
+        )
+        self._set_waiting(+1)
+        self.queue.put_nowait(request)
+        unregister = lambda: None
+        if cancel_token is not None:
+            # Cancel callbacks run on the cancelling thread
+            unregister = cancel_token.on_cancel(lambda: loop.call_soon_threadsafe(self._cancel, request))
+        try:
+            return await future
+        finally:
+            unregister()
+
+    def _cancel(self, request: DialRequest):
+        """Fail a cancelled request's dial now. The dispatcher drops it once it comes up, and a live call is hung up."""
+        if request.future.done():
+            return
+        self._set_waiting(-1)
+        request.future.set_exception(Cancelled(request.cancel_token.reason))
+        if request.call_sid is not None:
+            self._spawn(self._hang_up(request))
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _hang_up(self, request: DialRequest):
+        call_sid = request.call_sid
+        if self.hang_up is None or call_sid is None:
+            return
+        try:
+            await self.hang_up(call_sid)
+            reclaimed(request.cancel_token, "live_call")
+        except Exception as e:
+            logger.warning("Hanging up cancelled call failed", extra={"call_sid": call_sid, "error": str(e)})
+
+    def _set_waiting(self, delta: int):
+        self._waiting += delta
+        metrics.DIALER_QUEUE_DEPTH.set(self._waiting)
+
+    async def _dispatch(self):
+        while True:
+            request = await self.queue.get()
+            if request.cancelled:
+                reclaimed(request.cancel_token, "queued_call")
+                continue
+            if self._active[request.to_number] >= self.max_calls_per_number:
+                self._parked[request.to_number].append(request)
+                continue
+            # Take the number's slot before waiting for the pacer, so no other call to it starts meanwhile
+            self._active[request.to_number] += 1
+            metrics.DIALER_PACER_WAIT.observe(await self.pacer.acquire())
+            if request.cancelled:
+                self._release(request.to_number)
+                reclaimed(request.cancel_token, "queued_call")
+                continue
+            self._spawn(self._attempt(request))
+
+    def _release(self, to_number: str):
+        self._active[to_number] -= 1
+        parked = self._parked.get(to_number)
+        if parked:
+            self.queue.put_nowait(parked.popleft())
+        if not parked:
+            self._parked.pop(to_number, None)
+        if not self._active[to_number]:
+            del self._active[to_number]
+
+    def _backoff(self, to_number: str) -> float:
+        delay = min(self.backoff_max_seconds, self.backoff_seconds * 2 ** (self._misses[to_number] - 1))
+        return delay * self.rng.uniform(0.8, 1.2)
+
+    async def _attempt(self, request: DialRequest):
+        # The status poller, run by wait_for_end in a worker thread, stops on the request's cancel
+        bind_token(request.cancel_token)
+        request.attempts += 1
+        wait_seconds = time.monotonic() - request.submitted_at
+        call_sid, status, error = None, "failed", None
+        try:
+            try:
+                call_sid = await self.place_call(request.to_number, **request.call_kwargs)
+            except Exception as e:
+                if is_rate_limited(e):
+                    # Not the number's fault: slow down and try again as soon as the pacer allows
+                    self.outcomes[RATE_LIMITED] += 1
+                    metrics.DIALER_ATTEMPTS.labels(RATE_LIMITED).inc()
+                    self.pacer.drain()
+                    request.attempts -= 1
+                    self.queue.put_nowait(request)
+                    return
+                error = str(e)
+                logger.warning("Placing call failed", extra={"to": request.to_number, "error": error})
+            else:
+                request.call_sid = call_sid
+                if request.cancelled:
+                    # Cancelled while the call was being placed
+                    await self._hang_up(request)
+                    status = "canceled"
+                else:
+                    status = await self.wait_for_end(call_sid)
+                request.call_sid = None
+        except Exception as e:
+            error = str(e)
+            logger.warning("Waiting for call failed", extra={"call_sid": call_sid, "error": error})
+        finally:
+            self._release(request.to_number)
+
+        self.outcomes[status] += 1
+        metrics.DIALER_ATTEMPTS.labels(status).inc()
+        if status in RETRY_STATUSES:
+            self._misses[request.to_number] += 1
+            if request.attempts < self.max_attempts and not request.cancelled:
+                delay = self._backoff(request.to_number)
+                logger.info("Call not answered, retrying", extra={
+                    "call_sid": call_sid, "to": request.to_number, "status": status,
+                    "attempt": request.attempts, "retry_in": round(delay, 1),
+                })
+                asyncio.get_running_loop().call_later(delay, self.queue.put_nowait, request)
+                return
+        else:
+            self._misses.pop(request.to_number, None)
+
+        if not request.future.done():
+            self._set_waiting(-1)
+            request.future.set_result(DialResult(call_sid, status, request.attempts, round(wait_seconds, 3), error))
+
+    async def close(self):
+        self._dispatcher.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(self._dispatcher, *self._tasks, return_exceptions=True)
+
+class BackgroundDialer:
+    """A Dialer on its own event loop thread, for callers that aren't async."""
+
+    def __init__(self, place_call: Callable[..., Awaitable[str]], wait_for_end: Callable[[str], Awaitable[str]],
+                 max_threads: int = 64, **dialer_kwargs):
+        """
+        Args:
+            max_threads: Threads for blocking work the callbacks hand to asyncio.to_thread,
+                e.g. the Twilio REST client or waiting on a call; bounds the calls in flight
+        """
+        self.loop = asyncio.new_event_loop()
+        self.loop.set_default_executor(ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="dialer"))
+        threading.Thread(target=self.loop.run_forever, name="dialer-loop", daemon=True).start()
+
+        async def create():
+            return Dialer(place_call, wait_for_end, **dialer_kwargs)
+        self.dialer: Dialer = asyncio.run_coroutine_threadsafe(create(), self.loop).result()
+
+    def dial(self, to_number: str, priority: Optional[float] = None, cancel_token: Optional[CancelToken] = None,
+             **call_kwargs) -> DialResult:
+        """Submit a call and block until its final outcome, or raise Cancelled."""
+        return asyncio.run_coroutine_threadsafe(
+            self.dialer.dial(to_number, priority, cancel_token, **call_kwargs), self.loop
+        ).result()
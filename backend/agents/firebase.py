@@ -1,8 +1,8 @@
+import asyncio
+import jwt
 import firebase_admin
-from firebase_admin import credentials, firestore, auth
-
-cred = credentials.Certificate("firebase_adminsdk.json")
-firebase_admin.initialize_app(cred)
+import firebase_admin.exceptions
+from functools import lru_cache
 
 from enum import Enum
 from typing import List, Dict, Optional, TypedDict, Annotated, Tuple
@@ -11,6 +11,10 @@ from typing import List, Dict, Optional, TypedDict, Annotated, Tuple, cast
 from fastapi import FastAPI, Depends, HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
+from .firestore_async import AsyncFirestoreWriter
+from . import metrics
+from .auth_cache import TokenVerifier
+
 class AppStatus(str, Enum):
     INFO_COLLECTION = "info_collection"
     STRATEGIZING = "strategizing"
@@ -36,10 +40,83 @@ class SessionData(TypedDict):
     callSummaries: Optional[List[str]]
     recommendation: Optional[str]
 
-db = firestore.client()
+@lru_cache(maxsize=None)
+def get_app() -> firebase_admin.App:
+    """Initialize the Firebase app on first use, reusing one created by the host (e.g. main.py)."""
+    try:
+        return firebase_admin.get_app()
+    except ValueError:
+        from firebase_admin import credentials
+        return firebase_admin.initialize_app(credentials.Certificate("firebase_adminsdk.json"))
+
+@lru_cache(maxsize=None)
+def get_db():
+    """Create the sync Firestore client on first use; google.cloud.firestore is slow to import."""
+    from .cassette import REPLAY, CassetteFirestore, get_cassette
+    cassette = get_cassette()
+    if cassette is not None and cassette.mode == REPLAY:
+        return CassetteFirestore(cassette)
+    from firebase_admin import firestore
+    client = firestore.client(get_app())
+    return CassetteFirestore(cassette, client) if cassette is not None else client
+
+async_db = None
+_async_writer = None
+
+def set_async_client(client):
+    """
+    Use a different async Firestore client, e.g. an InMemoryAsyncFirestore fake in tests.
+    The Firestore emulator is picked up by the default client through FIRESTORE_EMULATOR_HOST.
+    """
+    global async_db, _async_writer
+    async_db = client
+    _async_writer = None
+
+def get_async_writer() -> AsyncFirestoreWriter:
+    """Return the write pipeline bound to the running event loop, creating it on first use."""
+    global async_db, _async_writer
+    if async_db is None:
+        from .cassette import REPLAY, get_cassette
+        cassette = get_cassette()
+        if cassette is not None and cassette.mode == REPLAY:
+            from .firestore_async import InMemoryAsyncFirestore
+            async_db = InMemoryAsyncFirestore()
+        else:
+            from firebase_admin import firestore_async
+            async_db = firestore_async.client(get_app())
+    if _async_writer is None or _async_writer.loop is not asyncio.get_running_loop():
+        _async_writer = AsyncFirestoreWriter(async_db)
+    return _async_writer
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+def _user_path(user_id: str) -> str:
+    return f"users/{user_id}"
+
+def _call_path(user_id: str, call_sid: str) -> str:
+    return f"users/{user_id}/calls/{call_sid}"
+
+def _transcript_chunk_path(user_id: str, call_sid: str, chunk: int) -> str:
+    return f"users/{user_id}/calls/{call_sid}/transcript/{chunk:04d}"
+
+def _set(path: str, data: Dict, merge: bool):
+    # Inside the event loop, hand the write to the async pipeline instead of blocking on
+    # a network round trip. When the pipeline is full the write waits behind the queued
+    # ones, so it neither stalls the loop nor lands before older writes.
+    if _in_event_loop():
+        get_async_writer().set_nowait(path, data, merge)
+        return
+    with metrics.FIRESTORE_WRITE_LATENCY.labels("sync").time():
+        get_db().document(path).set(data, merge=merge)
+    metrics.FIRESTORE_WRITES.labels("sync").inc()
 
 def update_data(user_id: str, data: SessionData, merge = True):
-    db.collection('users').document(user_id).set(data, merge=merge)
+    _set(_user_path(user_id), data, merge)
 
 def update_status(user_id: str, status: AppStatus):
     update_data(user_id, { "status": status })
@@ -53,7 +130,7 @@ def update_call_data(user_id: str, call_sid: str, data: Dict, merge=True):
     :param data: The data to update in the Firestore document.
     :param merge: Whether to merge the data with existing data.
     """
-    db.collection('users').document(user_id).collection('calls').document(call_sid).set(data, merge=merge)
+    _set(_call_path(user_id, call_sid), data, merge)
 
 def get_call_data_as_json(user_id: str, call_sid: str) -> Optional[Dict]:
     """
@@ -63,7 +140,7 @@ def get_call_data_as_json(user_id: str, call_sid: str) -> Optional[Dict]:
     :param call_sid: The SID of the call.
     :return: The document data as a dictionary, or None if the document does not exist.
     """
-    doc_ref = db.collection('users').document(user_id).collection('calls').document(call_sid)
+    doc_ref = get_db().collection('users').document(user_id).collection('calls').document(call_sid)
     doc = doc_ref.get()
     
     if doc.exists:
@@ -71,12 +148,78 @@ def get_call_data_as_json(user_id: str, call_sid: str) -> Optional[Dict]:
     else:
         return None
 
+def watch_call_data(user_id: str, call_sid: str, callback):
+    """
+    Call `callback(data)` with the call document whenever it changes.
+
+    Returns:
+        The Firestore watch; call unsubscribe() on it to stop listening
+    """
+    def on_snapshot(snapshots, changes, read_time):
+        for snapshot in snapshots:
+            if snapshot.exists:
+                callback(snapshot.to_dict())
+    return get_db().document(_call_path(user_id, call_sid)).on_snapshot(on_snapshot)
+
+def get_transcript_chunk(user_id: str, call_sid: str, chunk: int) -> Optional[Dict]:
+    """Retrieve one chunk document of a call transcript, or None past the last chunk."""
+    doc = get_db().document(_transcript_chunk_path(user_id, call_sid, chunk)).get()
+    return doc.to_dict() if doc.exists else None
+
+async def update_data_async(user_id: str, data: SessionData, merge = True):
+    await get_async_writer().set(_user_path(user_id), data, merge)
+
+async def update_status_async(user_id: str, status: AppStatus):
+    await update_data_async(user_id, { "status": status })
+
+async def update_call_data_async(user_id: str, call_sid: str, data: Dict, merge=True):
+    """
+    Queue an update of the Firestore document at 'users/{user_id}/calls/{call_sid}'.
+    Waits only for room in the write queue, not for the commit.
+    """
+    await get_async_writer().set(_call_path(user_id, call_sid), data, merge)
+
+async def get_call_data_as_json_async(user_id: str, call_sid: str) -> Optional[Dict]:
+    """
+    Retrieve the call document after the queued writes have been committed.
+    """
+    writer = get_async_writer()
+    await writer.flush()
+    doc = await async_db.document(_call_path(user_id, call_sid)).get()
+    return doc.to_dict() if doc.exists else None
+
+async def update_transcript_chunk_async(user_id: str, call_sid: str, chunk: int, data: Dict, merge=True):
+    """Queue a write of a chunk document at 'users/{user_id}/calls/{call_sid}/transcript/{chunk}'."""
+    await get_async_writer().set(_transcript_chunk_path(user_id, call_sid, chunk), data, merge)
+
+async def get_transcript_chunk_async(user_id: str, call_sid: str, chunk: int) -> Optional[Dict]:
+    writer = get_async_writer()
+    await writer.flush()
+    doc = await async_db.document(_transcript_chunk_path(user_id, call_sid, chunk)).get()
+    return doc.to_dict() if doc.exists else None
+
 auth_scheme = HTTPBearer()
+
+@lru_cache(maxsize=None)
+def get_token_verifier() -> TokenVerifier:
+    """Create the token verifier and start prefetching the public keys in the background."""
+    from firebase_admin import auth
+    app = get_app()
+    token_verifier = TokenVerifier(app.project_id, fallback=lambda token: auth.verify_id_token(token, app=app))
+    token_verifier.key_set.start()
+    return token_verifier
+
+def revoke_user_tokens(uid: str):
+    """Revoke a user's refresh tokens and drop their cached ID tokens."""
+    from firebase_admin import auth
+    auth.revoke_refresh_tokens(uid, app=get_app())
+    get_token_verifier().cache.revoke_uid(uid)
+
 def verify_user(auth_token: HTTPAuthorizationCredentials = Depends(auth_scheme)):
     token = auth_token.credentials
     try:
-        # Verify the token using Firebase Admin SDK
-        decoded_token = auth.verify_id_token(token)
+        # Verify the token against the cached key set, falling back to the Firebase Admin SDK
+        decoded_token = get_token_verifier().verify(token)
         return cast(User, decoded_token)
-    except firebase_admin.exceptions.FirebaseError as e:
+    except (firebase_admin.exceptions.FirebaseError, jwt.PyJWTError, ValueError) as e:
         raise HTTPException(status_code=401, detail="Invalid Auth Token")
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""
+Async Firestore write pipeline.
+
+Writes are queued and committed by a single worker task. All writes that arrive
+within the same event loop tick are coalesced per document and committed together
+in one WriteBatch. The queue is bounded, so producers wait (backpressure) instead
+of piling up unbounded writes when Firestore is slow. Sync code in the event loop
+can't wait: its writes are held behind the queued ones, in order, until there is room.
+
+A write that fails to commit fails its future. Failures are logged and counted in
+firestore_write_errors_total, whether or not the caller looks at the future.
+
+The writer works with the Firestore AsyncClient (which also honors
+FIRESTORE_EMULATOR_HOST for the emulator) or with the InMemoryAsyncFirestore fake.
+"""
+
+import asyncio
+import copy
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from . import metrics
+from .log import get_logger
+
+logger = get_logger("firestore_async")
+
+MAX_BATCH_WRITES = 500  # Firestore limit for a single WriteBatch
+
+def merge_fields(target: Dict, update: Dict) -> Dict:
+    """Deep-merge `update` into `target` the way a Firestore set(..., merge=True) would."""
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge_fields(target[key], value)
+        else:
+            target[key] = value
+    return target
+
+class AsyncFirestoreWriter:
+    """Queues document writes and commits them in batches from a background task."""
+
+    def __init__(self, client, max_pending: int = 1000):
+        self.client = client
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self.loop = asyncio.get_running_loop()
+        self._worker = self.loop.create_task(self._run())
+        # Writes waiting for room in the queue, in arrival order
+        self._overflow: Deque[Tuple] = deque()
+        self._overflow_task: Optional[asyncio.Task] = None
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self.writes_queued = 0
+        self.writes_committed = 0
+        self.writes_failed = 0
+        self.batches_committed = 0
+
+    async def set(self, path: str, data: Dict, merge: bool = True) -> asyncio.Future:
+        """
+        Enqueue a write, waiting if the queue is full.
+
+        Returns:
+            asyncio.Future: Resolved once the write has been committed
+        """
+        future = self.set_nowait(path, data, merge)
+        await self._drained.wait()
+        return future
+
+    def set_nowait(self, path: str, data: Dict, merge: bool = True) -> asyncio.Future:
+        """
+        Enqueue a write without waiting. When the queue is full, the write is held
+        behind the writes already waiting and enters the queue once there is room.
+        """
+        future = self.loop.create_future()
+        future.add_done_callback(self._report)
+        item = (path, data, merge, future)
+        self.writes_queued += 1
+        if not self._overflow and not self.queue.full():
+            self.queue.put_nowait(item)
+            return future
+        self._overflow.append(item)
+        if self._overflow_task is None:
+            self._drained.clear()
+            self._overflow_task = self.loop.create_task(self._feed_overflow())
+        return future
+
+    async def _feed_overflow(self):
+        try:
+            while self._overflow:
+                await self.queue.put(self._overflow[0])
+                self._overflow.popleft()
+        finally:
+            self._overflow_task = None
+            self._drained.set()
+
+    def _report(self, future: asyncio.Future):
+        if future.cancelled() or future.exception() is None:
+            return
+        self.writes_failed += 1
+        metrics.FIRESTORE_WRITE_ERRORS.labels("batch").inc()
+
+    async def flush(self):
+        """Wait until every queued write has been committed."""
+        await self._drained.wait()
+        await self.queue.join()
+
+    async def close(self):
+        await self.flush()
+        self._worker.cancel()
+
+    def _drain(self, first) -> List[Tuple]:
+        items = [first]
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return items
+
+    async def _run(self):
+        while True:
+            first = await self.queue.get()
+            # Let the other writes of this tick land in the queue before batching
+            await asyncio.sleep(0)
+            items = self._drain(first)
+
+            pending: Dict[str, Tuple[Dict, bool]] = {}
+            for path, data, merge, _ in items:
+                if merge and path in pending:
+                    merged, was_merge = pending[path]
+                    pending[path] = (merge_fields(merged, copy.deepcopy(data)), was_merge)
+                else:
+                    pending[path] = (copy.deepcopy(data), merge)
+
+            try:
+                writes = list(pending.items())
+                for start in range(0, len(writes), MAX_BATCH_WRITES):
+                    batch = self.client.batch()
+                    for path, (data, merge) in writes[start:start + MAX_BATCH_WRITES]:
+                        batch.set(self.client.document(path), data, merge=merge)
+                    started = time.perf_counter()
+                    await batch.commit()
+                    metrics.FIRESTORE_WRITE_LATENCY.labels("batch").observe(time.perf_counter() - started)
+                    self.batches_committed += 1
+                self.writes_committed += len(items)
+                metrics.FIRESTORE_WRITES.labels("batch").inc(len(pending))
+                for *_, future in items:
+                    if not future.done():
+                        future.set_result(None)
+            except Exception as e:
+                logger.error("Firestore batch commit failed", extra={"writes": len(items), "error": str(e)})
+                for *_, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+class _InMemorySnapshot:
+    def __init__(self, data: Optional[Dict]):
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self) -> Optional[Dict]:
+        return copy.deepcopy(self._data)
+
+class _InMemoryDocument:
+    def __init__(self, store: "InMemoryAsyncFirestore", path: str):
+        self._store = store
+        self.path = path
+
+    def collection(self, name: str) -> "_InMemoryCollection":
+        return _InMemoryCollection(self._store, f"{self.path}/{name}")
+
+    async def set(self, data: Dict, merge: bool = False):
+        self._store._apply(self.path, data, merge)
+
+    async def get(self) -> _InMemorySnapshot:
+        return _InMemorySnapshot(self._store.documents.get(self.path))
+
+class _InMemoryCollection:
+    def __init__(self, store: "InMemoryAsyncFirestore", path: str):
+        self._store = store
+        self.path = path
+
+    def document(self, name: str) -> _InMemoryDocument:
+        return _InMemoryDocument(self._store, f"{self.path}/{name}")
+
+class _InMemoryBatch:
+    def __init__(self, store: "InMemoryAsyncFirestore"):
+        self._store = store
+        self._writes = []
+
+    def set(self, reference: _InMemoryDocument, data: Dict, merge: bool = False):
+        self._writes.append((reference.path, data, merge))
+
+    async def commit(self):
+        self._store.commits += 1
+        for path, data, merge in self._writes:
+            self._store._apply(path, data, merge)
+
+class InMemoryAsyncFirestore:
+    """Minimal in-memory stand-in for the Firestore AsyncClient, for tests and local runs."""
+
+    def __init__(self):
+        self.documents: Dict[str, Dict] = {}
+        self.commits = 0
+
+    def collection(self, name: str) -> _InMemoryCollection:
+        return _InMemoryCollection(self, name)
+
+    def document(self, path: str) -> _InMemoryDocument:
+        return _InMemoryDocument(self, path)
+
+    def batch(self) -> _InMemoryBatch:
+        return _InMemoryBatch(self)
+
+    def _apply(self, path: str, data: Dict, merge: bool):
+        if merge and path in self.documents:
+            merge_fields(self.documents[path], copy.deepcopy(data))
+        else:
+            self.documents[path] = copy.deepcopy(data)
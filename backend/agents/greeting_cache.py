@@ -0,0 +1,192 @@
+"""
+Pre-rendered opening lines, played the moment the callee picks up.
+
+Without them the callee hears nothing until the Realtime session is connected,
+configured and has produced its first audio. The greeting for a service category
+and `conversation_text` prompt is rendered offline instead: text-to-speech in the
+session's voice, mixed down to 8 kHz mono with the leading and trailing silence
+cut, and encoded to μ-law. The conversion is NumPy only: audioop, which pydub
+and the old encoder relied on, is gone from Python 3.13. It is kept on disk in
+GREETING_CACHE_DIR and in memory once read. The relay sends it to Twilio right after the stream's `start` event while
+the model session initializes, and tells the model the line was already said, so
+the model waits for the callee instead of opening the call again.
+
+Render the greetings of every category (or `--category`) with
+
+    python -m agents.greeting_cache
+
+from the backend directory, or from a recording with `--audio greeting.wav`
+(16-bit PCM WAV; other formats are decoded with pydub where it works).
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+import wave
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from . import metrics
+from .audio_packetizer import MULAW_BYTES_PER_MS
+from .vad import encode_mulaw
+
+SAMPLE_RATE = 8000
+SILENCE_THRESHOLD_DBFS = -50.0
+# Twilio media messages of at most one second of audio
+CHUNK_BYTES = 1000 * MULAW_BYTES_PER_MS
+
+def greeting_key(service_category: str, conversation_text: str, voice: str) -> str:
+    return hashlib.sha256(f"{service_category}|{voice}|{conversation_text}".encode("utf-8")).hexdigest()[:24]
+
+@dataclass
+class Greeting:
+    text: str
+    audio: bytes
+
+    @property
+    def duration_ms(self) -> int:
+        return len(self.audio) // MULAW_BYTES_PER_MS
+
+    def payloads(self) -> List[str]:
+        """The audio as base64 payloads for Twilio media messages."""
+        return [base64.b64encode(self.audio[offset:offset + CHUNK_BYTES]).decode("ascii")
+                for offset in range(0, len(self.audio), CHUNK_BYTES)]
+
+def _trim_silence(samples: np.ndarray, frame_rate: int) -> np.ndarray:
+    """Cut the leading and trailing 10 ms chunks quieter than SILENCE_THRESHOLD_DBFS."""
+    chunk = max(1, frame_rate // 100)
+    count = -(-len(samples) // chunk)
+    chunks = np.zeros(count * chunk)
+    chunks[:len(samples)] = samples
+    rms = np.sqrt(np.mean(chunks.reshape(count, chunk) ** 2, axis=1))
+    loud = np.flatnonzero(20 * np.log10(rms / 32768 + 1e-12) >= SILENCE_THRESHOLD_DBFS)
+    if not loud.size:
+        return samples[:0]
+    return samples[loud[0] * chunk:(loud[-1] + 1) * chunk]
+
+def to_mulaw(samples: np.ndarray, frame_rate: int) -> bytes:
+    """
+    16-bit PCM as 8 kHz mono μ-law, without leading or trailing silence.
+
+    Args:
+        samples: Shape (frames,), or (frames, channels) for interleaved multichannel audio
+        frame_rate: Frames per second of the samples
+    """
+    mono = samples.reshape(len(samples), -1).mean(axis=1)
+    mono = _trim_silence(mono, frame_rate)
+    if frame_rate != SAMPLE_RATE and len(mono):
+        mono = np.interp(np.arange(0, len(mono), frame_rate / SAMPLE_RATE), np.arange(len(mono)), mono)
+    return encode_mulaw(np.clip(np.round(mono), -32768, 32767).astype(np.int16))
+
+def read_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """The samples, shape (frames, channels), and frame rate of a 16-bit PCM WAV file."""
+    with wave.open(io.BytesIO(data)) as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"Expected 16-bit PCM, got {8 * wav.getsampwidth()}-bit")
+        frames = wav.readframes(wav.getnframes())
+        channels, frame_rate = wav.getnchannels(), wav.getframerate()
+    samples = np.frombuffer(frames[:len(frames) // (2 * channels) * 2 * channels], dtype="<i2")
+    return samples.reshape(-1, channels), frame_rate
+
+def read_audio(path: str) -> Tuple[np.ndarray, int]:
+    """The samples and frame rate of a recording: WAV directly, other formats through pydub and ffmpeg."""
+    with open(path, "rb") as f:
+        data = f.read()
+    try:
+        return read_wav(data)
+    except (wave.Error, EOFError, ValueError):
+        from pydub import AudioSegment
+        segment = AudioSegment.from_file(io.BytesIO(data)).set_sample_width(2)
+        samples = np.frombuffer(segment.raw_data, dtype="<i2").reshape(-1, segment.channels)
+        return samples, segment.frame_rate
+
+def synthesize(text: str, voice: str) -> bytes:
+    """Speech for the text in a Realtime voice, as μ-law."""
+    from openai import OpenAI
+
+    speech = OpenAI().audio.speech.create(model="tts-1", voice=voice, input=text, response_format="wav")
+    return to_mulaw(*read_wav(speech.read()))
+
+class GreetingCache:
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: Where rendered greetings are stored, one .ulaw and one .json file each
+        """
+        self.directory = directory
+        self._memory: Dict[str, Greeting] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, f"{key}.{extension}")
+
+    def has(self, service_category: str, conversation_text: str, voice: str) -> bool:
+        key = greeting_key(service_category, conversation_text, voice)
+        return key in self._memory or os.path.exists(self._path(key, "json"))
+
+    def get(self, service_category: str, conversation_text: str, voice: str) -> Optional[Greeting]:
+        key = greeting_key(service_category, conversation_text, voice)
+        greeting = self._memory.get(key)
+        if greeting is None:
+            try:
+                with open(self._path(key, "json"), encoding="utf-8") as f:
+                    text = json.load(f)["text"]
+                with open(self._path(key, "ulaw"), "rb") as f:
+                    greeting = Greeting(text, f.read())
+            except (OSError, KeyError, ValueError):
+                greeting = None
+            if greeting is not None:
+                with self._lock:
+                    self._memory[key] = greeting
+        metrics.GREETING_CACHE_LOOKUPS.labels("hit" if greeting else "miss").inc()
+        return greeting
+
+    def put(self, service_category: str, conversation_text: str, voice: str, greeting: Greeting) -> str:
+        key = greeting_key(service_category, conversation_text, voice)
+        os.makedirs(self.directory, exist_ok=True)
+        # Audio first: a greeting only counts as stored once its metadata is there
+        with open(self._path(key, "ulaw"), "wb") as f:
+            f.write(greeting.audio)
+        with open(self._path(key, "json"), "w", encoding="utf-8") as f:
+            json.dump({"category": service_category, "voice": voice, "text": greeting.text,
+                       "durationMs": greeting.duration_ms}, f)
+        with self._lock:
+            self._memory[key] = greeting
+        return key
+
+@lru_cache(maxsize=None)
+def get_greeting_cache() -> GreetingCache:
+    from .config import Config
+    return GreetingCache(Config.GREETING_CACHE_DIR)
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from .config import Config
+    from prompts.prompt_manager import prompt_manager
+
+    parser = argparse.ArgumentParser(description="Render the call greetings into the greeting cache")
+    parser.add_argument("--category", action="append", help="Service category, repeatable; default all")
+    parser.add_argument("--voice", default="alloy", help="The Realtime session's voice")
+    parser.add_argument("--audio", help="Render from this recording instead of text-to-speech")
+    args = parser.parse_args()
+
+    cache = get_greeting_cache()
+    for category in args.category or prompt_manager.list_available_services():
+        text = prompt_manager.get_prompt(category, 'greeting')
+        if args.audio:
+            audio = to_mulaw(*read_audio(args.audio))
+        else:
+            audio = synthesize(text, args.voice)
+        greeting = Greeting(text, audio)
+        key = cache.put(category, prompt_manager.get_prompt(category, 'conversation_text'), args.voice, greeting)
+        print(f"{category:<15} {greeting.duration_ms:5d} ms  {key}  {text}", file=sys.stderr)
+    print(f"Stored in {Config.GREETING_CACHE_DIR}", file=sys.stderr)
@@ -0,0 +1,65 @@
+"""
+Critical-path timing of one job through the agent graph.
+
+Every graph step records when it started and finished. The report compares the
+serial time, i.e. the sum of the step durations, which is what the job took when
+every node ran one after another, with the critical path: the chain of steps,
+each starting after the previous one finished, that determined when the job was
+done. With parallel branches the job takes the critical path, not the serial time.
+"""
+
+import threading
+from typing import Dict, List, NamedTuple
+
+class Span(NamedTuple):
+    node: str
+    started: float
+    ended: float
+
+    @property
+    def ms(self) -> float:
+        return (self.ended - self.started) * 1000
+
+class JobTimeline:
+    def __init__(self):
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def record(self, node: str, started: float, ended: float):
+        """Record a step, with perf_counter start and end times."""
+        with self._lock:
+            self._spans.append(Span(node, started, ended))
+
+    def reset(self):
+        with self._lock:
+            self._spans = []
+
+    def critical_path(self) -> List[Span]:
+        """Walk back from the last step to finish, through the latest step that finished before each one started."""
+        with self._lock:
+            spans = sorted(self._spans, key=lambda span: span.ended)
+        if not spans:
+            return []
+        path = [spans[-1]]
+        while True:
+            before = [span for span in spans if span.ended <= path[-1].started]
+            if not before:
+                break
+            path.append(before[-1])
+        return path[::-1]
+
+    def report(self) -> Dict:
+        with self._lock:
+            spans = list(self._spans)
+        if not spans:
+            return {}
+        path = self.critical_path()
+        nodes: Dict[str, float] = {}
+        for span in spans:
+            nodes[span.node] = round(nodes.get(span.node, 0) + span.ms, 1)
+        return {
+            "serialMs": round(sum(span.ms for span in spans), 1),
+            "criticalPathMs": round((path[-1].ended - path[0].started) * 1000, 1),
+            "criticalPath": [span.node for span in path],
+            "nodesMs": nodes,
+        }
@@ -0,0 +1,106 @@
+"""
+Incremental call summarization while the call is live.
+
+The LiveSummarizer receives every transcript segment as it is stored and folds new
+turns into a running structured CallSummary in the background, at most once every
+`min_interval` seconds. The running summary is written to the call document as
+`liveSummary`. At hang-up, `finish` only has to fold the last few turns, so the
+rendered summary is ready right after the call instead of after a pass over the
+full transcript.
+"""
+
+import asyncio
+import time
+from typing import List, Optional
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from . import firebase
+from .config import Config
+from .llm import chat_model
+from .log import get_logger
+from .state_models import CallSummary
+from .transcripts import Segment, format_for_summary
+
+logger = get_logger("live_summary")
+
+def render_summary(summary: CallSummary) -> str:
+    """Render the summary as bullet points with prices in bold, like the post-call summary."""
+    sections = [
+        ("Quoted prices", [f"**{quote}**" for quote in summary.quotes]),
+        ("Services", summary.services),
+        ("Schedule", [summary.schedule] if summary.schedule else []),
+        ("Conditions", summary.conditions),
+        ("Negotiation points", summary.negotiation_points),
+    ]
+    return "\n".join(f"- {title}: {'; '.join(items)}" for title, items in sections if items) or "No details discussed"
+
+class LiveSummarizer:
+    def __init__(self, user_id: str, call_sid: str, service_category: str = 'movers', model: str = Config.ANALYST_MODEL,
+                 min_new_segments: int = Config.LIVE_SUMMARY_MIN_SEGMENTS,
+                 min_interval: float = Config.LIVE_SUMMARY_INTERVAL_SECONDS):
+        self.user_id = user_id
+        self.call_sid = call_sid
+        self.min_new_segments = min_new_segments
+        self.min_interval = min_interval
+        self.llm = chat_model(model, "live_summary").with_structured_output(CallSummary)
+        self.prompt = ChatPromptTemplate.from_messages([
+            ("system", f"""You keep a running summary of a live phone call between our agent and a {service_category} provider.
+                         Update the summary so far with the new conversation turns: add new quotes, services,
+                         schedule details, conditions and negotiation points, and correct anything the provider revised.
+                         Keep every item short and keep exact prices and numbers."""),
+            ("human", "Summary so far:\n{summary}\n\nNew conversation turns:\n{turns}"),
+        ])
+        self.chain = self.prompt | self.llm
+
+        self.summary = CallSummary()
+        self._pending: List[Segment] = []
+        self._task: Optional[asyncio.Task] = None
+        self._last_fold = 0.0
+        self.folds = 0
+        self.segments_folded = 0
+        self.finish_ms: Optional[float] = None
+
+    def add(self, segment: Segment):
+        """Queue a new segment, starting a background fold when enough has accumulated."""
+        self._pending.append(segment)
+        if self._task is not None and not self._task.done():
+            return
+        if len(self._pending) >= self.min_new_segments and time.monotonic() - self._last_fold >= self.min_interval:
+            self._task = asyncio.get_running_loop().create_task(self._fold())
+
+    async def _fold(self) -> bool:
+        segments, self._pending = self._pending, []
+        self._last_fold = time.monotonic()
+        try:
+            self.summary = await self.chain.ainvoke({
+                "summary": self.summary.model_dump_json(),
+                "turns": format_for_summary(segments),
+            })
+        except Exception as e:
+            # Keep the turns for the next fold
+            self._pending = segments + self._pending
+            logger.warning("Live summary update failed", extra={"error": str(e)})
+            return False
+        self.folds += 1
+        self.segments_folded += len(segments)
+        await firebase.update_call_data_async(self.user_id, self.call_sid, {"liveSummary": self.summary.model_dump()})
+        return True
+
+    async def finish(self) -> Optional[str]:
+        """
+        Fold the remaining turns once the call is over.
+
+        Returns:
+            Optional[str]: The rendered summary, or None when some turns couldn't be folded
+        """
+        started = time.perf_counter()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+        if self._pending and not await self._fold():
+            return None
+        self.finish_ms = round((time.perf_counter() - started) * 1000, 1)
+        return render_summary(self.summary)
+
+    def stats(self):
+        return {"folds": self.folds, "segments": self.segments_folded, "finishMs": self.finish_ms}
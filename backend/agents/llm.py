@@ -0,0 +1,91 @@
+import time
+from typing import Any, Dict, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_openai import ChatOpenAI
+
+from . import metrics
+from .cancellation import Cancelled, current_token, reclaimed
+
+def _token_usage(response: LLMResult) -> Tuple[int, int]:
+    """
+    Input and output tokens of a finished LLM call. Invocations report them in
+    llm_output; streams have none there and carry them in the usage_metadata of the
+    generated message instead (see stream_usage in chat_model).
+    """
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    input_tokens = output_tokens = 0
+    for generations in response.generations:
+        for generation in generations:
+            message_usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            input_tokens += message_usage.get("input_tokens", 0)
+            output_tokens += message_usage.get("output_tokens", 0)
+    return input_tokens, output_tokens
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Records latency and token usage of every LLM call made for a chain."""
+
+    def __init__(self, chain: str):
+        self.chain = chain
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            metrics.LLM_CALL_LATENCY.labels(self.chain).observe(time.perf_counter() - started)
+
+        input_tokens, output_tokens = _token_usage(response)
+        metrics.LLM_TOKENS.labels(self.chain, "input").inc(input_tokens)
+        metrics.LLM_TOKENS.labels(self.chain, "output").inc(output_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._started.pop(run_id, None)
+        metrics.LLM_ERRORS.labels(self.chain).inc()
+
+class CancellationCallback(BaseCallbackHandler):
+    """Fails the LLM requests of cancelled work: at the start of a request, and between streamed tokens."""
+
+    raise_error = True
+
+    def _check(self):
+        token = current_token()
+        if token is not None and token.cancelled:
+            reclaimed(token, "llm_request")
+            raise Cancelled(token.reason)
+
+    def on_chat_model_start(self, serialized, messages, **kwargs: Any):
+        self._check()
+
+    def on_llm_start(self, serialized, prompts, **kwargs: Any):
+        self._check()
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        self._check()
+
+def chat_model(model: str, chain: str, **kwargs) -> ChatOpenAI:
+    """
+    Create the chat model used by an agent chain, instrumented with per-chain metrics.
+    Streams request their token usage too (stream_usage), so streamed calls are counted.
+    Its requests fail with Cancelled once the current cancel token is cancelled.
+    With a cassette in use (CASSETTE_MODE), its calls are recorded or replayed.
+
+    Args:
+        model (str): The OpenAI model name
+        chain (str): The chain label used in metrics, e.g. 'chat' or 'call_summary'
+    """
+    from .cassette import CassetteChatOpenAI, get_cassette
+    callbacks = [LLMMetricsCallback(chain), CancellationCallback()]
+    kwargs.setdefault("stream_usage", True)
+    if get_cassette() is not None:
+        return CassetteChatOpenAI(model=model, callbacks=callbacks, cassette_chain=chain, **kwargs)
+    return ChatOpenAI(model=model, callbacks=callbacks, **kwargs)
@@ -0,0 +1,160 @@
+"""
+Structured, non-blocking logging.
+
+Records are formatted as one JSON object per line and written to stdout by a
+QueueListener thread, so logging from the media relay loop never blocks on a write
+to stdout (which is unbuffered in the container). Each record carries the call SID
+and user id bound to the current task, the level is set with LOG_LEVEL, and
+high-frequency events can be sampled with `extra={"sample_every": N}`.
+
+Run `python -m agents.log` to benchmark relay-loop latency with logging on and off.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from collections import defaultdict
+from typing import Optional
+
+LOGGER_NAME = "servicesaver"
+
+call_sid_var: contextvars.ContextVar = contextvars.ContextVar("call_sid", default=None)
+user_id_var: contextvars.ContextVar = contextvars.ContextVar("user_id", default=None)
+
+_RESERVED_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "call_sid", "user_id", "sample_every"}
+
+def bind_call(call_sid: Optional[str] = None, user_id: Optional[str] = None):
+    """Attach a call SID and user id to every record logged from the current task."""
+    if call_sid is not None:
+        call_sid_var.set(call_sid)
+    if user_id is not None:
+        user_id_var.set(user_id)
+
+class ContextFilter(logging.Filter):
+    """Copies the per-call context onto the record while still in the caller's task."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.call_sid = call_sid_var.get()
+        record.user_id = user_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """Lets through one in `sample_every` records of the same message."""
+
+    def __init__(self):
+        super().__init__()
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = getattr(record, "sample_every", None)
+        if not every or every <= 1:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts[key]
+            self._counts[key] = count + 1
+        if count % every:
+            return False
+        record.sampled = every
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "call_sid", None):
+            entry["call_sid"] = record.call_sid
+        if getattr(record, "user_id", None):
+            entry["user_id"] = record.user_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def configure_logging(level: Optional[str] = None, stream=None) -> logging.Logger:
+    """
+    Route the application logger through a queue to a background writer thread.
+    Safe to call more than once; only the first call installs the handlers.
+    """
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    if _listener is not None:
+        return logger
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter())
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    logger.addHandler(queue_handler)
+    logger.propagate = False
+    return logger
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import time
+
+    parser = argparse.ArgumentParser(description="Relay-loop latency with logging off, print() and the queued logger")
+    parser.add_argument("--frames", type=int, default=20000)
+    parser.add_argument("--write-delay-us", type=float, default=50,
+                        help="Simulated cost of a blocking write to stdout")
+    args = parser.parse_args()
+
+    class SlowStream:
+        """A stdout stand-in whose writes block like an unbuffered pipe under load."""
+
+        def write(self, text):
+            # Like a blocking write syscall, this releases the GIL while it waits
+            time.sleep(args.write_delay_us / 1e6)
+
+        def flush(self):
+            pass
+
+    slow_stream = SlowStream()
+    logger = configure_logging("INFO", stream=slow_stream)
+    relay_logger = get_logger("bench")
+
+    async def relay_loop(log_frame) -> float:
+        bind_call("CA-bench", "bench-user")
+        start = time.perf_counter()
+        for frame in range(args.frames):
+            log_frame(frame)
+            await asyncio.sleep(0)
+        return (time.perf_counter() - start) / args.frames * 1e6
+
+    def run(name, log_frame):
+        per_frame = asyncio.run(relay_loop(log_frame))
+        print(f"{name:<28} {per_frame:8.2f} us/frame", file=sys.stderr)
+
+    run("logging off", lambda frame: relay_logger.debug("Relayed frame", extra={"frame": frame}))
+    run("print() per frame", lambda frame: print(f"Relayed frame {frame}", file=slow_stream))
+    run("queued logger per frame", lambda frame: relay_logger.info("Relayed frame", extra={"frame": frame}))
+    run("queued logger, 1/50 sampled", lambda frame: relay_logger.info("Relayed frame", extra={"frame": frame, "sample_every": 50}))
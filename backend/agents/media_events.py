@@ -0,0 +1,271 @@
+"""
+Typed codec for the Twilio media-stream and OpenAI Realtime events.
+
+Inbound messages are parsed with orjson when it is installed (the stdlib json module
+otherwise) and turned into small typed events by a table keyed on the event type,
+keeping only the fields the relay uses. The relay routes each decoded event with a
+dispatch table keyed on the event class instead of a chain of `if response['type'] == ...`.
+Outbound media messages are rendered directly as strings: base64 payloads and
+Twilio SIDs never need escaping, so the hot path skips the JSON encoder.
+
+Run `python -m agents.media_events` to benchmark decoding, dispatching and encoding
+against json.loads/json.dumps, on synthetic events or captured JSONL logs.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+try:
+    import orjson
+
+    def loads(data) -> Any:
+        return orjson.loads(data)
+
+    def dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    JSON_BACKEND = "orjson"
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    import json
+
+    loads = json.loads
+
+    def dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+    JSON_BACKEND = "json"
+
+# Twilio media stream events
+
+@dataclass(slots=True)
+class TwilioMedia:
+    payload: str
+    timestamp: int
+
+@dataclass(slots=True)
+class TwilioStart:
+    stream_sid: str
+    call_sid: Optional[str] = None
+
+@dataclass(slots=True)
+class TwilioMark:
+    name: Optional[str] = None
+
+@dataclass(slots=True)
+class TwilioStop:
+    pass
+
+# OpenAI Realtime events
+
+@dataclass(slots=True)
+class AudioDelta:
+    delta: str
+    item_id: Optional[str] = None
+
+@dataclass(slots=True)
+class AudioDone:
+    item_id: Optional[str] = None
+
+@dataclass(slots=True)
+class ResponseDone:
+    transcripts: List[str] = field(default_factory=list)
+
+@dataclass(slots=True)
+class UserTranscript:
+    transcript: str
+
+@dataclass(slots=True)
+class AssistantText:
+    text: str
+
+@dataclass(slots=True)
+class SpeechStarted:
+    audio_start_ms: Optional[int] = None
+
+@dataclass(slots=True)
+class SpeechStopped:
+    audio_end_ms: Optional[int] = None
+
+@dataclass(slots=True)
+class RealtimeError:
+    error: Dict
+
+@dataclass(slots=True)
+class Unhandled:
+    """A Realtime event the relay doesn't act on; only its type is kept."""
+    type: str
+
+def _assistant_transcripts(event: Dict) -> List[str]:
+    transcripts = []
+    for item in event.get("response", {}).get("output", []):
+        if item.get("role") == "assistant":
+            for content in item.get("content", []):
+                if content.get("transcript"):
+                    transcripts.append(content["transcript"])
+    return transcripts
+
+TWILIO_DECODERS: Dict[str, Callable[[Dict], Any]] = {
+    "media": lambda e: TwilioMedia(e["media"]["payload"], int(e["media"]["timestamp"])),
+    "start": lambda e: TwilioStart(e["start"]["streamSid"], e["start"].get("callSid")),
+    "mark": lambda e: TwilioMark(e.get("mark", {}).get("name")),
+    "stop": lambda e: TwilioStop(),
+}
+
+REALTIME_DECODERS: Dict[str, Callable[[Dict], Any]] = {
+    "response.audio.delta": lambda e: AudioDelta(e["delta"], e.get("item_id")),
+    "response.audio.done": lambda e: AudioDone(e.get("item_id")),
+    "response.done": lambda e: ResponseDone(_assistant_transcripts(e)),
+    "conversation.item.input_audio_transcription.completed": lambda e: UserTranscript(e["transcript"]),
+    "transcript.final": lambda e: UserTranscript(e["text"]),
+    "response.text": lambda e: AssistantText(e["text"]),
+    "input_audio_buffer.speech_started": lambda e: SpeechStarted(e.get("audio_start_ms")),
+    "input_audio_buffer.speech_stopped": lambda e: SpeechStopped(e.get("audio_end_ms")),
+    "error": lambda e: RealtimeError(e.get("error", {})),
+}
+
+def decode_twilio(message) -> Optional[Any]:
+    """Decode a Twilio media-stream message; None for events the relay ignores."""
+    event = loads(message)
+    decoder = TWILIO_DECODERS.get(event.get("event"))
+    return decoder(event) if decoder else None
+
+def decode_realtime(message) -> Any:
+    """Decode a Realtime event; events without a decoder come back as Unhandled."""
+    event = loads(message)
+    event_type = event.get("type")
+    decoder = REALTIME_DECODERS.get(event_type)
+    return decoder(event) if decoder else Unhandled(event_type)
+
+# Outbound messages
+
+def twilio_media(stream_sid: str, payload: str) -> str:
+    return '{"event":"media","streamSid":"%s","media":{"payload":"%s"}}' % (stream_sid, payload)
+
+def twilio_mark(stream_sid: str, name: str) -> str:
+    return '{"event":"mark","streamSid":"%s","mark":{"name":%s}}' % (stream_sid, dumps(name))
+
+def twilio_clear(stream_sid: str) -> str:
+    return '{"event":"clear","streamSid":"%s"}' % stream_sid
+
+def audio_append(payload: str) -> str:
+    return '{"type":"input_audio_buffer.append","audio":"%s"}' % payload
+
+def response_cancel() -> str:
+    return '{"type":"response.cancel"}'
+
+def item_truncate(item_id: str, audio_end_ms: int, content_index: int = 0) -> str:
+    return dumps({
+        "type": "conversation.item.truncate",
+        "item_id": item_id,
+        "content_index": content_index,
+        "audio_end_ms": audio_end_ms,
+    })
+
+
+if __name__ == "__main__":
+    import argparse
+    import base64
+    import json
+    import random
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="Media-stream JSON handling: json + if-chain vs the typed codec")
+    parser.add_argument("--twilio", help="JSONL of captured Twilio media-stream messages")
+    parser.add_argument("--realtime", help="JSONL of captured Realtime events")
+    parser.add_argument("--events", type=int, default=20000, help="Synthetic events per direction")
+    args = parser.parse_args()
+
+    def read_lines(path: str) -> List[str]:
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def synthetic(count: int):
+        rng = random.Random(3)
+        frame = lambda n: base64.b64encode(bytes(rng.getrandbits(8) for _ in range(n))).decode("ascii")
+        twilio = [json.dumps({"event": "media", "sequenceNumber": str(i), "streamSid": "MZ" + "0" * 32,
+                              "media": {"track": "inbound", "chunk": str(i), "timestamp": str(i * 20), "payload": frame(160)}})
+                  for i in range(count)]
+        realtime = []
+        for i in range(count):
+            kind = rng.random()
+            if kind < 0.55:
+                event = {"type": "response.audio.delta", "event_id": f"event_{i}", "response_id": "resp_1",
+                         "item_id": "item_1", "output_index": 0, "content_index": 0, "delta": frame(rng.choice((80, 160, 320)))}
+            elif kind < 0.95:
+                event = {"type": "response.audio_transcript.delta", "event_id": f"event_{i}", "response_id": "resp_1",
+                         "item_id": "item_1", "output_index": 0, "content_index": 0, "delta": "word "}
+            else:
+                event = {"type": "response.done", "event_id": f"event_{i}", "response": {"id": "resp_1", "status": "completed",
+                         "output": [{"id": "item_1", "role": "assistant", "content": [{"type": "audio", "transcript": "Hello there"}]}],
+                         "usage": {"total_tokens": 120, "input_tokens": 80, "output_tokens": 40}}}
+            realtime.append(json.dumps(event))
+        return twilio, realtime
+
+    twilio_messages, realtime_messages = synthetic(args.events)
+    if args.twilio:
+        twilio_messages = read_lines(args.twilio)
+    if args.realtime:
+        realtime_messages = read_lines(args.realtime)
+
+    def baseline_twilio(message):
+        data = json.loads(message)
+        if data['event'] == 'media':
+            return json.dumps({"type": "input_audio_buffer.append", "audio": data['media']['payload']})
+        elif data['event'] == 'start':
+            return data['start']['streamSid']
+        elif data['event'] == 'mark':
+            return None
+
+    def baseline_realtime(message):
+        response = json.loads(message)
+        out = None
+        if response['type'] == 'conversation.item.input_audio_transcription.completed':
+            out = response['transcript']
+        if response['type'] in ('error', 'response.content.done', 'rate_limits.updated', 'response.done'):
+            if response['type'] == 'response.done':
+                out = [c.get('transcript') for item in response['response']['output'] for c in item['content']]
+        if response.get('type') == 'transcript.final':
+            out = response['text']
+        if response.get('type') == 'response.audio.delta' and 'delta' in response:
+            out = json.dumps({"event": "media", "streamSid": "MZ1", "media": {"payload": response['delta']}})
+        if response.get('type') == 'response.text' and 'text' in response:
+            out = response['text']
+        if response.get('type') == 'input_audio_buffer.speech_stopped':
+            out = None
+        if response.get('type') == 'input_audio_buffer.speech_started':
+            out = response.get('audio_start_ms')
+        return out
+
+    twilio_handlers = {
+        TwilioMedia: lambda e: audio_append(e.payload),
+        TwilioStart: lambda e: e.stream_sid,
+    }
+    realtime_handlers = {
+        AudioDelta: lambda e: twilio_media("MZ1", e.delta),
+        ResponseDone: lambda e: e.transcripts,
+        UserTranscript: lambda e: e.transcript,
+        AssistantText: lambda e: e.text,
+        SpeechStarted: lambda e: e.audio_start_ms,
+    }
+
+    def dispatch(handlers, event):
+        handler = handlers.get(type(event))
+        return handler(event) if handler else None
+
+    def bench(name, messages, handle):
+        start = time.process_time()
+        for message in messages:
+            handle(message)
+        per_event = (time.process_time() - start) / len(messages) * 1e6
+        print(f"{name:<32} {per_event:7.2f} us/event", file=sys.stderr)
+        return per_event
+
+    print(f"JSON backend: {JSON_BACKEND}", file=sys.stderr)
+    for direction, messages, baseline, decode, handlers in (
+        ("twilio -> openai", twilio_messages, baseline_twilio, decode_twilio, twilio_handlers),
+        ("openai -> twilio", realtime_messages, baseline_realtime, decode_realtime, realtime_handlers),
+    ):
+        before = bench(f"{direction}: json + if-chain", messages, baseline)
+        after = bench(f"{direction}: typed codec", messages, lambda m: dispatch(handlers, decode(m)))
+        print(f"{'':<32} {before / after:7.2f}x faster", file=sys.stderr)
@@ -0,0 +1,186 @@
+"""
+Backpressure-aware sending for the Twilio <-> OpenAI media relay.
+
+Each direction of the relay gets a RelaySender: a bounded queue drained by a
+dedicated writer task, so a slow peer only delays its own direction. Audio frames
+are subject to a policy when the queue is full:
+
+- "merge": append the frame's audio to the last queued audio frame (nothing is lost,
+  fewer and larger messages go out), falling back to dropping the oldest frame once
+  a merged frame reaches `max_merge_bytes`
+- "drop_oldest": drop the oldest queued audio frame
+- "drop_newest": drop the incoming frame
+
+Control messages (marks, clear, truncate, session events) are never dropped and
+keep their order relative to audio. After each drained batch that contained audio,
+`after_audio` is awaited once, which is how marks toward Twilio are batched.
+"""
+
+import asyncio
+import base64
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+from . import metrics
+
+MERGE = "merge"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+POLICIES = (MERGE, DROP_OLDEST, DROP_NEWEST)
+
+AUDIO = "audio"
+CONTROL = "control"
+
+def merge_base64_audio(first: str, second: str) -> str:
+    return base64.b64encode(base64.b64decode(first) + base64.b64decode(second)).decode("ascii")
+
+def decoded_size(payload: str) -> int:
+    """Size in bytes of a base64 payload once decoded, without decoding it."""
+    return len(payload) * 3 // 4 - payload[-2:].count("=")
+
+class RelaySender:
+    def __init__(self, send: Callable[[str], Awaitable], direction: str,
+                 render_audio: Callable[[str], str], max_frames: int = 50,
+                 policy: str = MERGE, max_merge_bytes: int = 8000,
+                 after_audio: Optional[Callable[[], Awaitable]] = None):
+        """
+        Args:
+            send: Coroutine function sending one text message to the peer
+            direction: metrics.TWILIO_TO_OPENAI or metrics.OPENAI_TO_TWILIO
+            render_audio: Builds the message for a base64 audio payload at send time
+            max_frames: Queued audio frames before the policy applies
+            policy: One of POLICIES
+            max_merge_bytes: Largest merged audio frame, in decoded bytes (8000 = 1 s of μ-law)
+            after_audio: Awaited once after each sent batch containing audio
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown relay policy: {policy}")
+        self.send = send
+        self.direction = direction
+        self.render_audio = render_audio
+        self.max_frames = max_frames
+        self.policy = policy
+        self.max_merge_chars = max_merge_bytes * 4 // 3
+        self.after_audio = after_audio
+
+        self._queue: Deque[Tuple[str, str, float]] = deque()
+        self._audio_frames = 0
+        self._ready = asyncio.Event()
+        self._closed = False
+        self._writer = asyncio.get_running_loop().create_task(self._run())
+
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.frames_merged = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def _push(self, item: Tuple[str, str, float]):
+        self._queue.append(item)
+        metrics.MEDIA_QUEUE_DEPTH.labels(self.direction).inc()
+        self._ready.set()
+
+    def _pop(self) -> Tuple[str, str, float]:
+        item = self._queue.popleft()
+        metrics.MEDIA_QUEUE_DEPTH.labels(self.direction).dec()
+        if item[0] == AUDIO:
+            self._audio_frames -= 1
+        return item
+
+    def _drop(self, count: int = 1):
+        self.frames_dropped += count
+        metrics.MEDIA_FRAMES_DROPPED.labels(self.direction).inc(count)
+
+    def put_audio(self, payload: str, received_at: Optional[float] = None):
+        """Queue a base64 audio payload, applying the policy when the queue is full."""
+        if self._closed:
+            return
+        received_at = received_at or time.perf_counter()
+
+        if self._audio_frames >= self.max_frames:
+            if self.policy == DROP_NEWEST:
+                self._drop()
+                return
+            last = self._queue[-1] if self._queue else None
+            if self.policy == MERGE and last and last[0] == AUDIO and len(last[1]) + len(payload) <= self.max_merge_chars:
+                self._queue[-1] = (AUDIO, merge_base64_audio(last[1], payload), last[2])
+                self.frames_merged += 1
+                metrics.MEDIA_FRAMES_MERGED.labels(self.direction).inc()
+                return
+            self._drop_oldest_audio()
+
+        self._audio_frames += 1
+        self._push((AUDIO, payload, received_at))
+
+    def _drop_oldest_audio(self):
+        for index, item in enumerate(self._queue):
+            if item[0] == AUDIO:
+                del self._queue[index]
+                self._audio_frames -= 1
+                metrics.MEDIA_QUEUE_DEPTH.labels(self.direction).dec()
+                self._drop()
+                return
+
+    def put_control(self, message: str):
+        """Queue a control message; these are never dropped."""
+        if self._closed:
+            return
+        self._push((CONTROL, message, time.perf_counter()))
+
+    def clear_audio(self) -> int:
+        """
+        Drop queued audio that hasn't been sent yet, e.g. on barge-in.
+
+        Returns:
+            int: Decoded size of the dropped audio in bytes
+        """
+        kept = deque(item for item in self._queue if item[0] != AUDIO)
+        dropped_bytes = sum(decoded_size(item[1]) for item in self._queue if item[0] == AUDIO)
+        metrics.MEDIA_QUEUE_DEPTH.labels(self.direction).dec(len(self._queue) - len(kept))
+        self._queue = kept
+        self._audio_frames = 0
+        return dropped_bytes
+
+    async def _run(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                # Send what is queued now as one batch, new arrivals go in the next batch
+                sent_audio = False
+                for _ in range(len(self._queue)):
+                    if not self._queue:
+                        break
+                    kind, message, received_at = self._pop()
+                    if kind == AUDIO:
+                        await self.send(self.render_audio(message))
+                        sent_audio = True
+                        self.frames_sent += 1
+                        metrics.MEDIA_FRAMES.labels(self.direction).inc()
+                        if self.direction == metrics.TWILIO_TO_OPENAI:
+                            metrics.MEDIA_RELAY_LAG.observe(time.perf_counter() - received_at)
+                    else:
+                        await self.send(message)
+                if sent_audio and self.after_audio is not None:
+                    await self.after_audio()
+                if self._queue:
+                    self._ready.set()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The peer went away; stop accepting messages for it
+            self._closed = True
+            raise
+
+    async def close(self):
+        self._closed = True
+        metrics.MEDIA_QUEUE_DEPTH.labels(self.direction).dec(len(self._queue))
+        self._queue.clear()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except (asyncio.CancelledError, Exception):
+            pass
@@ -0,0 +1,124 @@
+"""
+Prometheus metrics for the agent graph, LLM chains, Firestore and the media relay.
+Served in the text exposition format at /metrics (see app.py).
+"""
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+
+GRAPH_NODE_LATENCY = Histogram(
+    "graph_node_latency_seconds", "Latency of a LangGraph node step",
+    ["node"], buckets=LATENCY_BUCKETS,
+)
+GRAPH_JOB_LATENCY = Histogram(
+    "graph_job_latency_seconds", "Time of a job from the last chat step to the analyst, serial sum or critical path",
+    ["path"], buckets=LATENCY_BUCKETS,
+)
+
+LLM_CALL_LATENCY = Histogram(
+    "llm_call_latency_seconds", "Latency of an LLM call",
+    ["chain"], buckets=LATENCY_BUCKETS,
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "Tokens used by LLM calls",
+    ["chain", "kind"],
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total", "LLM calls that raised an error",
+    ["chain"],
+)
+
+FIRESTORE_WRITE_LATENCY = Histogram(
+    "firestore_write_latency_seconds", "Latency of a Firestore write or batch commit",
+    ["mode"], buckets=FAST_BUCKETS,
+)
+FIRESTORE_WRITES = Counter(
+    "firestore_writes_total", "Document writes sent to Firestore",
+    ["mode"],
+)
+FIRESTORE_WRITE_ERRORS = Counter(
+    "firestore_write_errors_total", "Document writes that failed to commit",
+    ["mode"],
+)
+
+MEDIA_ACTIVE_STREAMS = Gauge(
+    "media_active_streams", "Media streams currently relayed between Twilio and OpenAI",
+)
+MEDIA_FRAMES = Counter(
+    "media_frames_total", "Frames relayed by the media stream, rate() gives frames per second",
+    ["direction"],
+)
+MEDIA_QUEUE_DEPTH = Gauge(
+    "media_queue_depth", "Messages queued for a peer of the media relay, summed over streams",
+    ["direction"],
+)
+MEDIA_FRAMES_DROPPED = Counter(
+    "media_frames_dropped_total", "Audio frames dropped because a peer lagged",
+    ["direction"],
+)
+MEDIA_FRAMES_MERGED = Counter(
+    "media_frames_merged_total", "Audio frames merged into a queued frame because a peer lagged",
+    ["direction"],
+)
+MEDIA_VAD_FRAMES = Counter(
+    "media_vad_frames_total", "Callee frames seen by the local VAD: forwarded to OpenAI or suppressed as silence",
+    ["decision"],
+)
+MEDIA_BARGE_IN = Counter(
+    "media_barge_in_total", "Barge-ins handled, by who detected the callee's speech first: local VAD or server",
+    ["source"],
+)
+MEDIA_RELAY_LAG = Histogram(
+    "media_relay_lag_seconds", "Time from receiving a Twilio frame to sending it to OpenAI",
+    buckets=FAST_BUCKETS,
+)
+
+DIALER_QUEUE_DEPTH = Gauge(
+    "dialer_queue_depth", "Calls waiting for the pacer, a free provider number or a retry",
+)
+DIALER_PACER_WAIT = Histogram(
+    "dialer_pacer_wait_seconds", "Time a call waited for a token of the calls-per-second pacer",
+    buckets=LATENCY_BUCKETS,
+)
+DIALER_ATTEMPTS = Counter(
+    "dialer_attempts_total", "Call attempts by outcome: completed, busy, no-answer, failed, canceled or rate_limited",
+    ["outcome"],
+)
+
+QUOTE_CACHE_LOOKUPS = Counter(
+    "quote_cache_lookups_total", "Quote cache lookups: hit (call skipped), weak (call reordered) or miss",
+    ["result"],
+)
+
+GREETING_CACHE_LOOKUPS = Counter(
+    "greeting_cache_lookups_total", "Pre-rendered greeting lookups at call pickup: hit or miss",
+    ["result"],
+)
+
+CALL_LATENCY = Histogram(
+    "call_latency_seconds", "Conversational latency of realtime calls: pickup, first audio, turn gaps, barge-in",
+    ["stage"], buckets=(0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10, 20, 30, 60),
+)
+
+JOBS_CANCELLED = Counter(
+    "jobs_cancelled_total", "Agent graph sessions cancelled, e.g. replaced by a new chat",
+    ["reason"],
+)
+CANCEL_RECLAIMED = Counter(
+    "cancel_reclaimed_total", "Resources freed by cancellations: graph_step, llm_request, queued_call, live_call, "
+    "call_poller or media_stream",
+    ["resource"],
+)
+CANCEL_RECLAIM_LATENCY = Histogram(
+    "cancel_reclaim_latency_seconds", "Time from a cancel to a resource being freed",
+    ["resource"], buckets=FAST_BUCKETS + (2.5, 5, 10),
+)
+
+TWILIO_TO_OPENAI = "twilio_to_openai"
+OPENAI_TO_TWILIO = "openai_to_twilio"
+
+def render():
+    """Return the current metrics and their content type for the /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
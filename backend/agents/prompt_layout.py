@@ -0,0 +1,243 @@
+"""
+Prompt assembly with a byte-stable static prefix, for provider-side prompt caching.
+
+OpenAI caches the longest previously seen prefix of a request, from 1024 tokens in
+steps of 128. A cached prefix is cheaper and shortens time to first token. Every
+prompt of the agents is therefore built the same way:
+
+1. a system message with the category's prompt file and the chain's fixed task
+   instructions;
+2. then the dynamic data of the call, one labeled section per variable, ordered
+   from the most to the least stable. The provider list is the same for every job
+   in a category, so it goes before the customer's details, and those go before
+   the strategy, which changes between calls.
+
+Templates are built once per category, so the prefix is identical byte for byte
+across jobs. Dynamic values never go into the system message.
+
+Run `python -m agents.prompt_layout` from the backend directory to report
+the share of each chain's prompt that two different jobs have in common, and how
+much of it OpenAI can cache.
+"""
+
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Sequence, Tuple
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from prompts.prompt_manager import prompt_manager
+
+def _section(label: str, variable: str) -> str:
+    return f"{label}:\n{{{variable}}}"
+
+def layered_prompt(static_parts: Sequence[str], dynamic: Sequence[Tuple[str, str]]) -> ChatPromptTemplate:
+    """
+    Args:
+        static_parts: Fixed text of the system message, in order
+        dynamic: (label, variable) sections of the human message, most stable first
+    """
+    system = "\n\n".join(part.strip() for part in static_parts if part.strip())
+    return ChatPromptTemplate.from_messages([
+        ("system", system),
+        ("human", "\n\n".join(_section(label, variable) for label, variable in dynamic)),
+    ])
+
+def layered_text(static: str, dynamic: Sequence[Tuple[str, Any]]) -> str:
+    """The same layout as plain text, for the Realtime session instructions."""
+    return "\n\n".join([static.strip()] + [f"{label}:\n{value}" for label, value in dynamic])
+
+def render_providers(providers: List[Dict]) -> str:
+    """The provider records, one JSON object per line with sorted keys, so the text only changes with the data."""
+    return "\n".join(json.dumps(provider, sort_keys=True, ensure_ascii=False, default=str) for provider in providers)
+
+@lru_cache(maxsize=None)
+def strategist_prompt(service_category: str) -> ChatPromptTemplate:
+    return layered_prompt(
+        [
+            prompt_manager.get_prompt(service_category, 'strategist_system'),
+            "Generate a concise instruction for guiding the voice agent to negotiate with the service provider "
+            "through a phone call. Make sure to include the customer information given below.",
+        ],
+        [("Customer information", "customer_info")],
+    )
+
+@lru_cache(maxsize=None)
+def provider_filter_prompt(service_category: str) -> ChatPromptTemplate:
+    return layered_prompt(
+        [
+            prompt_manager.get_prompt(service_category, 'provider_filter'),
+            "Filter the list of providers below based on the customer information.",
+        ],
+        [("Providers", "movers"), ("Customer information", "customer_info")],
+    )
+
+@lru_cache(maxsize=None)
+def analyst_prompt(service_category: str) -> ChatPromptTemplate:
+    return layered_prompt(
+        [prompt_manager.get_prompt(service_category, 'analyst_system')],
+        [("Customer Info", "customer_info"), ("Call Transcripts", "transcripts")],
+    )
+
+@lru_cache(maxsize=None)
+def analyst_update_prompt(service_category: str) -> ChatPromptTemplate:
+    return layered_prompt(
+        [
+            prompt_manager.get_prompt(service_category, 'analyst_system'),
+            "The calls to the providers finish one at a time. Update the analysis and recommendation so far "
+            "with the latest call, keeping what the earlier calls established. Reply with the complete updated "
+            "analysis and recommendation only.",
+        ],
+        [("Customer Info", "customer_info"), ("Analysis so far", "analysis"), ("Latest call", "call")],
+    )
+
+@lru_cache(maxsize=None)
+def replanner_prompt(service_category: str) -> ChatPromptTemplate:
+    return layered_prompt(
+        [
+            prompt_manager.get_prompt(service_category, 'strategy_replanner'),
+            "Modify the strategy for calling a different seller. Make sure to provide quantifiable information "
+            "(e.g., previous negotiation price) to negotiate the price with the new provider, and ask the model to "
+            "negotiate based on that and mention it explicitly. Don't output anything else.",
+        ],
+        [("Negotiation state so far", "negotiation_state"), ("Current strategy", "strategy"), ("Latest call summary", "summary")],
+    )
+
+@lru_cache(maxsize=None)
+def simulation_prompt() -> ChatPromptTemplate:
+    return layered_prompt(
+        [
+            """You are simulating a phone conversation between a customer and a moving company representative.
+            You will play the representative of the company described below, with its rating, specialties and price range.
+
+            The customer is calling to inquire about moving services. Respond professionally as a moving company representative would:
+            1. Acknowledge their inquiry
+            2. Ask clarifying questions about their move
+            3. Provide a realistic quote based on the details given, within the company's price range
+            4. Respond to any negotiation attempts
+            5. Keep the conversation realistic and professional
+
+            Be prepared to discuss:
+            - Packing services (if they specialize in packing)
+            - Long-distance moves (if they specialize in long-distance)
+            - Timeline and scheduling
+            - Insurance options
+            - Final pricing
+
+            Make the conversation feel authentic - include natural pauses, clarifications, and realistic business practices.
+
+            Simulate a realistic phone conversation where you respond as the moving company representative.
+            Include both sides of the conversation, clearly marking who is speaking.
+
+            Format the response as a realistic phone conversation transcript with:
+            Customer: [what they say]
+            Representative: [your response]
+
+            End with a final quote and any terms discussed.""",
+        ],
+        [("Customer Information", "customer_info"), ("Company", "company"), ("Customer's Negotiation Strategy", "strategy")],
+    )
+
+def simulation_company(provider: Dict) -> str:
+    return (
+        f"{provider.get('name', 'Moving Company')}\n"
+        f"Company Rating: {provider.get('rating', 4.0)}/5 stars\n"
+        f"Company Specialties: {provider.get('specialties', 'general moving')}\n"
+        f"Price Range: ${provider.get('min_price', 1000)} - ${provider.get('max_price', 5000)}"
+    )
+
+@lru_cache(maxsize=None)
+def call_summary_prompt() -> ChatPromptTemplate:
+    return layered_prompt(
+        [
+            """You are an summarizer who analyzing moving service call transcripts.
+            Extract and highlight key information like or similar to:
+            - Quoted prices (initial and final if negotiated)
+            - Service details offered
+            - Timeline/scheduling information
+            - Special requirements or conditions
+            - Notable negotiation points
+
+            Format the metrics in a clear, structured way using bullet points.
+            Put prices and key numbers in **bold**.
+
+            Analyze and summarize the call transcript below, highlighting the key metrics and information.""",
+        ],
+        [("Call transcript", "transcript")],
+    )
+
+def voice_instructions(service_category: str, customer_info: Any, strategy: str) -> str:
+    """Instructions of the Realtime session for one call: the category's voice prompt, then the job."""
+    return layered_text(
+        prompt_manager.get_prompt(service_category, 'voice_initial'),
+        [("Customer information", customer_info), ("Negotiation strategy", strategy)],
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import sys
+
+    parser = argparse.ArgumentParser(description="Cacheable prompt prefix per chain, between two different jobs")
+    parser.add_argument("--category", default="movers")
+    args = parser.parse_args()
+
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+        tokenize = encoding.encode
+    except Exception:
+        tokenize = lambda text: text.split(" ")
+
+    import pandas as pd
+    database = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{args.category}_database.csv")
+    providers = pd.read_csv(database).to_dict('records')
+
+    jobs = [
+        {"customer_info": "name='Dean' current_address='825 Menlo Ave, Menlo Park, CA 94025' destination_address='200 First St, Miami, FL 33131' "
+                          "apartment_size='studio, 500 sq ft' packing_assistance=True special_items='none'",
+         "strategy": "Open by asking for a binding quote for a studio move from Menlo Park to Miami on Dec 10. Mention a competing quote of $2,100.",
+         "provider": providers[0], "summary": "- Final negotiated price: **$2,300**\n- Free packing materials",
+         "transcripts": "Agent: Hi, I'm calling about a move.\nProvider: Sure, studio to Miami would be about $2,400."},
+        {"customer_info": "name='Priya' current_address='1 Market St, San Francisco, CA 94105' destination_address='77 Pine St, Seattle, WA 98101' "
+                          "apartment_size='2 bedroom' packing_assistance=False special_items='piano'",
+         "strategy": "Ask for piano handling costs up front and push for a weekday discount for the move to Seattle.",
+         "provider": providers[-1], "summary": "- Quote: **$4,150** including piano handling",
+         "transcripts": "Agent: Hello, I need a quote for a two bedroom move.\nProvider: With the piano that's $4,150."},
+    ]
+
+    def chain_inputs(job):
+        return {
+            "strategist": (strategist_prompt(args.category), {"customer_info": job["customer_info"]}),
+            "provider_filter": (provider_filter_prompt(args.category),
+                                {"movers": render_providers(providers), "customer_info": job["customer_info"]}),
+            "strategy_replanner": (replanner_prompt(args.category),
+                                   {"negotiation_state": '{"best_price": 2100.0}', "strategy": job["strategy"], "summary": job["summary"]}),
+            "call_simulation": (simulation_prompt(), {"customer_info": job["customer_info"], "strategy": job["strategy"],
+                                                       "company": simulation_company(job["provider"])}),
+            "call_summary": (call_summary_prompt(), {"transcript": job["transcripts"]}),
+            "analyst": (analyst_prompt(args.category), {"customer_info": job["customer_info"], "transcripts": job["transcripts"]}),
+            "analyst_update": (analyst_update_prompt(args.category),
+                               {"customer_info": job["customer_info"], "analysis": "No calls yet.", "call": job["summary"]}),
+        }
+
+    def request_text(prompt: ChatPromptTemplate, inputs: Dict) -> str:
+        return "".join(f"<{message.type}>{message.content}" for message in prompt.format_messages(**inputs))
+
+    first, second = chain_inputs(jobs[0]), chain_inputs(jobs[1])
+    texts = {name: (request_text(*first[name]), request_text(*second[name])) for name in first}
+    texts["voice_instructions"] = tuple(
+        voice_instructions(args.category, job["customer_info"], job["strategy"]) for job in jobs
+    )
+
+    for name, (text_a, text_b) in texts.items():
+        tokens_a, tokens_b = tokenize(text_a), tokenize(text_b)
+        common = 0
+        for token_a, token_b in zip(tokens_a, tokens_b):
+            if token_a != token_b:
+                break
+            common += 1
+        cacheable = 1024 + (common - 1024) // 128 * 128 if common >= 1024 else 0
+        print(f"{name:<20} prompt {len(tokens_a):6d} tokens | shared prefix {common:6d} ({common / len(tokens_a):6.1%})"
+              f" | cacheable by OpenAI {cacheable:6d}", file=sys.stderr)
@@ -0,0 +1,210 @@
+"""
+Offline provider simulator for load and regression tests.
+
+With USE_SIMULATION_MODE on, the voice agent used to have an LLM role-play each
+provider and another LLM call summarize the made-up conversation. That is slow,
+costs tokens and gives different answers on every run. The template backend
+(SIMULATOR_BACKEND=template) replaces both with a provider persona built from the
+provider's CSV row:
+
+- the first quote falls in the provider's `min_price`-`max_price` range, at a point
+  set by the job's size bucket and distance;
+- the lower the `rating`, the larger the discount the provider gives in
+  negotiation. It may match a competing price named in the strategy when that
+  price is within its range and at most MAX_MATCH_DROP below its first quote;
+- concessions follow the provider's `specialties` and the customer's needs.
+
+Each call draws from its own RNG, seeded with SIMULATOR_SEED, the provider, the
+customer and the strategy. The same job therefore gets the same calls, in any order
+and on any thread. The transcript has the usual "Customer:" / "Representative:"
+turns, and the summary uses the bullet format with bold prices that the replanner,
+quote cache and analyst parse. SIMULATOR_LATENCY_MS adds an artificial call
+duration.
+
+Run `python -m agents.provider_simulator` from the backend directory for
+calls per second and a determinism check.
+"""
+
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .quote_cache import size_bucket
+from .strategy_replanner import extract_offer
+
+# Where in its price range a provider's first quote falls, by job size
+SIZE_POSITION = {"xs": 0.1, "s": 0.25, "m": 0.45, "l": 0.65, "xl": 0.85, "any": 0.5}
+LONG_DISTANCE_EXTRA = 0.15
+# Competing prices further below the first quote than this aren't matched
+MAX_MATCH_DROP = 0.25
+PRICE_STEP = 25
+
+GREETINGS = (
+    "Thanks for calling {name}, how can I help you today?",
+    "{name}, this is the sales desk. What can I do for you?",
+    "Good afternoon, {name}. How can I help?",
+)
+CLOSINGS = (
+    "I can hold that price for a week. Shall I email you the written quote?",
+    "That's the best we can do. I'll send the quote over in writing today.",
+    "Let me know by Friday and we'll lock in that date for you.",
+)
+GENERAL_CONCESSIONS = (
+    "Waived booking fee",
+    "No additional charge for rescheduling up to 48 hours ahead",
+    "Free cancellation within 7 days",
+)
+
+def _field(customer_info: Any, name: str) -> Any:
+    if isinstance(customer_info, dict):
+        return customer_info.get(name)
+    return getattr(customer_info, name, None)
+
+def _specialties(provider: Dict) -> List[str]:
+    return [item.strip() for item in str(provider.get("specialties") or "").split(",") if item.strip()]
+
+def _round_price(value: float) -> float:
+    return float(round(value / PRICE_STEP) * PRICE_STEP)
+
+class TemplateSimulator:
+    def __init__(self, seed: int = 0, latency_ms: float = 0.0):
+        """
+        Args:
+            seed: Seed of every call's RNG, together with the provider, customer and strategy
+            latency_ms: Mean artificial duration of a call, 0 for none
+        """
+        self.seed = seed
+        self.latency_ms = latency_ms
+
+    def _rng(self, customer_info: Any, strategy: str, provider: Dict) -> random.Random:
+        return random.Random(f"{self.seed}|{provider.get('name')}|{provider.get('phone')}|{customer_info}|{strategy}")
+
+    def quote(self, customer_info: Any, strategy: str, provider: Dict, rng: random.Random) -> Tuple[float, float, Optional[float], List[str]]:
+        """The first and final price, the competing price the provider matched (if any) and its concessions."""
+        low = float(provider.get("min_price") or 1000)
+        high = max(low, float(provider.get("max_price") or low * 4))
+        rating = float(provider.get("rating") or 4.0)
+        specialties = [specialty.lower() for specialty in _specialties(provider)]
+
+        position = SIZE_POSITION[size_bucket(_field(customer_info, "apartment_size"))]
+        if _field(customer_info, "is_long_distance"):
+            position += LONG_DISTANCE_EXTRA
+        position = min(1.0, max(0.0, position + rng.uniform(-0.08, 0.08)))
+        initial = _round_price(low + (high - low) * position)
+
+        # A 5-star provider barely moves; a 3-star one gives up to 20%
+        flexibility = min(1.0, max(0.1, (5.0 - rating) / 2))
+        final = initial * (1 - rng.uniform(0.3, 1.0) * (0.05 + 0.15 * flexibility))
+        competing = extract_offer(strategy or "")
+        matched = None
+        matchable = competing is not None and max(low, initial * (1 - MAX_MATCH_DROP)) <= competing < final
+        if matchable and rng.random() < 0.4 + 0.5 * flexibility:
+            final = matched = competing
+        final = max(low, final if matched is not None else _round_price(final))
+
+        concessions = []
+        if _field(customer_info, "packing_assistance") and any("packing" in s and "no packing" not in s for s in specialties):
+            concessions.append("Free packing materials included")
+        if _field(customer_info, "storage_required") and any("storage" in s for s in specialties):
+            concessions.append("First month of storage free")
+        if rng.random() < 0.5:
+            concessions.append(rng.choice(GENERAL_CONCESSIONS))
+        return initial, final, matched, concessions
+
+    def simulate(self, customer_info: Any, strategy: str, provider: Dict) -> Tuple[str, str]:
+        """A simulated call with the provider: (transcript, summary), like the LLM simulation."""
+        rng = self._rng(customer_info, strategy, provider)
+        initial, final, matched, concessions = self.quote(customer_info, strategy, provider, rng)
+        name = provider.get("name", "the company")
+        size = _field(customer_info, "apartment_size") or "my place"
+        specialties = _specialties(provider)
+
+        turns = [
+            ("Representative", rng.choice(GREETINGS).format(name=name)),
+            ("Customer", f"Hi, I'd like a quote ({size})"
+                         + (", a long-distance job" if _field(customer_info, "is_long_distance") else "")
+                         + ". What would that cost?"),
+            ("Representative", f"For that we'd be looking at ${initial:,.0f}"
+                               + (f". We specialize in {', '.join(specialties[:2])}." if specialties else ".")),
+        ]
+        if matched is not None:
+            turns += [
+                ("Customer", f"I have another quote for ${matched:,.0f}. Can you match that?"),
+                ("Representative", f"We can match ${final:,.0f}."),
+            ]
+        else:
+            turns += [
+                ("Customer", "That's more than I hoped. Is there any flexibility on the price?"),
+                ("Representative", f"I can bring it down to ${final:,.0f}." if final < initial
+                                   else f"I'm afraid ${final:,.0f} is already our best price."),
+            ]
+        if concessions:
+            turns.append(("Representative", "On top of that: " + "; ".join(c[0].lower() + c[1:] for c in concessions) + "."))
+        turns.append(("Representative", rng.choice(CLOSINGS)))
+        transcript = "\n".join(f"{speaker}: {text}" for speaker, text in turns)
+
+        summary = [f"- Initial quoted price: **${initial:,.2f}**", f"- Final negotiated price: **${final:,.2f}**"]
+        if matched is not None:
+            summary.append(f"- Matched a competing quote of **${matched:,.2f}**")
+        summary += [f"- {concession}" for concession in concessions]
+        if specialties:
+            summary.append(f"- Specialties: {', '.join(specialties)}")
+
+        if self.latency_ms > 0:
+            time.sleep(rng.uniform(0.5, 1.5) * self.latency_ms / 1000)
+        return transcript, "\n".join(summary)
+
+
+if __name__ == "__main__":
+    import argparse
+    import hashlib
+    import os
+    import sys
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Simulated calls per second and determinism of the template simulator")
+    parser.add_argument("--category", default="movers")
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    database = os.path.join(os.path.dirname(os.path.abspath(__file__)), f"{args.category}_database.csv")
+    providers = pd.read_csv(database).to_dict('records')
+    job_rng = random.Random(args.seed)
+    sizes = ["studio", "1 bedroom", "2 bedroom", "3 bedroom", "1800 sq ft", "4 bedroom house"]
+    jobs = [({"name": f"Customer {index}", "apartment_size": job_rng.choice(sizes),
+              "is_long_distance": job_rng.random() < 0.3, "packing_assistance": job_rng.random() < 0.5,
+              "storage_required": job_rng.random() < 0.2},
+             f"Mention a competing quote of ${job_rng.randrange(900, 6000, 50):,}." if job_rng.random() < 0.5 else "Ask for a discount.")
+            for index in range(args.jobs)]
+
+    def run(order):
+        simulator = TemplateSimulator(args.seed)
+        digest = hashlib.sha256()
+        results = {}
+        started = time.perf_counter()
+        for index in order:
+            customer_info, strategy = jobs[index]
+            results[index] = [simulator.simulate(customer_info, strategy, provider) for provider in providers]
+        elapsed = time.perf_counter() - started
+        for index in range(len(jobs)):
+            for transcript, summary in results[index]:
+                digest.update(transcript.encode())
+                digest.update(summary.encode())
+        return elapsed, digest.hexdigest(), results
+
+    elapsed, first_digest, results = run(range(len(jobs)))
+    reversed_elapsed, second_digest, _ = run(reversed(range(len(jobs))))
+    calls = len(jobs) * len(providers)
+    parsed = [extract_offer(summary) for job in results.values() for _, summary in job]
+    in_range = sum(
+        1 for job in results.values() for provider, (_, summary) in zip(providers, job)
+        if provider["min_price"] <= extract_offer(summary) <= provider["max_price"]
+    )
+    print(f"{calls} calls ({len(jobs)} jobs x {len(providers)} providers) in {elapsed:.2f} s: "
+          f"{calls / elapsed:,.0f} calls/s, {len(jobs) / elapsed * 60:,.0f} jobs/min", file=sys.stderr)
+    print(f"same output in reverse order: {first_digest == second_digest} ({first_digest[:12]})", file=sys.stderr)
+    print(f"summaries with a price for the replanner: {sum(p is not None for p in parsed)}/{calls}, "
+          f"final price within the provider's range: {in_range}/{calls}", file=sys.stderr)
+    print("\n" + "\n\n".join(results[0][0]), file=sys.stderr)
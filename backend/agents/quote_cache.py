@@ -0,0 +1,246 @@
+"""
+Quotes shared across users, so comparable jobs don't pay for the same phone call twice.
+
+A quote is cached under the provider plus a normalized job signature: service
+category, size bucket, distance bucket (origin and destination ZIP3 regions) and a
+two-week date window. Jobs that would get the same price from a provider share
+an entry. A job whose size, addresses or date can't be bucketed has no signature:
+it would share an entry with every other vague job, so it neither reads nor
+writes the cache. An entry keeps the quoted prices and concessions of the last
+calls. It keeps no transcript and nothing about the customer.
+
+Each lookup scores the entry's confidence from:
+- freshness, which falls linearly to 0 at QUOTE_CACHE_TTL_HOURS;
+- the number of calls that produced a price;
+- how well those prices agree.
+
+At QUOTE_CACHE_MIN_CONFIDENCE or above, the voice agent uses the cached quote
+instead of calling. Below that, the cached price only moves the provider up the
+call order. Entries live in the `quoteCache` Firestore collection, so every
+instance shares them. `purge` backs the admin endpoint.
+"""
+
+import hashlib
+import re
+import time
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import metrics
+from .config import Config
+from .strategy_replanner import extract_concessions, extract_offer
+
+COLLECTION = "quoteCache"
+MAX_PRICES = 5
+MAX_CONCESSIONS = 5
+
+ZIP_PATTERN = re.compile(r"\b(\d{5})(?:-\d{4})?\b")
+BEDROOMS_PATTERN = re.compile(r"(\d+)\s*(?:br\b|bd\b|bed|bedroom)", re.IGNORECASE)
+SQFT_PATTERN = re.compile(r"(\d[\d,]*)\s*(?:sq\.?\s*f(?:ee)?t|sqft|square f)", re.IGNORECASE)
+# Approximate floor area by bedrooms, to put "2 bedroom" and "1000 sq ft" in the same bucket
+BEDROOM_SQFT = {0: 500, 1: 750, 2: 1000, 3: 1500, 4: 2200}
+SIZE_BUCKETS = ((650, "xs"), (900, "s"), (1300, "m"), (2000, "l"))
+# The bucket of a value that can't be bucketed
+UNKNOWN = "any"
+
+def _field(customer_info: Any, name: str) -> Any:
+    if isinstance(customer_info, dict):
+        return customer_info.get(name)
+    return getattr(customer_info, name, None)
+
+def size_bucket(apartment_size: Optional[str]) -> str:
+    text = str(apartment_size or "")
+    sqft = SQFT_PATTERN.search(text)
+    if sqft:
+        area = int(sqft.group(1).replace(",", ""))
+    elif "studio" in text.lower():
+        area = BEDROOM_SQFT[0]
+    else:
+        bedrooms = BEDROOMS_PATTERN.search(text)
+        if not bedrooms:
+            return UNKNOWN
+        area = BEDROOM_SQFT[min(int(bedrooms.group(1)), 4)]
+    for limit, bucket in SIZE_BUCKETS:
+        if area < limit:
+            return bucket
+    return "xl"
+
+def _zip3(address: Optional[str]) -> Optional[str]:
+    match = ZIP_PATTERN.search(str(address or ""))
+    return match.group(1)[:3] if match else None
+
+def distance_bucket(customer_info: Any) -> str:
+    origin = _zip3(_field(customer_info, "current_address"))
+    if origin is None:
+        return UNKNOWN
+    if _field(customer_info, "is_long_distance"):
+        destination = _zip3(_field(customer_info, "destination_address"))
+        return f"long-{origin}-{destination}" if destination is not None else UNKNOWN
+    return f"local-{origin}"
+
+def date_window(value: Any) -> str:
+    """Two-week window of the job date, e.g. 2024-w25 for ISO weeks 50 and 51."""
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return UNKNOWN
+    if not isinstance(value, date):
+        return UNKNOWN
+    year, week, _ = value.isocalendar()
+    return f"{year}-w{week // 2:02d}"
+
+def job_signature(service_category: str, customer_info: Any) -> Optional[str]:
+    """The job's cache signature, or None if its size, distance or date bucket is unknown."""
+    buckets = (
+        size_bucket(_field(customer_info, "apartment_size")),
+        distance_bucket(customer_info),
+        date_window(_field(customer_info, "move_out_date") or _field(customer_info, "move_in_date")),
+    )
+    if UNKNOWN in buckets:
+        return None
+    return "|".join((service_category,) + buckets)
+
+def provider_key(provider: Dict) -> str:
+    name = re.sub(r"[^a-z0-9]+", "-", str(provider.get("name", "")).lower()).strip("-")
+    phone = re.sub(r"\D", "", str(provider.get("phone", "")))[-10:]
+    return f"{name}-{phone}" if phone else name
+
+@dataclass
+class CachedQuote:
+    provider: str
+    prices: List[float]
+    concessions: List[str]
+    quoted_at: float
+    confidence: float
+
+    @property
+    def price(self) -> float:
+        return min(self.prices)
+
+    def summary(self) -> str:
+        """A call summary for the cached quote, in the format the replanner and analyst read."""
+        age_hours = (time.time() - self.quoted_at) / 3600
+        lines = [
+            f"- Cached quote from a comparable job {age_hours:.0f} h ago, confidence {self.confidence:.2f}; no call was made",
+            f"- Final quoted price: **${self.price:,.2f}**",
+        ]
+        lines += [f"- {concession}" for concession in self.concessions]
+        return "\n".join(lines)
+
+class QuoteCache:
+    def __init__(self, db=None, ttl_hours: float = Config.QUOTE_CACHE_TTL_HOURS,
+                 min_confidence: float = Config.QUOTE_CACHE_MIN_CONFIDENCE):
+        """
+        Args:
+            db: A sync Firestore client, defaults to the app's
+            ttl_hours: Age at which a quote is no longer used at all
+            min_confidence: Confidence a quote needs to replace a call
+        """
+        self._db = db
+        self.ttl_seconds = ttl_hours * 3600
+        self.min_confidence = min_confidence
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"hit": 0, "weak": 0, "miss": 0, "stored": 0}
+
+    @property
+    def db(self):
+        if self._db is None:
+            from . import firebase
+            self._db = firebase.get_db()
+        return self._db
+
+    def _document(self, provider: Dict, signature: str):
+        digest = hashlib.sha1(f"{provider_key(provider)}|{signature}".encode()).hexdigest()
+        return self.db.collection(COLLECTION).document(digest)
+
+    def confidence(self, entry: Dict, now: Optional[float] = None) -> float:
+        age = (now or time.time()) - entry["quotedAt"]
+        freshness = max(0.0, 1 - age / self.ttl_seconds)
+        prices = entry.get("prices") or []
+        if not prices:
+            return 0.0
+        # One call 0.7, two 0.85, three 0.925, ...
+        samples = 1 - 0.3 * 0.5 ** (len(prices) - 1)
+        agreement = max(0.0, 1 - (max(prices) - min(prices)) / max(prices))
+        return round(freshness * samples * agreement, 3)
+
+    def lookup(self, provider: Dict, signature: Optional[str]) -> Optional[CachedQuote]:
+        """The cached quote of a provider for a job, counted as a hit only if it is confident enough to skip the call."""
+        if signature is None:
+            return None
+        snapshot = self._document(provider, signature).get()
+        entry = snapshot.to_dict() if snapshot.exists else None
+        confidence = self.confidence(entry) if entry else 0.0
+        if confidence <= 0:
+            result = "miss"
+        else:
+            result = "hit" if confidence >= self.min_confidence else "weak"
+        self.stats[result] += 1
+        metrics.QUOTE_CACHE_LOOKUPS.labels(result).inc()
+        if confidence <= 0:
+            return None
+        return CachedQuote(entry["provider"], entry["prices"], entry.get("concessions", []), entry["quotedAt"], confidence)
+
+    def prioritize(self, providers: List[Dict], signature: Optional[str]) -> List[Tuple[Dict, Optional[CachedQuote]]]:
+        """
+        Order the providers for calling, each with its cached quote: confident hits
+        first, since they cost nothing and give the negotiation an early benchmark,
+        then providers with a weaker cached quote from the cheapest, then the rest.
+        """
+        quotes = [(provider, self.lookup(provider, signature)) for provider in providers]
+
+        def rank(item):
+            _, quote = item
+            if quote is None:
+                return (2, 0.0)
+            return (0 if quote.confidence >= self.min_confidence else 1, quote.price)
+
+        return sorted(quotes, key=rank)
+
+    def record(self, provider: Dict, signature: Optional[str], summary: str) -> bool:
+        """Add the quote from a completed call's summary; summaries without a price, or jobs without a signature, aren't cached."""
+        price = extract_offer(summary)
+        if price is None or signature is None:
+            return False
+        document = self._document(provider, signature)
+        snapshot = document.get()
+        entry = snapshot.to_dict() if snapshot.exists else {}
+        # Prices older than the TTL don't support the new one
+        previous = entry.get("prices", []) if entry and time.time() - entry["quotedAt"] < self.ttl_seconds else []
+        now = time.time()
+        document.set({
+            "provider": provider.get("name"),
+            "providerKey": provider_key(provider),
+            "signature": signature,
+            "category": signature.split("|", 1)[0],
+            "prices": (previous + [price])[-MAX_PRICES:],
+            "concessions": extract_concessions(summary)[:MAX_CONCESSIONS],
+            "quotedAt": now,
+            "expiresAt": now + self.ttl_seconds,
+        })
+        self.stats["stored"] += 1
+        return True
+
+    def purge(self, provider: Optional[str] = None, category: Optional[str] = None, expired_only: bool = False) -> int:
+        """Delete cached quotes, optionally only a provider's (by name), a category's or the expired ones."""
+        query = self.db.collection(COLLECTION)
+        if provider is not None:
+            query = query.where("provider", "==", provider)
+        if category is not None:
+            query = query.where("category", "==", category)
+        if expired_only:
+            query = query.where("expiresAt", "<", time.time())
+        deleted = 0
+        batch = self.db.batch()
+        for snapshot in query.stream():
+            batch.delete(snapshot.reference)
+            deleted += 1
+            if deleted % 400 == 0:
+                batch.commit()
+                batch = self.db.batch()
+        batch.commit()
+        return deleted
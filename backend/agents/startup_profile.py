@@ -0,0 +1,79 @@
+"""
+Startup import-time profile for the API server.
+
+Imports a module (`app` by default) in a fresh interpreter with `-X importtime`,
+prints the slowest imports and the total cold import time, and exits non-zero when
+the total exceeds the budget so it can be used as a regression check in CI:
+
+    python -m agents.startup_profile --module app --budget-ms 1500
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from typing import List, Tuple
+
+DEFAULT_BUDGET_MS = 1500
+DEFAULT_ENV = {
+    # The server refuses to import without an OpenAI key, any value is enough to profile it
+    "OPENAI_API_KEY": "profile",
+}
+
+def profile_import(module: str, cwd: str) -> Tuple[float, List[Tuple[int, int, str]]]:
+    """
+    Import `module` in a fresh interpreter.
+
+    Returns:
+        Tuple: Wall-clock import time in ms, and (self_us, cumulative_us, name) per imported module
+    """
+    env = {**DEFAULT_ENV, **os.environ}
+    code = f"import time; start = time.perf_counter(); import {module}; print((time.perf_counter() - start) * 1000)"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return float(result.stdout.strip().splitlines()[-1]), imports
+
+def top_level_imports(imports: List[Tuple[int, int, str]]) -> List[Tuple[int, str]]:
+    """Imports triggered directly by the profiled module (least indented), by cumulative time."""
+    indents = [len(name) - len(name.lstrip()) for _, _, name in imports]
+    top = min(indents, default=0)
+    return sorted(
+        ((cumulative, name.strip()) for (_, cumulative, name), indent in zip(imports, indents) if indent == top + 2),
+        reverse=True,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--cwd", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    args = parser.parse_args()
+
+    total_ms, imports = profile_import(args.module, args.cwd)
+
+    print(f"Slowest imports of {args.module} (cumulative):")
+    for cumulative, name in top_level_imports(imports)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    print(f"  {'':8}     ({len(imports)} modules imported)")
+    print(f"Cold import time: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    if total_ms > args.budget_ms:
+        print("FAIL: cold import time is over budget")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
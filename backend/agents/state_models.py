@@ -41,9 +41,27 @@ class State(TypedDict):
     """State of the moving assistant"""
     messages: Annotated[list, add_messages]  # Tracks conversation
     customer_info: Optional[CustomerInfo] # To populate from the chat agent
-    selected_movers: Optional[List[MoverInfo]] # To populate from the planner agent
-    negotiation_strategy: Optional[str] # To populate from the planner agent
+    # Large values are kept in the blob store, the state holds their references (see blob_store.py)
+    selected_movers: Optional[str] # Blob ref to the provider records, to populate from the planner agent
+    negotiation_strategy: Optional[str] # Blob ref to the strategy text, to populate from the planner agent
     summary_of_call_transcripts: Optional[str] # To populate from the planner agent
-    call_transcripts: Optional[List[CallTranscript]] # To populate from the voice agent
+    call_transcripts: Optional[str] # Blob ref to the transcripts, to populate from the voice agent
     final_recommendation: Optional[str] # To populate from the analyst agent
-    number_of_calls: Optional[int] = Field(description="The number of calls made to movers")
\ No newline at end of file
+    number_of_calls: Optional[int] = Field(description="The number of calls made to movers")
+
+class CompetitorOffer(BaseModel):
+    provider: str = Field(description="The name of the provider that made the offer")
+    price: Optional[float] = Field(default=None, description="The best price quoted by the provider")
+
+class NegotiationState(BaseModel):
+    best_price: Optional[float] = Field(default=None, description="The lowest price quoted so far")
+    best_provider: Optional[str] = Field(default=None, description="The provider that quoted the lowest price")
+    concessions: List[str] = Field(default_factory=list, description="Concessions obtained from providers so far")
+    competitor_offers: List[CompetitorOffer] = Field(default_factory=list, description="Offers collected from previous calls")
+
+class CallSummary(BaseModel):
+    quotes: List[str] = Field(default_factory=list, description="Prices quoted by the provider with what they cover, marked initial or final if negotiated")
+    services: List[str] = Field(default_factory=list, description="Services the provider offered or confirmed")
+    schedule: Optional[str] = Field(default=None, description="Availability, dates and timeline discussed")
+    conditions: List[str] = Field(default_factory=list, description="Special requirements, conditions, deposits or fees")
+    negotiation_points: List[str] = Field(default_factory=list, description="Concessions, discounts or competitor offers discussed")
@@ -0,0 +1,114 @@
+"""
+State sink for the `users/{uid}` status document.
+
+Agents push field updates into the sink instead of writing to Firestore directly.
+Updates are merged in memory and committed as a single write when the graph step
+finishes, or after a short delay for long running steps such as the voice agent.
+Writes go out one at a time and in the order their updates were taken, so a timer
+flush can't commit an older merge over a newer one.
+
+Each AgentGraph session has a sink of its own, closed by the session's cancel
+token. Once closed, the sink drops its pending updates, its timer and every later
+update, so the abandoned job of a replaced session can't write over the new
+session's document.
+"""
+
+import copy
+import threading
+from typing import Callable, Dict, Optional
+
+from .cancellation import CancelToken
+from .firestore_async import merge_fields
+from . import firebase
+
+DEFAULT_FLUSH_DELAY = 0.25  # seconds
+
+class UserStateSink:
+    def __init__(self, user_id: str, flush_delay: float = DEFAULT_FLUSH_DELAY,
+                 writer: Optional[Callable[..., None]] = None, cancel_token: Optional[CancelToken] = None):
+        """
+        Args:
+            cancel_token: The session's token; cancelling it closes the sink
+        """
+        self.user_id = user_id
+        self.flush_delay = flush_delay
+        self.writer = writer or firebase.update_data
+        self._pending: Dict = {}
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.RLock()
+        # Held from taking the pending updates until they are written; taken before _lock
+        self._write_lock = threading.Lock()
+        self.closed = False
+        self.reset_stats()
+        if cancel_token is not None:
+            cancel_token.on_cancel(self.close)
+
+    def reset_stats(self):
+        self.requested_writes = 0
+        self.committed_writes = 0
+
+    def stats(self) -> Dict:
+        return {
+            "requested": self.requested_writes,
+            "committed": self.committed_writes,
+            "saved": self.requested_writes - self.committed_writes,
+        }
+
+    def update(self, data: Dict):
+        """Merge field updates into the pending write and schedule a flush."""
+        with self._lock:
+            if self.closed:
+                return
+            # Deep copy, so later merges never mutate the caller's nested values
+            merge_fields(self._pending, copy.deepcopy(data))
+            self.requested_writes += 1
+            if self._timer is None and self.flush_delay is not None:
+                self._timer = threading.Timer(self.flush_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Commit all pending updates as one merged write."""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if self.closed or not self._pending:
+                    return
+                data, self._pending = self._pending, {}
+                self.committed_writes += 1
+            self.writer(self.user_id, data, merge=True)
+
+    def replace(self, data: Dict):
+        """Drop pending updates and overwrite the document, starting a new job."""
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._pending = {}
+                self.reset_stats()
+                if self.closed:
+                    return
+            self.writer(self.user_id, data, merge=False)
+
+    def close(self):
+        """Drop the pending updates and ignore any later ones, once a write in flight has finished."""
+        with self._write_lock:
+            with self._lock:
+                self.closed = True
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                self._pending = {}
+
+_sinks: Dict[str, UserStateSink] = {}
+_sinks_lock = threading.Lock()
+
+def sink_for(user_id: str) -> UserStateSink:
+    """Return the shared sink of a user, for agents used outside an AgentGraph session."""
+    with _sinks_lock:
+        if user_id not in _sinks:
+            _sinks[user_id] = UserStateSink(user_id)
+        return _sinks[user_id]
@@ -1,20 +1,19 @@
-import pandas as pd
-from typing import Dict, List
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.agents.agent_types import AgentType
-from langchain_openai import ChatOpenAI
+from typing import Dict, List, Optional
 
 from .config import Config
+from .llm import chat_model
 from .state_models import CustomerInfo, MoverInfo, FilteredMovers
-from . import firebase
-from ..prompts.prompt_manager import prompt_manager
+from . import blob_store
+from .state_sink import UserStateSink, sink_for
+from .prompt_layout import provider_filter_prompt, render_providers, strategist_prompt
 
 class StrategistAgent:
-    def __init__(self, user_id: str, service_category: str = 'movers', model: str = Config.PLANNER_MODEL):
-        self.llm = ChatOpenAI(model=model)
+    def __init__(self, user_id: str, service_category: str = 'movers', model: str = Config.PLANNER_MODEL,
+                 sink: Optional[UserStateSink] = None):
+        self.llm = chat_model(model, "strategist")
         self.user_id = user_id
         self.service_category = service_category
+        self.sink = sink or sink_for(user_id)
         
         # Determine database path based on service category
         database_paths = {
@@ -30,6 +29,9 @@ class StrategistAgent:
         }
         
         database_path = database_paths.get(service_category, './agents/movers_database.csv')
+
+        # pandas is only needed once the strategist is built, keep it off the app import path
+        import pandas as pd
         
         try:
             self.providers_db = pd.read_csv(database_path)
@@ -42,46 +44,40 @@ class StrategistAgent:
             print("Falling back to movers database")
             self.providers_db = pd.read_csv('./agents/movers_database.csv')
 
+        # Built once per category, so every job sends the same prompt prefix
+        self.providers = self.providers_db.to_dict('records')
+        self.providers_text = render_providers(self.providers)
+        self.strategy_chain = strategist_prompt(service_category) | self.llm
+        self.filter_chain = provider_filter_prompt(service_category) | self.llm.with_structured_output(FilteredMovers)
+
     def __call__(self, state: Dict) -> Dict:
-        customer_info = state["customer_info"]
-        selected_providers = self._get_providers_data(customer_info)
+        """Both strategist steps in one go; the graph runs them as parallel branches instead."""
+        return {**self.select_providers(state), **self.plan_strategy(state)}
 
-        # Load service-specific strategist prompt
-        strategist_prompt = prompt_manager.get_prompt(self.service_category, 'strategist_system')
+    def select_providers(self, state: Dict) -> Dict:
+        """Graph node: filter the provider database for the customer."""
+        providers = self._get_providers_data(state["customer_info"])
+        return {"selected_movers": blob_store.put(providers)}  # Keep the key name for backward compatibility
 
-        # add prompt and construct the chain
-        self.prompt = ChatPromptTemplate.from_messages([
-            ("system", strategist_prompt),
-            ("human", "Generate a concise instruction for guiding the voice agent to negotiate with the service provider through a phone call. Make sure to include the customer information {customer_info}."),
-        ])
-        chain = self.prompt | self.llm
-        response = chain.invoke({"customer_info": customer_info})
+    def plan_strategy(self, state: Dict) -> Dict:
+        """Graph node: write the negotiation strategy, which doesn't depend on the providers."""
+        customer_info = state["customer_info"]
+        response = self.strategy_chain.invoke({"customer_info": customer_info})
 
-        firebase.update_data(self.user_id, { "strategy": response.content })
+        self.sink.update({ "strategy": response.content })
 
         print(f"Negotiation strategy: {response.content}")
 
-        state["selected_movers"] = selected_providers  # Keep the key name for backward compatibility
-        state["negotiation_strategy"] = response
-        state["customer_info"] = customer_info
-
-        return state
+        return {"negotiation_strategy": blob_store.put(response.content)}
 
 
     #TODO: Implementation to read and format providers data from CSV, could use create_pandas_dataframe_agent
     def _get_providers_data(self, customer_info: CustomerInfo) -> List[Dict]:
 
-        providers = self.providers_db.to_dict('records')
-        
-        # Load service-specific filter prompt
-        filter_prompt_text = prompt_manager.get_prompt(self.service_category, 'provider_filter')
-        
-        filter_prompt = ChatPromptTemplate.from_messages([
-            ("system", filter_prompt_text),
-            ("human", "Filter the list of providers: {movers} based on the customer information {customer_info}."),
-        ])
-        chain = filter_prompt | self.llm.with_structured_output(FilteredMovers)
-        response: FilteredMovers = chain.invoke({ "customer_info": customer_info, "movers": providers })
+        providers = self.providers
+
+        # The provider list is the same for every job of the category and comes first in the prompt
+        response: FilteredMovers = self.filter_chain.invoke({ "movers": self.providers_text, "customer_info": customer_info })
         print("Filtered Providers: ", response)
 
 
@@ -92,5 +88,5 @@ class StrategistAgent:
 
         filtered_providers = [provider for provider in providers if provider["name"] in response.movers]
 
-        firebase.update_data(self.user_id, { "movers": filtered_providers, "moverRationale": response.rationale })
+        self.sink.update({ "movers": filtered_providers, "moverRationale": response.rationale })
         return filtered_providers
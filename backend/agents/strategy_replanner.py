@@ -0,0 +1,150 @@
+import re
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional
+
+from .config import Config
+from .llm import chat_model
+from .state_models import NegotiationState, CompetitorOffer
+from .prompt_layout import replanner_prompt
+
+PRICE_PATTERN = re.compile(r"\$\s?(\d{1,3}(?:,\d{3})+|\d+)(?:\.(\d{1,2}))?")
+QUOTE_KEYWORDS = ("final", "negotiated", "quote", "total", "price", "offer")
+# Amounts that are not the price of the whole job: rates, deposits and add-on fees
+NON_TOTAL_PATTERN = re.compile(
+    r"/\s*(?:hr|hour|h|mile|day)\b|\bper\s+(?:hour|hr|mover|man|mile|day|item)\b|\ban hour\b|\bhourly\b"
+    r"|\bdeposit|\bfees?\b|\bsurcharge",
+    re.IGNORECASE,
+)
+# Splits a line into the clauses a price belongs to; a bare comma is a thousands separator
+CLAUSE_SEPARATOR = re.compile(r";|,\s|\s[-–—]\s|\(|\)|\bplus\b|\band\b|\bwith\b|\bbut\b", re.IGNORECASE)
+CONCESSION_KEYWORDS = ("discount", "free", "waive", "complimentary", "match", "included", "no extra", "no additional")
+MAX_CONCESSIONS = 8
+
+@dataclass
+class ReplannerStats:
+    llm_calls: int = 0
+    skipped_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "total_tokens": self.total_tokens}
+
+def _parse_prices(text: str) -> List[float]:
+    return [float(whole.replace(",", "") + "." + (cents or "0")) for whole, cents in PRICE_PATTERN.findall(text)]
+
+def _total_prices(line: str) -> List[float]:
+    """The prices of a line that can be a job total, leaving out hourly rates, deposits and fees."""
+    prices = []
+    for clause in CLAUSE_SEPARATOR.split(line):
+        if not NON_TOTAL_PATTERN.search(clause):
+            prices.extend(_parse_prices(clause))
+    return prices
+
+def extract_offer(summary: str) -> Optional[float]:
+    """
+    Extracts the best price offered in a call summary.
+
+    Summaries put prices in bold bullet points, so lines that talk about the quote
+    (final, negotiated, total, ...) are preferred over other lines. Only total or flat
+    amounts count: hourly rates, deposits and fees are never an offer, even on a quote line.
+
+    Args:
+        summary (str): The call summary to parse
+
+    Returns:
+        Optional[float]: The lowest quoted price, or None if the summary has no price
+    """
+    quote_prices = []
+    other_prices = []
+    for line in summary.splitlines():
+        prices = _total_prices(line)
+        if not prices:
+            continue
+        if any(keyword in line.lower() for keyword in QUOTE_KEYWORDS):
+            quote_prices.extend(prices)
+        else:
+            other_prices.extend(prices)
+
+    prices = quote_prices or other_prices
+    return min(prices) if prices else None
+
+def extract_concessions(summary: str) -> List[str]:
+    concessions = []
+    for line in summary.splitlines():
+        cleaned = line.strip().lstrip("-*• ").replace("**", "").strip()
+        if cleaned and any(keyword in cleaned.lower() for keyword in CONCESSION_KEYWORDS):
+            concessions.append(cleaned)
+    return concessions
+
+class StrategyReplanner:
+    """
+    Incrementally adapts the negotiation strategy between provider calls.
+
+    Instead of re-sending every previous call summary, a compact NegotiationState is
+    folded forward from the newest summary only, and the LLM is only asked for a new
+    strategy when the latest call produced a better offer than anything seen before.
+    """
+
+    def __init__(self, service_category: str = 'movers', model: str = Config.ANALYST_MODEL):
+        self.llm = chat_model(model, "strategy_replanner")
+        self.service_category = service_category
+
+        self.prompt = replanner_prompt(service_category)
+        self.reset()
+
+    def reset(self):
+        """Start a new job with an empty negotiation state and fresh token counters."""
+        self.state = NegotiationState()
+        self.stats = ReplannerStats()
+
+    def update(self, provider_name: str, summary: str) -> bool:
+        """
+        Folds the newest call summary into the negotiation state.
+
+        Returns:
+            bool: True if the call produced a better offer than the previous best
+        """
+        price = extract_offer(summary or "")
+        self.state.competitor_offers.append(CompetitorOffer(provider=provider_name, price=price))
+
+        for concession in extract_concessions(summary or ""):
+            if concession not in self.state.concessions:
+                self.state.concessions.append(concession)
+        self.state.concessions = self.state.concessions[-MAX_CONCESSIONS:]
+
+        if price is None:
+            return False
+        if self.state.best_price is None or price < self.state.best_price:
+            self.state.best_price = price
+            self.state.best_provider = provider_name
+            return True
+        return False
+
+    def replan(self, provider_name: str, summary: str, strategy: str) -> str:
+        """
+        Returns the strategy for the next call, calling the LLM only if the latest
+        call improved on the best offer so far.
+        """
+        if not self.update(provider_name, summary):
+            self.stats.skipped_calls += 1
+            print("Replanner: no better offer, keeping the current strategy")
+            return strategy
+
+        chain = self.prompt | self.llm
+        response = chain.invoke({
+            "strategy": strategy,
+            "negotiation_state": self.state.model_dump_json(exclude_none=True),
+            "summary": summary,
+        })
+
+        self.stats.llm_calls += 1
+        usage = getattr(response, "usage_metadata", None) or {}
+        self.stats.input_tokens += usage.get("input_tokens", 0)
+        self.stats.output_tokens += usage.get("output_tokens", 0)
+
+        return response.content
@@ -0,0 +1,196 @@
+"""
+Call transcripts stored as append-only, timestamped segments.
+
+A segment is `[at_ms, speaker, text]`, where at_ms is the offset from the start of the
+call and speaker is AGENT (our Realtime assistant) or PROVIDER (the person who picked
+up). Segments go to chunk documents under users/{uid}/calls/{sid}/transcript/, one
+merge write per segment, so a live call never rewrites what it already stored. Once
+a chunk holds `chunk_size` segments it is sealed. When compression is on, the sealed
+chunk is rewritten as one zlib blob, so only long calls end up compressed. The writer
+keeps just the open chunk in memory.
+
+`iter_transcript` streams the segments back chunk by chunk, and `format_for_summary`
+renders only the speaker turns the summarizer needs.
+
+Run `python -m agents.transcripts` to compare payload sizes and summarizer prompt
+tokens with the previous whole-list transcript.
+"""
+
+import json
+import time
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from . import firebase
+from .config import Config
+
+AGENT = "a"
+PROVIDER = "p"
+# Roles as the Realtime API reports them: the model is the assistant, the callee the user
+ROLE_SPEAKERS = {"assistant": AGENT, "user": PROVIDER}
+SPEAKER_LABELS = {AGENT: "Agent", PROVIDER: "Provider"}
+
+ZLIB = "zlib"
+
+class Segment(NamedTuple):
+    at_ms: int
+    speaker: str
+    text: str
+
+def encode_chunk(segments: List[Segment], compress: bool = False) -> Dict:
+    """The chunk document for a sealed chunk."""
+    if not compress:
+        return {f"{index:03d}": list(segment) for index, segment in enumerate(segments)}
+    lines = "\n".join(json.dumps(list(segment), ensure_ascii=False, separators=(",", ":")) for segment in segments)
+    return {"codec": ZLIB, "count": len(segments), "data": zlib.compress(lines.encode("utf-8"), 6)}
+
+def decode_chunk(doc: Dict) -> List[Segment]:
+    if doc.get("codec") == ZLIB:
+        lines = zlib.decompress(doc["data"]).decode("utf-8").splitlines()
+        return [Segment(*json.loads(line)) for line in lines]
+    return [Segment(*doc[key]) for key in sorted(doc)]
+
+class TranscriptWriter:
+    """Appends the segments of one live call."""
+
+    def __init__(self, user_id: str, call_sid: str, started_at_ms: Optional[float] = None,
+                 chunk_size: int = Config.TRANSCRIPT_CHUNK_SEGMENTS, compress: bool = Config.TRANSCRIPT_COMPRESS,
+                 on_segment: Optional[Callable[[Segment], None]] = None):
+        """
+        Args:
+            user_id: Owner of the call
+            call_sid: Twilio call SID
+            started_at_ms: Epoch ms that segment offsets count from, defaults to now
+            chunk_size: Segments per chunk document
+            compress: Rewrite sealed chunks as a zlib blob
+            on_segment: Called with every appended segment, e.g. by a live summarizer
+        """
+        self.user_id = user_id
+        self.call_sid = call_sid
+        self.started_at_ms = started_at_ms or time.time() * 1000
+        self.chunk_size = chunk_size
+        self.compress = compress
+        self.on_segment = on_segment
+        self.chunk = 0
+        self._open: List[Segment] = []
+        self.segments = 0
+        self.bytes_written = 0
+
+    async def append(self, role: str, text: str) -> Segment:
+        segment = Segment(round(time.time() * 1000 - self.started_at_ms), ROLE_SPEAKERS.get(role, role), text)
+        index = len(self._open)
+        self._open.append(segment)
+        self.segments += 1
+        update = {f"{index:03d}": list(segment)}
+        self.bytes_written += len(json.dumps(update))
+        await firebase.update_transcript_chunk_async(self.user_id, self.call_sid, self.chunk, update)
+        if self.on_segment is not None:
+            self.on_segment(segment)
+        if len(self._open) >= self.chunk_size:
+            await self._seal()
+        return segment
+
+    async def _seal(self):
+        if self.compress:
+            doc = encode_chunk(self._open, compress=True)
+            self.bytes_written += len(doc["data"])
+            await firebase.update_transcript_chunk_async(self.user_id, self.call_sid, self.chunk, doc, merge=False)
+        self.chunk += 1
+        self._open = []
+
+    async def close(self) -> Dict:
+        """Record the transcript's shape on the call document once the call is over."""
+        stats = {"segments": self.segments, "chunks": self.chunk + (1 if self._open else 0), "bytesWritten": self.bytes_written}
+        await firebase.update_call_data_async(self.user_id, self.call_sid, {"transcript": stats})
+        return stats
+
+def iter_transcript(user_id: str, call_sid: str, get_chunk=None) -> Iterator[Segment]:
+    """Stream a stored transcript segment by segment, reading one chunk document at a time."""
+    get_chunk = get_chunk or firebase.get_transcript_chunk
+    chunk = 0
+    while True:
+        doc = get_chunk(user_id, call_sid, chunk)
+        if not doc:
+            return
+        yield from decode_chunk(doc)
+        chunk += 1
+
+def format_for_summary(segments: Iterable[Segment]) -> str:
+    """
+    Render the conversation as `Speaker: text` lines, joining consecutive segments of
+    the same speaker and leaving out timestamps and call metadata.
+    """
+    lines = []
+    speaker = None
+    for segment in segments:
+        text = segment.text.strip()
+        if not text:
+            continue
+        if segment.speaker == speaker:
+            lines[-1] += " " + text
+        else:
+            speaker = segment.speaker
+            lines.append(f"{SPEAKER_LABELS.get(speaker, speaker)}: {text}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import random
+    import sys
+
+    from .firestore_async import InMemoryAsyncFirestore
+
+    parser = argparse.ArgumentParser(description="Transcript payloads and summarizer tokens, whole-list vs segments")
+    parser.add_argument("--turns", type=int, nargs="*", default=[20, 100, 400])
+    args = parser.parse_args()
+
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding("o200k_base")
+        count_tokens = lambda text: len(encoding.encode(text))
+    except Exception:
+        count_tokens = lambda text: len(text) // 4
+
+    rng = random.Random(11)
+    words = ("we can do the move on the tenth for about twelve hundred dollars including packing "
+             "materials two movers and a truck would that work for you I would need the inventory first").split()
+
+    def utterance():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(6, 30))).capitalize() + "."
+
+    async def run(turns: int):
+        store = InMemoryAsyncFirestore()
+        firebase.set_async_client(store)
+        roles = ["assistant" if turn % 2 == 0 else "user" for turn in range(turns)]
+        texts = [utterance() for _ in range(turns)]
+
+        # Before: a list of {role, message} rewritten whole on every new line
+        old_list, old_written = [], 0
+        for role, text in zip(roles, texts):
+            old_list.append({"role": role, "message": text})
+            old_written += len(json.dumps({"status": "CALL_INPROGRESS", "transcripts": old_list}))
+        old_doc = {"status": "CALL_COMPLETED", "transcripts": old_list,
+                   "timeline": {"dialToPickupMs": 4200.0, "pickupToFirstAudioMs": 850.0, "turnGapsMs": [700.0] * (turns // 2)}}
+        old_prompt = str(old_doc)
+
+        writer = TranscriptWriter("bench", "CAbench", chunk_size=Config.TRANSCRIPT_CHUNK_SEGMENTS, compress=True)
+        for role, text in zip(roles, texts):
+            await writer.append(role, text)
+        await writer.close()
+        await firebase.get_async_writer().flush()
+
+        stored = {path: doc for path, doc in store.documents.items() if "/transcript/" in path}
+        stored_bytes = sum(len(doc["data"]) if doc.get("codec") else len(json.dumps(doc)) for doc in stored.values())
+        get_chunk = lambda user_id, call_sid, chunk: store.documents.get(firebase._transcript_chunk_path(user_id, call_sid, chunk))
+        segments = list(iter_transcript("bench", "CAbench", get_chunk))
+        assert [segment.text for segment in segments] == texts
+        new_prompt = format_for_summary(segments)
+
+        print(f"{turns:>4} turns | written {old_written / 1024:8.1f} KB -> {writer.bytes_written / 1024:6.1f} KB"
+              f" | stored {len(json.dumps(old_list)) / 1024:6.1f} KB -> {stored_bytes / 1024:6.1f} KB"
+              f" | summarizer tokens {count_tokens(old_prompt):6d} -> {count_tokens(new_prompt):6d}", file=sys.stderr)
+
+    for turns in args.turns:
+        asyncio.run(run(turns))
@@ -0,0 +1,328 @@
+"""
+Voice-activity detection on the callee's audio, in the relay.
+
+Twilio streams 20 ms μ-law frames whether the callee talks or not, and the relay
+used to forward all of them, so the Realtime API billed and processed the silences
+too. The only barge-in signal was the server's `speech_started`, which arrives a
+network round trip after the speech detection itself.
+
+Frames are decoded with a 256-entry NumPy lookup table. Each frame is then
+classified from its energy relative to an adaptive noise floor and its zero-crossing
+rate: voiced speech crosses zero far less often than hiss. VoiceActivityDetector
+reports speech once `attack_ms` of consecutive speech-like frames arrived, and the
+end of speech after `hangover_ms` without any. SilenceFilter uses that to forward,
+thin (one frame in `thin_every`) or drop the frames outside speech. It keeps a short
+pre-roll of the dropped frames and sends it ahead of the next speech frames, so the
+server still hears the onset. The hangover must stay longer than the server VAD's
+silence duration (500 ms), or the server never sees the end of the turn.
+
+With MEDIA_VAD on, a local speech start during assistant audio runs the relay's
+barge-in handling (truncate, clear, response.cancel) without waiting for the server.
+
+Run `python -m agents.vad` to benchmark the decoder and the detector's accuracy,
+onset latency and suppressed frames. It runs on synthetic speech with known
+segments, or on a recorded call: `--twilio` Twilio media JSONL, with the server's
+speech events from `--realtime` Realtime JSONL as the reference.
+"""
+
+import base64
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List
+
+import numpy as np
+
+FORWARD = "forward"
+THIN = "thin"
+DROP = "drop"
+SILENCE_MODES = (FORWARD, THIN, DROP)
+
+SAMPLE_RATE = 8000
+
+def _mulaw_table() -> np.ndarray:
+    """Linear 16-bit value of every μ-law byte (G.711)."""
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.int16)
+
+MULAW_TABLE = _mulaw_table()
+
+def decode_mulaw(data: bytes) -> np.ndarray:
+    return MULAW_TABLE[np.frombuffer(data, dtype=np.uint8)]
+
+# Largest biased 14-bit magnitude of each μ-law segment
+MULAW_SEGMENT_ENDS = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF], dtype=np.int32)
+
+def encode_mulaw(samples: np.ndarray) -> bytes:
+    """μ-law bytes of 16-bit linear samples (G.711), byte for byte what audioop.lin2ulaw produced."""
+    value = samples.astype(np.int32) >> 2
+    mask = np.where(value < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(value), 8159) + 33
+    segment = np.searchsorted(MULAW_SEGMENT_ENDS, magnitude)
+    code = np.where(segment >= 8, 0x7F, (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F))
+    return (code ^ mask).astype(np.uint8).tobytes()
+
+def frame_features(samples: np.ndarray):
+    """Energy in dBFS and zero-crossing rate (crossings per sample) of a frame."""
+    x = samples.astype(np.float32)
+    energy_db = 10 * np.log10(np.mean(x * x) / 32768.0 ** 2 + 1e-10)
+    zcr = np.count_nonzero(np.signbit(x[1:]) != np.signbit(x[:-1])) / max(1, len(x) - 1)
+    return float(energy_db), float(zcr)
+
+@dataclass(slots=True)
+class VadDecision:
+    speech_like: bool
+    # Inside speech, or in the attack or hangover around it: the frame should reach the server
+    active: bool
+    started: bool = False
+    stopped: bool = False
+
+class VoiceActivityDetector:
+    def __init__(self, frame_ms: int = 20, attack_ms: int = 60, hangover_ms: int = 800,
+                 margin_db: float = 6.0, min_speech_db: float = -45.0, max_zcr: float = 0.4):
+        """
+        Args:
+            frame_ms: Duration of the frames Twilio sends
+            attack_ms: Consecutive speech-like audio before speech is reported
+            hangover_ms: Audio without speech before its end is reported
+            margin_db: How far above the noise floor a speech frame is
+            min_speech_db: Quietest frame counted as speech, whatever the noise floor
+            max_zcr: Highest zero-crossing rate of a speech frame
+        """
+        self.attack_frames = max(1, attack_ms // frame_ms)
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.margin_db = margin_db
+        self.min_speech_db = min_speech_db
+        self.max_zcr = max_zcr
+        self.noise_floor_db = -60.0
+        self.in_speech = False
+        self._run = 0
+        self._quiet = 0
+
+    def _speech_like(self, energy_db: float, zcr: float) -> bool:
+        return energy_db > max(self.noise_floor_db + self.margin_db, self.min_speech_db) and zcr < self.max_zcr
+
+    def _track_noise(self, energy_db: float):
+        # Follow a falling floor quickly and a rising one slowly, so speech doesn't lift it
+        rate = 0.3 if energy_db < self.noise_floor_db else 0.02
+        self.noise_floor_db = max(-70.0, self.noise_floor_db + rate * (energy_db - self.noise_floor_db))
+
+    def push_samples(self, samples: np.ndarray) -> VadDecision:
+        energy_db, zcr = frame_features(samples)
+        speech_like = self._speech_like(energy_db, zcr)
+        if not speech_like:
+            self._track_noise(energy_db)
+
+        started = stopped = False
+        if speech_like:
+            self._run += 1
+            self._quiet = 0
+            if not self.in_speech and self._run >= self.attack_frames:
+                self.in_speech = started = True
+        else:
+            self._run = 0
+            if self.in_speech:
+                self._quiet += 1
+                if self._quiet >= self.hangover_frames:
+                    self.in_speech = False
+                    stopped = True
+        return VadDecision(speech_like, self.in_speech or speech_like or stopped, started, stopped)
+
+    def push(self, payload: str) -> VadDecision:
+        """Classify a base64 μ-law frame from Twilio."""
+        return self.push_samples(decode_mulaw(base64.b64decode(payload)))
+
+class SilenceFilter:
+    def __init__(self, mode: str = THIN, thin_every: int = 5, preroll_frames: int = 10):
+        """
+        Args:
+            mode: One of SILENCE_MODES, for frames outside speech
+            thin_every: In THIN mode, one silence frame in this many is forwarded
+            preroll_frames: Dropped frames kept to send ahead of the next speech frames
+        """
+        if mode not in SILENCE_MODES:
+            raise ValueError(f"Unknown silence mode: {mode}")
+        self.mode = mode
+        self.thin_every = thin_every
+        self._preroll: Deque[str] = deque(maxlen=preroll_frames)
+        self._silent = 0
+        self.forwarded = 0
+        self.suppressed = 0
+
+    def push(self, payload: str, active: bool) -> List[str]:
+        """The frames to forward now, in order; empty while silence is held back."""
+        if active or self.mode == FORWARD:
+            self._silent = 0
+            frames = list(self._preroll) + [payload]
+            self.suppressed -= len(self._preroll)
+            self._preroll.clear()
+        else:
+            self._silent += 1
+            if self.mode == THIN and (self._silent - 1) % self.thin_every == 0:
+                frames = [payload]
+                self._preroll.clear()
+            else:
+                self._preroll.append(payload)
+                self.suppressed += 1
+                return []
+        self.forwarded += len(frames)
+        return frames
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import random
+    import sys
+    import time
+
+    parser = argparse.ArgumentParser(description="μ-law decoding speed and VAD accuracy, latency and suppressed frames")
+    parser.add_argument("--twilio", help="JSONL of captured Twilio media-stream messages (inbound audio)")
+    parser.add_argument("--realtime", help="JSONL of the call's Realtime events; speech_started/stopped are the reference")
+    parser.add_argument("--server-prefix-ms", type=int, default=300,
+                        help="prefix_padding_ms of the server VAD, added back to its audio_start_ms")
+    parser.add_argument("--seconds", type=int, default=120, help="Synthetic call audio")
+    parser.add_argument("--snr-db", type=float, nargs="*", default=[30, 20, 10])
+    parser.add_argument("--attack-ms", type=int, default=60)
+    parser.add_argument("--hangover-ms", type=int, default=800)
+    args = parser.parse_args()
+
+    FRAME_MS = 20
+    FRAME_BYTES = SAMPLE_RATE * FRAME_MS // 1000
+
+    def synthetic_call(seconds: int, snr_db: float, seed: int = 11):
+        """Voiced bursts (harmonics of a wandering pitch, syllable envelope) between pauses, over noise."""
+        rng = np.random.default_rng(seed)
+        pyrng = random.Random(seed)
+        t = np.arange(seconds * SAMPLE_RATE) / SAMPLE_RATE
+        speech = np.zeros_like(t)
+        segments, position = [], pyrng.uniform(0.5, 2.0)
+        while position < seconds - 1:
+            length = pyrng.uniform(0.4, 3.5)
+            start, end = int(position * SAMPLE_RATE), int(min(seconds, position + length) * SAMPLE_RATE)
+            tt = t[start:end] - t[start]
+            pitch = pyrng.uniform(95, 230) * (1 + 0.08 * np.sin(2 * np.pi * 0.7 * tt))
+            phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+            voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+            envelope = 0.55 + 0.45 * np.sin(2 * np.pi * pyrng.uniform(3, 5) * tt) ** 2
+            speech[start:end] = voiced * envelope
+            segments.append((start * 1000 // SAMPLE_RATE, end * 1000 // SAMPLE_RATE))
+            position += length + pyrng.uniform(0.6, 4.0)
+        speech *= 0.25 * 32767 / np.max(np.abs(speech))
+        speech_power = np.mean(speech[speech != 0] ** 2)
+        noise = rng.normal(0, np.sqrt(speech_power / 10 ** (snr_db / 10)), len(t))
+        linear = np.clip(speech + noise, -32768, 32767).astype(np.int16)
+        return encode_mulaw(linear), segments
+
+    def recorded_call():
+        audio = bytearray()
+        with open(args.twilio) as f:
+            for line in f:
+                event = json.loads(line)
+                if event.get("event") == "media" and event["media"].get("track", "inbound") == "inbound":
+                    audio += base64.b64decode(event["media"]["payload"])
+        segments, start = [], None
+        if args.realtime:
+            with open(args.realtime) as f:
+                for line in f:
+                    event = json.loads(line)
+                    if event.get("type") == "input_audio_buffer.speech_started":
+                        start = event["audio_start_ms"] + args.server_prefix_ms
+                    elif event.get("type") == "input_audio_buffer.speech_stopped" and start is not None:
+                        segments.append((start, event["audio_end_ms"]))
+                        start = None
+        return bytes(audio), segments
+
+    def labels(segments, frames: int) -> np.ndarray:
+        speech = np.zeros(frames, dtype=bool)
+        for start, end in segments:
+            speech[start // FRAME_MS:end // FRAME_MS] = True
+        return speech
+
+    def python_decode(data: bytes) -> List[int]:
+        out = []
+        for byte in data:
+            code = ~byte & 0xFF
+            magnitude = ((((code & 0x0F) << 3) + 0x84) << ((code >> 4) & 0x07)) - 0x84
+            out.append(-magnitude if code & 0x80 else magnitude)
+        return out
+
+    def bench_decoder(audio: bytes):
+        decoders = [("python loop", python_decode), ("numpy table", decode_mulaw)]
+        try:
+            import audioop  # Removed in Python 3.13
+        except ImportError:
+            pass
+        else:
+            assert decode_mulaw(audio).tobytes() == audioop.ulaw2lin(audio, 2), "table differs from audioop"
+            decoders.append(("audioop (C)", lambda frame: audioop.ulaw2lin(frame, 2)))
+        frames = [audio[i:i + FRAME_BYTES] for i in range(0, len(audio) - FRAME_BYTES + 1, FRAME_BYTES)]
+        audio_seconds = len(audio) / SAMPLE_RATE
+        for name, decode in decoders:
+            sample = frames if name != "python loop" else frames[:len(frames) // 10]
+            started = time.perf_counter()
+            for frame in sample:
+                decode(frame)
+            per_frame = (time.perf_counter() - started) / len(sample)
+            print(f"decode {name:<12} {per_frame * 1e6:7.2f} µs per 20 ms frame "
+                  f"({per_frame * len(frames) / audio_seconds * 100:.3f}% of a core per call)", file=sys.stderr)
+
+    def bench_vad(name: str, audio: bytes, segments):
+        payloads = [base64.b64encode(audio[i:i + FRAME_BYTES]).decode("ascii")
+                    for i in range(0, len(audio) - FRAME_BYTES + 1, FRAME_BYTES)]
+        truth = labels(segments, len(payloads))
+        vad = VoiceActivityDetector(FRAME_MS, args.attack_ms, args.hangover_ms)
+        detected = np.zeros(len(payloads), dtype=bool)
+        onsets = []
+        started_cpu = time.process_time()
+        decisions = []
+        for index, payload in enumerate(payloads):
+            decision = vad.push(payload)
+            decisions.append(decision)
+            detected[index] = vad.in_speech
+            if decision.started:
+                onsets.append(index * FRAME_MS + FRAME_MS)
+            if decision.stopped:
+                # Speech ended where the hangover began
+                detected[max(0, index - vad.hangover_frames + 1):index + 1] = False
+        cpu_per_frame = (time.process_time() - started_cpu) / len(payloads)
+
+        true_positive = np.count_nonzero(detected & truth)
+        precision = true_positive / max(1, np.count_nonzero(detected))
+        recall = true_positive / max(1, np.count_nonzero(truth))
+        # Onset latency: from each reference segment's start to the first local start inside it
+        latencies, missed = [], 0
+        for start, end in segments:
+            hits = [onset for onset in onsets if start <= onset <= end + args.hangover_ms]
+            if hits:
+                latencies.append(hits[0] - start)
+            else:
+                missed += 1
+        false_starts = sum(1 for onset in onsets if not any(start <= onset <= end + args.hangover_ms for start, end in segments))
+        lat = np.percentile(latencies, [50, 95]) if latencies else (float("nan"),) * 2
+        print(f"{name:<16} precision {precision:6.1%} recall {recall:6.1%} | onsets {len(segments) - missed}/{len(segments)}"
+              f" found, {false_starts} false | onset latency p50 {lat[0]:4.0f} ms p95 {lat[1]:4.0f} ms"
+              f" | {cpu_per_frame * 1e6:5.1f} µs CPU/frame", file=sys.stderr)
+        for mode in (THIN, DROP):
+            gate = SilenceFilter(mode)
+            for payload, decision in zip(payloads, decisions):
+                gate.push(payload, decision.active)
+            print(f"{'':<16} silence {mode:<4}: {gate.suppressed / len(payloads):6.1%} of frames not sent upstream",
+                  file=sys.stderr)
+
+    if args.twilio:
+        audio, segments = recorded_call()
+        bench_decoder(audio)
+        if not segments:
+            print("No reference speech events (--realtime); reporting suppression only", file=sys.stderr)
+        bench_vad("recording", audio, segments)
+    else:
+        for index, snr_db in enumerate(args.snr_db):
+            audio, segments = synthetic_call(args.seconds, snr_db)
+            if index == 0:
+                print(f"{args.seconds} s synthetic call, {len(segments)} speech segments, "
+                      f"{sum(end - start for start, end in segments) / 1000 / args.seconds:.0%} speech", file=sys.stderr)
+                bench_decoder(audio)
+            bench_vad(f"SNR {snr_db:g} dB", audio, segments)
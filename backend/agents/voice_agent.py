@@ -1,28 +1,20 @@
 import os
-import json
-import base64
-import asyncio
-import websockets
-from fastapi import FastAPI, WebSocket, Request
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.websockets import WebSocketDisconnect
-from fastapi import BackgroundTasks
-# from twilio.twiml.voice_response import VoiceResponse, Connect, Say, Stream
-from twilio.twiml.voice_response import VoiceResponse, Gather, Connect, Say, Stream
-from twilio.rest import Client
-from dotenv import load_dotenv
-
-from typing import Dict, List
-from langchain_openai import ChatOpenAI
+import time
+from typing import Dict, List, Optional
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
-from voice_server import check_call_status, get_call_data, initiate_call_with_prompt
+from langchain_core.messages import AIMessage
+from voice_server import dial_and_wait, get_call_summary, get_call_transcript, initiate_call_with_prompt
 from .config import Config
+from .llm import chat_model
 from .state_models import State
-from . import firebase
-from ..prompts.prompt_manager import prompt_manager
-import time
-import asyncio
+from .strategy_replanner import StrategyReplanner
+from .quote_cache import QuoteCache, job_signature
+from .prompt_layout import call_summary_prompt, simulation_company, simulation_prompt, voice_instructions
+from .provider_simulator import TemplateSimulator
+from . import blob_store, firebase
+from .cancellation import check_cancelled, current_token
+from .state_sink import UserStateSink, sink_for
+from prompts.prompt_manager import prompt_manager
 
 # voice agent proxy for debugging
 def voice_agent_message(state: State):
@@ -36,8 +28,6 @@ def voice_agent_message(state: State):
         ]
     }
 
-twilio_client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
-
 VOICE = 'alloy'
 LOG_EVENT_TYPES = [
     'error', 'response.content.done', 'rate_limits.updated',
@@ -48,10 +38,19 @@ LOG_EVENT_TYPES = [
 SHOW_TIMING_MATH = False
 
 class VoiceAgent:
-    def __init__(self, user_id, service_category: str = 'movers', model: str = Config.VOICE_MODEL):
-        self.llm = ChatOpenAI(model=model)
+    def __init__(self, user_id, service_category: str = 'movers', model: str = Config.VOICE_MODEL, call_listener=None,
+                 sink: Optional[UserStateSink] = None):
+        """
+        Args:
+            sink: The session's state sink; defaults to the user's shared one
+            call_listener: Told about a job's calls as they finish, e.g. the AnalystAgent:
+                `begin(customer_info)` before the first call, then `add_call(provider_name, transcript, summary)`
+        """
+        self.llm = chat_model(model, "call_simulation")
+        self.summary_llm = chat_model(Config.ANALYST_MODEL, "call_summary")
         self.user_id = user_id
         self.service_category = service_category
+        self.sink = sink or sink_for(user_id)
         
         # Load service-specific voice prompts
         voice_prompt = prompt_manager.get_prompt(service_category, 'voice_system')
@@ -60,23 +59,36 @@ class VoiceAgent:
             ("system", voice_prompt),
             ("human", "Customer Info: {customer_info}\nNegotiation Strategy: {strategy}\nMover: {mover}")
         ])
+        self.replanner = StrategyReplanner(service_category)
+        self.quote_cache = QuoteCache()
+        self.call_listener = call_listener
+        self.simulator = None
+        if Config.SIMULATOR_BACKEND == "template":
+            self.simulator = TemplateSimulator(Config.SIMULATOR_SEED, Config.SIMULATOR_LATENCY_MS)
         print("Exiting VoiceAgent.__init__")
 
     def __call__(self, state: Dict) -> Dict:
         print("Entering VoiceAgent.__call__")
+        # The dialer serves calls of older jobs first
+        job_started = time.time()
         customer_info = state["customer_info"]
-        strategy = state["negotiation_strategy"]
-        movers = state["selected_movers"]
+        strategy = blob_store.deref(state["negotiation_strategy"])
+        # Checkpoints from before the blob store hold the strategy message itself
+        strategy = getattr(strategy, "content", strategy)
+        movers = blob_store.deref(state["selected_movers"], [])
 
         print(f"Movers: {movers}")
 
         transcripts = []
         summary_of_calls = []
-        strategies = [strategy.content]
+        strategies = [strategy]
+        self.replanner.reset()
+        if self.call_listener is not None:
+            self.call_listener.begin(customer_info)
 
         # firebase.update_status(self.user_id, firebase.AppStatus.NEGOTIATING)
 
-        firebase.update_data(self.user_id, {
+        self.sink.update({
             "status": firebase.AppStatus.NEGOTIATING,
             "strategies": strategies,
             "transcripts": transcripts,
@@ -85,20 +97,41 @@ class VoiceAgent:
 
         # Check if we should use simulation mode or real calls
         use_simulation = os.getenv('USE_SIMULATION_MODE', 'true').lower() == 'true'
-        
-        for mover in movers:
+
+        # Quotes from comparable jobs of other users replace or reorder real calls; simulated quotes aren't shared,
+        # and neither are those of jobs too vague to have a signature
+        signature = job_signature(self.service_category, customer_info)
+        use_quote_cache = Config.QUOTE_CACHE and not use_simulation and signature is not None
+        self.quote_cache.reset_stats()
+        ordered_movers = [(mover, None) for mover in movers]
+        if use_quote_cache:
+            try:
+                ordered_movers = self.quote_cache.prioritize(movers, signature)
+            except Exception as e:
+                print(f"Quote cache unavailable: {e}")
+                use_quote_cache = False
+
+        previous_mover = None
+        for mover, cached_quote in ordered_movers:
+            check_cancelled()
             # Simulate phone call with each mover, do the phone call here
-            # Modify the strategy based on the summary of the calls
+            # Modify the strategy based on the summary of the latest call
             if len(summary_of_calls) > 0:
-                strategy = self._modify_strategy(summary_of_calls, strategy)
-
-                strategies.append(strategy)
-                firebase.update_data(self.user_id, {
-                    "strategies": strategies,
-                })
+                new_strategy = self._modify_strategy(previous_mover['name'], summary_of_calls[-1], strategy)
+
+                if new_strategy != strategy:
+                    strategy = new_strategy
+                    strategies.append(strategy)
+                    self.sink.update({
+                        "strategies": strategies,
+                    })
+            previous_mover = mover
             
             try:
-                if use_simulation:
+                if cached_quote is not None and cached_quote.confidence >= self.quote_cache.min_confidence:
+                    print(f"QUOTE CACHE: Using a cached quote for {mover['name']} instead of calling")
+                    call_transcript, summary_of_call = None, cached_quote.summary()
+                elif use_simulation:
                     # Use simulation mode
                     print(f"SIMULATION MODE: Calling {mover['name']} at {mover.get('phone', 'N/A')}")
                     call_transcript, summary_of_call = self._simulate_call(customer_info, strategy, mover)
@@ -108,31 +141,39 @@ class VoiceAgent:
                     phone_number = mover.get('phone', os.getenv('SAMPLE_MOVER_PHONE_NUMBER'))
                     print(f"REAL CALL: Calling {mover['name']} at {phone_number}")
                     
-                    # Load service-specific initial prompt and conversation text
-                    initial_prompt = prompt_manager.get_prompt(self.service_category, 'voice_initial')
+                    # The category's voice prompt first and the job last, so the session instructions share a prefix
                     conversation_text = prompt_manager.get_prompt(self.service_category, 'conversation_text')
                     
-                    call_sid = initiate_call_with_prompt(
+                    result = dial_and_wait(
                         phone_number, 
-                        initial_prompt +  " " + str(customer_info) + " " + str(strategy), 
+                        voice_instructions(self.service_category, customer_info, strategy), 
                         conversation_text,
-                        self.user_id
+                        self.user_id,
+                        self.service_category,
+                        priority=job_started,
+                        cancel_token=current_token(),
                     )
+                    call_sid = result.call_sid
+                    print(f"Call {call_sid} status: {result.status} after {result.attempts} attempt(s)")
 
-                    # poll the call status
-                    while True:
-                        status = check_call_status(call_sid)
-                        if status == "completed" or status == "busy" or status == "no-answer" or status == "failed" or status == "canceled":
-                            print(f"Call {call_sid} status: {status}")
-                            break
-                        time.sleep(5)
-
-                    call_transcript = get_call_data(call_sid)
+                    if result.status != "completed":
+                        call_transcript = None
+                        summary_of_call = f"Call {result.status} after {result.attempts} attempt(s)"
+                    else:
+                        call_transcript = get_call_transcript(call_sid)
+                        # Summarized live during the call; summarize the whole transcript only as a fallback
+                        summary_of_call = get_call_summary(call_sid)
 
-                    if call_transcript is not None:
+                    if summary_of_call is None and call_transcript is not None:
                         summary_of_call = self.summarize_call_transcript(call_transcript)
-                    else:
+                    elif summary_of_call is None:
                         summary_of_call = "Call transcript not found"
+
+                    if use_quote_cache and call_transcript is not None:
+                        try:
+                            self.quote_cache.record(mover, signature, summary_of_call)
+                        except Exception as e:
+                            print(f"Could not cache quote: {e}")
                         
             except Exception as e:
                 print(f"Error initiating or processing call: {e}")
@@ -145,70 +186,32 @@ class VoiceAgent:
 
             transcripts.append(call_transcript)
             summary_of_calls.append(summary_of_call)
+            if self.call_listener is not None:
+                self.call_listener.add_call(mover['name'], call_transcript, summary_of_call)
 
-            firebase.update_data(self.user_id, {
+            self.sink.update({
                 "transcripts": transcripts,
                 "callSummaries": summary_of_calls,
             })
 
+        replanner_stats = self.replanner.stats.to_dict()
+        print(f"Replanner stats: {replanner_stats}")
+        self.sink.update({ "replannerStats": replanner_stats, "quoteCacheStats": self.quote_cache.stats })
+
         return {
-            "call_transcripts": transcripts
+            "call_transcripts": blob_store.put(transcripts) if transcripts else None
         }
 
     def _simulate_call(self, customer_info, strategy, mover) -> tuple:
         """Simulate a phone call with a moving company"""
-        
-        # Create a more realistic simulation prompt
-        call_prompt = ChatPromptTemplate.from_messages([
-            ("system", """
-            You are simulating a phone conversation between a customer and a moving company representative.
-            You will play the role of the moving company representative from: {mover_name} with rating {rating} and specialties: {specialties}.
-            
-            The customer is calling to inquire about moving services. Respond professionally as a moving company representative would:
-            1. Acknowledge their inquiry
-            2. Ask clarifying questions about their move
-            3. Provide a realistic quote based on the details given
-            4. Respond to any negotiation attempts
-            5. Keep the conversation realistic and professional
-            
-            Price Range: ${min_price} - ${max_price}
-            Company Specialties: {specialties}
-            Company Rating: {rating}/5 stars
-            
-            Be prepared to discuss:
-            - Packing services (if they specialize in packing)
-            - Long-distance moves (if they specialize in long-distance)
-            - Timeline and scheduling
-            - Insurance options
-            - Final pricing
-            
-            Make the conversation feel authentic - include natural pauses, clarifications, and realistic business practices.
-            """),
-            ("human", """
-            Customer Information: {customer_info}
-            
-            Customer's Negotiation Strategy: {strategy}
-            
-            Please simulate a realistic phone conversation where you respond as the moving company representative. 
-            Include both sides of the conversation, clearly marking who is speaking.
-            
-            Format the response as a realistic phone conversation transcript with:
-            Customer: [what they say]
-            Representative: [your response]
-            
-            End with a final quote and any terms discussed.
-            """),
-        ])
-        
-        chain = call_prompt | self.llm
+        if self.simulator is not None:
+            return self.simulator.simulate(customer_info, strategy, mover)
+
+        chain = simulation_prompt() | self.llm
         response_of_call = chain.invoke({
-            "customer_info": customer_info, 
-            "strategy": strategy, 
-            "mover_name": mover.get('name', 'Moving Company'),
-            "rating": mover.get('rating', 4.0),
-            "specialties": mover.get('specialties', 'general moving'),
-            "min_price": mover.get('min_price', 1000),
-            "max_price": mover.get('max_price', 5000)
+            "customer_info": customer_info,
+            "company": simulation_company(mover),
+            "strategy": strategy,
         })
 
         # Summarize the call using the existing method
@@ -226,7 +229,7 @@ class VoiceAgent:
         Returns:
             str: A summary of the call with highlighted metrics
         """
-        llm = ChatOpenAI(model=Config.ANALYST_MODEL)
+        llm = self.summary_llm
         summary_prompt = ChatPromptTemplate.from_messages([
             ("system", """You are an expert at analyzing moving service call transcripts for an user.
                          Extract and highlight key information provided by the vendor including or similar to:
@@ -253,7 +256,7 @@ class VoiceAgent:
         summarizer_prompt = prompt_manager.get_prompt(self.service_category, 'strategy_summarizer')
         
         # Summarize the call
-        llm = ChatOpenAI(model=Config.ANALYST_MODEL)
+        llm = chat_model(Config.ANALYST_MODEL, "strategy_summarizer")
         prompt = ChatPromptTemplate.from_messages([
             ("system", summarizer_prompt),
             ("human", "Summarize the call based on the following call transcript: {transcript}. Make sure to include the actual price from the call."),
@@ -275,23 +278,12 @@ class VoiceAgent:
         print("Exiting VoiceAgent._make_call")
         return response_of_call.content, summary
 
-    def _modify_strategy(self, summary_of_calls: List[str], strategy: str) -> str:
-        # Implementation to modify the strategy based on the call transcript
-
-        # Load strategy replanner prompt
-        replanner_prompt = prompt_manager.get_prompt(self.service_category, 'strategy_replanner')
-
-        # Construct the prompt for the LLM to modify the strategy
-        llm = ChatOpenAI(model=Config.ANALYST_MODEL)
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", replanner_prompt),
-            ("human", "Modify the strategy for calling a different seller based on the following call transcripts: {summary_of_calls}. If the summary is not there, just ignore it. Make sure to provide quantifiable information (e.g., previous negotiation price) to negotiate the price with the new mover, and ask the model to negotiate based on that and mention it explicitly. Don't output anything else."),
-        ])
-        chain = prompt | llm
-        response = chain.invoke({ "summary_of_calls": summary_of_calls, "strategy": strategy })
+    def _modify_strategy(self, mover_name: str, summary_of_call: str, strategy: str) -> str:
+        # Fold the latest call into the negotiation state and replan only if it produced a better offer
+        response = self.replanner.replan(mover_name, summary_of_call, strategy)
 
         print("Exiting VoiceAgent._modify_strategy")
-        return response.content
+        return response
 
     def summarize_call_transcript(self, transcript: str) -> str:
         """
@@ -303,22 +295,7 @@ class VoiceAgent:
         Returns:
             str: A summary of the call with highlighted metrics
         """
-        llm = ChatOpenAI(model=Config.ANALYST_MODEL)
-        summary_prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are an summarizer who analyzing moving service call transcripts.
-                         Extract and highlight key information like or similar to:
-                         - Quoted prices (initial and final if negotiated)
-                         - Service details offered
-                         - Timeline/scheduling information
-                         - Special requirements or conditions
-                         - Notable negotiation points
-                         
-                         Format the metrics in a clear, structured way using bullet points.
-                         Put prices and key numbers in **bold**."""),
-            ("human", "Please analyze and summarize this call transcript, highlighting the key metrics and information: {transcript}")
-        ])
-        
-        chain = summary_prompt | llm
+        chain = call_summary_prompt() | self.summary_llm
         summary_response = chain.invoke({"transcript": transcript})
         
         return summary_response.content
@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Request, Depends, BackgroundTasks
+from fastapi import FastAPI, Request, Depends, BackgroundTasks, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from voice_server import router as voice_router
 
@@ -13,18 +13,32 @@ app.add_middleware(
 
 app.include_router(voice_router)
 
-import json
-from twilio.twiml.voice_response import VoiceResponse, Gather, Connect, Say, Stream
 from pydantic import BaseModel
-from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+import asyncio
+import importlib
+import threading
 import uuid
 
-from agents.agent_graph import AgentGraph
-from agents import firebase
+from agents import firebase, metrics
 
 sessions = {}
 config = { "configurable": { "thread_id": str(uuid.uuid4()) } }
 
+@app.on_event("startup")
+def warm_up():
+    # Build the token verifier and import the agent graph after startup, in the background,
+    # so neither slows down the cold import the container has to finish before serving
+    try:
+        firebase.get_token_verifier()
+    except Exception as e:
+        print(f"Could not prefetch Firebase auth keys: {e}")
+    threading.Thread(target=importlib.import_module, args=("agents.agent_graph",), daemon=True).start()
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    content, content_type = metrics.render()
+    return Response(content=content, media_type=content_type)
+
 @app.get("/api/")
 async def root():
     return {"message": "Fast API Server" }
@@ -39,6 +53,10 @@ class ChatBody(BaseModel):
 
 @app.post("/api/chat")
 async def chat(data: ChatBody, background_tasks: BackgroundTasks, user = Depends(firebase.verify_user)):
+    # The agent graph pulls in langchain/langgraph, import it on first use rather than at startup
+    from agents.agent_graph import AgentGraph
+    from langchain_core.messages import HumanMessage
+
     message = data.message
     service_category = data.service_category
 
@@ -49,7 +67,12 @@ async def chat(data: ChatBody, background_tasks: BackgroundTasks, user = Depends
         sessions[user['uid']] = agent_graph
 
     def run_graph():
-        results = agent_graph.graph.invoke({"messages": [HumanMessage(content=message)]}, config=config)
+        from agents.cancellation import Cancelled
+        try:
+            results = agent_graph.graph.invoke({"messages": [HumanMessage(content=message)]}, config=config)
+        except Cancelled as e:
+            print(f"Chat run cancelled: {e.reason}")
+            return
         response_message = results['messages'][-1].content
         print(response_message)
 
@@ -59,9 +82,27 @@ async def chat(data: ChatBody, background_tasks: BackgroundTasks, user = Depends
 
 @app.get("/api/chat/new")
 async def new_chat(user = Depends(firebase.verify_user)):
+    from agents.agent_graph import AgentGraph
+    # Stop the abandoned session's job before the new session takes over the user's status document
+    previous = sessions.get(user['uid'])
+    if previous is not None:
+        # Waits for the old session's status write in flight, so off the event loop
+        await asyncio.to_thread(previous.cancel, "new_chat")
     sessions[user['uid']] = AgentGraph(user['uid'])
     return { "message": "New agent created" }
 
+def verify_admin(user = Depends(firebase.verify_user)):
+    # Admins carry the `admin` custom claim on their Firebase ID token
+    if not user.get("admin"):
+        raise HTTPException(status_code=403, detail="Admin only")
+    return user
+
+@app.delete("/api/admin/quote-cache")
+def purge_quote_cache(provider: str = None, category: str = None, expired_only: bool = False, user = Depends(verify_admin)):
+    from agents.quote_cache import QuoteCache
+    deleted = QuoteCache().purge(provider=provider, category=category, expired_only=expired_only)
+    return { "deleted": deleted }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
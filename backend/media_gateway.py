@@ -0,0 +1,118 @@
+"""
+Media gateway: relays Twilio media streams across several worker processes.
+
+    python media_gateway.py --workers 4 --port 5050
+
+Each worker is a uvicorn process serving `handle_media_stream` on its own port
+(port + 1 + worker). The front router listens on `port` and forwards the websocket
+for `/media-stream/{worker}` to that worker without decoding it. The TwiML endpoint
+writes the worker into the stream URL (see voice_server.media_stream_url), so set
+MEDIA_GATEWAY_WORKERS to the same count in the API service, and MEDIA_GATEWAY_HOST
+to the gateway's public host if it differs from the API's. A path-routing proxy
+(nginx, Envoy) in front of the worker ports can replace the front router.
+
+Call state is read from the shared call store (agents.call_store), so any worker can
+relay any call and the relay capacity grows with the number of cores. The default
+SQLite store is only shared on one host; when the gateway runs as its own service,
+set CALL_STATE_STORE=firestore here and in the API service.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+def worker_port(base_port, worker):
+    return base_port + 1 + worker
+
+def create_worker_app():
+    from fastapi import FastAPI, Response
+    from voice_server import router
+    from agents import metrics
+
+    app = FastAPI()
+    app.include_router(router)
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        content, content_type = metrics.render()
+        return Response(content=content, media_type=content_type)
+
+    return app
+
+def run_worker(worker, port, fake_firestore=False):
+    import uvicorn
+    from agents import firebase
+    from agents.log import configure_logging, get_logger
+
+    configure_logging()
+    if fake_firestore:
+        from agents.firestore_async import InMemoryAsyncFirestore
+        firebase.set_async_client(InMemoryAsyncFirestore())
+    get_logger("media_gateway").info("Starting media worker", extra={"worker": worker, "port": port})
+    uvicorn.run(create_worker_app(), host="127.0.0.1", port=port, log_level="warning", ws_max_size=2 ** 20)
+
+async def _pipe(source, sink):
+    async for message in source:
+        await sink.send(message)
+
+async def route(websocket, base_port, workers):
+    """Forward one media stream to the worker named in its path, in both directions."""
+    import websockets
+
+    parts = websocket.path.split("?")[0].strip("/").split("/")
+    if parts[0] != "media-stream":
+        await websocket.close(code=1008, reason="Unknown path")
+        return
+    worker = int(parts[1]) % workers if len(parts) > 1 and parts[1].isdigit() else 0
+
+    async with websockets.connect(f"ws://127.0.0.1:{worker_port(base_port, worker)}/media-stream/{worker}") as upstream:
+        tasks = [asyncio.ensure_future(_pipe(websocket, upstream)), asyncio.ensure_future(_pipe(upstream, websocket))]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+async def serve_router(host, port, workers):
+    import websockets
+
+    async with websockets.serve(lambda websocket: route(websocket, port, workers), host, port, max_size=2 ** 20):
+        stop = asyncio.get_running_loop().create_future()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set_result, None)
+        await stop
+
+def main():
+    from agents.config import Config
+
+    parser = argparse.ArgumentParser(description="Relay Twilio media streams across worker processes")
+    parser.add_argument("--workers", type=int, default=Config.MEDIA_GATEWAY_WORKERS)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 5050)))
+    parser.add_argument("--fake-firestore", action="store_true", help="Keep call data in memory, for the local harness")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=run_worker, args=(worker, worker_port(args.port, worker), args.fake_firestore), daemon=True)
+        for worker in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        asyncio.run(serve_router(args.host, args.port, args.workers))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=5)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The app and the agents run with the backend directory on the path, as `uvicorn app:app` does
+sys.path.insert(0, BACKEND_DIR)
+
+# voice_server refuses to import without an OpenAI key; tests never reach OpenAI
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+@pytest.fixture
+def fake_openai(monkeypatch):
+    from fake_openai import FakeOpenAI
+
+    server = FakeOpenAI()
+    monkeypatch.setenv("OPENAI_API_BASE", server.base_url)
+    monkeypatch.setenv("OPENAI_BASE_URL", server.base_url)
+    yield server
+    server.close()
+
+@pytest.fixture
+def offline_graph(fake_openai, monkeypatch):
+    """
+    Run AgentGraph jobs offline: LLM calls go to the fake OpenAI server, provider calls
+    are simulated from templates, and status document writes are kept in memory.
+    Yields the written documents by user id.
+    """
+    from agents import firebase
+    from agents.config import Config
+
+    documents = {}
+
+    def update_data(user_id, data, merge=True):
+        documents[user_id] = {**documents.get(user_id, {}), **data} if merge else dict(data)
+
+    # The provider databases are read relative to the backend directory
+    monkeypatch.chdir(BACKEND_DIR)
+    monkeypatch.setenv("USE_SIMULATION_MODE", "true")
+    monkeypatch.setattr(Config, "SIMULATOR_BACKEND", "template")
+    monkeypatch.setattr(firebase, "update_data", update_data)
+    yield documents
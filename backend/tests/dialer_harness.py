@@ -0,0 +1,213 @@
+"""
+Local harness for the dialer against a fake Twilio REST server; nothing leaves the
+machine.
+
+    python -m tests.dialer_harness --jobs 8 --providers 5 --cps 2
+
+Run it from the backend directory.
+
+The fake server implements the two endpoints the dialer uses: create a call and
+fetch a call. It enforces a calls-per-second limit with Twilio's 429 / 20429 error.
+Each provider number has a seeded pick-up rate: a call rings, then either talks
+for a while and completes, or ends busy or unanswered. The server also tracks the
+largest number of overlapping calls to one number.
+
+The harness runs the same jobs twice through the real Twilio client. "direct"
+places every call right away, like the voice agent did before the dialer, and
+records busy, unanswered and rate-limited calls as failures. "dialer" goes through
+the Dialer. The report shows completed calls, rejected requests, per-number
+overlap and the time until every job was done.
+"""
+
+import argparse
+import asyncio
+import random
+import socket
+import sys
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Tuple
+
+from agents.dialer import Dialer
+
+ACCOUNT_SID = "ACharness"
+
+class FakeTwilioServer:
+    def __init__(self, calls_per_second: float, answer_rates: Dict[str, float], ring_seconds: float = 1.0,
+                 talk_seconds: float = 2.0, seed: int = 7):
+        self.calls_per_second = calls_per_second
+        self.answer_rates = answer_rates
+        self.ring_seconds = ring_seconds
+        self.talk_seconds = talk_seconds
+        self.rng = random.Random(seed)
+        self.calls: Dict[str, Dict] = {}
+        self.created_at: List[float] = []
+        self.rejected = 0
+        self.max_overlap: Dict[str, int] = defaultdict(int)
+        # Every call the server accepted: (monotonic time, to number)
+        self.accepted: List[Tuple[float, str]] = []
+
+    def reset(self):
+        self.calls = {}
+        self.created_at = []
+        self.rejected = 0
+        self.max_overlap = defaultdict(int)
+        self.accepted = []
+
+    def attempts(self, to_number: str) -> int:
+        return sum(1 for _, number in self.accepted if number == to_number)
+
+    def _status(self, call: Dict, now: float) -> str:
+        elapsed = now - call["created"]
+        if elapsed < self.ring_seconds:
+            return "ringing"
+        if call["outcome"] != "completed":
+            return call["outcome"]
+        return "in-progress" if elapsed < self.ring_seconds + self.talk_seconds else "completed"
+
+    def _live_calls(self, to_number: str, now: float) -> int:
+        return sum(1 for call in self.calls.values()
+                   if call["to"] == to_number and self._status(call, now) in ("ringing", "in-progress"))
+
+    def _resource(self, sid: str, now: float) -> Dict:
+        call = self.calls[sid]
+        return {"sid": sid, "account_sid": ACCOUNT_SID, "to": call["to"], "from": call["from"], "status": self._status(call, now)}
+
+    def app(self):
+        from fastapi import FastAPI, Request
+        from fastapi.responses import JSONResponse
+
+        app = FastAPI()
+
+        @app.post("/2010-04-01/Accounts/{account_sid}/Calls.json")
+        async def create_call(account_sid: str, request: Request):
+            form = await request.form()
+            now = time.monotonic()
+            self.created_at = [created for created in self.created_at if now - created < 1]
+            if len(self.created_at) >= self.calls_per_second:
+                self.rejected += 1
+                return JSONResponse({"code": 20429, "message": "Too Many Requests", "status": 429}, status_code=429)
+            self.created_at.append(now)
+            to_number = form["To"]
+            self.accepted.append((now, to_number))
+            answered = self.rng.random() < self.answer_rates.get(to_number, 1.0)
+            sid = "CA" + uuid.uuid4().hex
+            self.calls[sid] = {"to": to_number, "from": form["From"], "created": now,
+                               "outcome": "completed" if answered else self.rng.choice(["busy", "no-answer"])}
+            self.max_overlap[to_number] = max(self.max_overlap[to_number], self._live_calls(to_number, now))
+            return JSONResponse(self._resource(sid, now), status_code=201)
+
+        @app.get("/2010-04-01/Accounts/{account_sid}/Calls/{sid}.json")
+        async def fetch_call(account_sid: str, sid: str):
+            if sid not in self.calls:
+                return JSONResponse({"code": 20404, "message": "Not found", "status": 404}, status_code=404)
+            return self._resource(sid, time.monotonic())
+
+        return app
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def twilio_client(base_url: str):
+    from twilio.rest import Client
+    client = Client(ACCOUNT_SID, "harness")
+    client.api.base_url = base_url
+    return client
+
+@asynccontextmanager
+async def serve(server: FakeTwilioServer) -> AsyncIterator[str]:
+    """Serve the fake on a free local port, in the running loop; yields its base URL."""
+    import uvicorn
+
+    port = _free_port()
+    http = uvicorn.Server(uvicorn.Config(server.app(), host="127.0.0.1", port=port, log_level="warning"))
+    serving = asyncio.ensure_future(http.serve())
+    while not http.started:
+        await asyncio.sleep(0.05)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        http.should_exit = True
+        await serving
+
+def call_functions(client, poll_seconds: float = 0.2):
+    """The dialer's place_call and wait_for_end, through the Twilio client."""
+    async def place_call(to_number):
+        call = await asyncio.to_thread(client.calls.create, to=to_number, from_="+15550000000", url="http://127.0.0.1/twiml")
+        return call.sid
+
+    async def wait_for_end(call_sid):
+        while True:
+            status = (await asyncio.to_thread(client.calls(call_sid).fetch)).status
+            if status not in ("queued", "ringing", "in-progress"):
+                return status
+            await asyncio.sleep(poll_seconds)
+
+    return place_call, wait_for_end
+
+async def run(args):
+    providers = [f"+1555010{index:04d}" for index in range(args.providers)]
+    rng = random.Random(args.seed)
+    answer_rates = {number: rng.choice([0.3, 0.6, 0.9]) for number in providers}
+    server = FakeTwilioServer(args.cps, answer_rates, args.ring_seconds, args.talk_seconds, args.seed)
+    async with serve(server) as base_url:
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=64))
+        await _compare(args, server, providers, *call_functions(twilio_client(base_url)))
+
+async def _compare(args, server: FakeTwilioServer, providers: List[str], place_call, wait_for_end):
+    async def direct_call(to_number):
+        try:
+            return await wait_for_end(await place_call(to_number))
+        except Exception as e:
+            return "rate_limited" if getattr(e, "status", None) == 429 else "failed"
+
+    # Every job calls every provider one after another, like the voice agent
+    async def job(call):
+        return [await call(number) for number in providers]
+
+    for mode in ("direct", "dialer"):
+        server.reset()
+        started = time.monotonic()
+        if mode == "direct":
+            results = await asyncio.gather(*(job(direct_call) for _ in range(args.jobs)))
+            outcomes = [status for statuses in results for status in statuses]
+            attempts = len(outcomes)
+        else:
+            dialer = Dialer(place_call, wait_for_end, calls_per_second=args.cps, burst=1,
+                            max_calls_per_number=1, max_attempts=args.attempts,
+                            backoff_seconds=args.backoff, backoff_max_seconds=args.backoff * 8,
+                            rng=random.Random(args.seed))
+
+            async def dialed(to_number, priority):
+                return (await dialer.dial(to_number, priority)).status
+
+            results = await asyncio.gather(*(
+                job(lambda number, priority=index: dialed(number, priority)) for index in range(args.jobs)
+            ))
+            outcomes = [status for statuses in results for status in statuses]
+            attempts = sum(count for outcome, count in dialer.outcomes.items() if outcome != "rate_limited")
+            await dialer.close()
+        elapsed = time.monotonic() - started
+        completed = outcomes.count("completed")
+        print(f"{mode:<6} | completed {completed:>3}/{len(outcomes)} calls in {attempts:>3} attempts"
+              f" | rejected by rate limit {server.rejected:>4}"
+              f" | max calls per number {max(server.max_overlap.values(), default=0)}"
+              f" | all jobs done in {elapsed:6.1f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="The dialer against a fake Twilio REST server")
+    parser.add_argument("--jobs", type=int, default=6)
+    parser.add_argument("--providers", type=int, default=4)
+    parser.add_argument("--cps", type=float, default=2, help="Calls per second the fake Twilio account allows")
+    parser.add_argument("--attempts", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=1.0)
+    parser.add_argument("--ring-seconds", type=float, default=1.0)
+    parser.add_argument("--talk-seconds", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(run(parser.parse_args()))
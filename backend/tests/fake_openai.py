@@ -0,0 +1,102 @@
+"""
+A local stand-in for the OpenAI chat completions endpoint, so the agent graph runs offline.
+
+Forced tool calls (with_structured_output) get arguments for the requested schema,
+the chat agent's CustomerInfo tool is called right away, and every other request
+gets a short quote summary as text, streamed when asked for.
+"""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+CUSTOMER_INFO = {
+    "name": "Dean",
+    "phone": "650-321-4321",
+    "current_address": "825 Menlo Ave, Menlo Park, CA 94025",
+    "destination_address": "200 First St, Miami, FL 33131",
+    "is_long_distance": True,
+    "move_in_date": "2024-12-12T00:00:00",
+    "move_out_date": "2024-12-10T00:00:00",
+    "storage_required": False,
+    "apartment_size": "studio, 500 sq ft",
+    "inventory": ["bed", "desk", "boxes"],
+    "packing_assistance": True,
+    "special_items": "none",
+}
+TEXT_REPLY = "- Final negotiated price: **$1,900.00**\n- Recommendation: book the lowest final price."
+PROVIDER_NAME = re.compile(r'"name": "([^"]+)"')
+
+class FakeOpenAI:
+    def __init__(self):
+        self.requests: List[Dict] = []
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake._lock:
+                    fake.requests.append(body)
+                fake._reply(self, body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def prompts(self) -> List[str]:
+        """The text of every request's messages, in arrival order."""
+        with self._lock:
+            return ["\n".join(str(message.get("content")) for message in request["messages"]) for request in self.requests]
+
+    def _tool_arguments(self, name: str, body: Dict) -> Dict:
+        if name == "FilteredMovers":
+            names = PROVIDER_NAME.findall(json.dumps(body["messages"]).replace('\\"', '"'))
+            return {"rationale": "Closest price range", "movers": names[:3]}
+        return CUSTOMER_INFO
+
+    def _reply(self, handler: BaseHTTPRequestHandler, body: Dict):
+        message: Dict = {"role": "assistant", "content": TEXT_REPLY}
+        tool_choice = body.get("tool_choice")
+        tools = [tool["function"]["name"] for tool in body.get("tools", [])]
+        if isinstance(tool_choice, dict) or "CustomerInfo" in tools:
+            name = tool_choice["function"]["name"] if isinstance(tool_choice, dict) else "CustomerInfo"
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": "call_1", "type": "function",
+                "function": {"name": name, "arguments": json.dumps(self._tool_arguments(name, body))},
+            }]}
+        usage = {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120}
+
+        if body.get("stream"):
+            chunks = [
+                {"choices": [{"index": 0, "delta": {"role": "assistant", "content": TEXT_REPLY}, "finish_reason": "stop"}]},
+                {"choices": [], "usage": usage},
+            ]
+            payload = "".join(
+                f"data: {json.dumps({'id': 'chatcmpl-1', 'object': 'chat.completion.chunk', 'created': 0, 'model': body['model'], **chunk})}\n\n"
+                for chunk in chunks
+            ) + "data: [DONE]\n\n"
+            content_type = "text/event-stream"
+        else:
+            payload = json.dumps({
+                "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": body["model"],
+                "choices": [{"index": 0, "message": message, "finish_reason": "tool_calls" if "tool_calls" in message else "stop"}],
+                "usage": usage,
+            })
+            content_type = "application/json"
+
+        data = payload.encode("utf-8")
+        handler.send_response(200)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
@@ -0,0 +1,156 @@
+"""
+Local load harness for the media gateway, with fake Twilio callers and a fake
+OpenAI Realtime server; nothing leaves the machine.
+
+    python -m tests.media_harness --workers 1 2 4 --calls 10 20 40 --seconds 10
+
+Run it from the backend directory. For each worker count the harness starts
+`media_gateway.py` pointed at the fake Realtime server, registers the calls in a
+fresh call store and runs the given numbers of concurrent calls. Every caller
+streams 20 ms μ-law frames in real time through the front router; the fake
+Realtime server echoes each frame back as an audio delta.
+Frames carry their send time, so the fake server measures the Twilio -> OpenAI lag
+through the gateway. The report shows lag percentiles and the share of audio that
+made it through in each direction. When the gateway keeps up, frame delivery stays
+near 100% and lag stays flat. Capacity shows as the call count where that stops.
+For meaningful numbers, give the harness cores of its own, e.g. with taskset.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from agents.call_store import CallStateStore, gateway_worker_for
+from agents.call_timing import percentile
+
+FRAME_MS = 20
+FRAME_BYTES = 160
+
+class FakeRealtimeServer:
+    """Accepts Realtime sessions and echoes appended audio back as response.audio.delta."""
+
+    def __init__(self):
+        self.lags_ms: List[float] = []
+        self.frames_received = 0
+
+    async def handle(self, websocket):
+        async for message in websocket:
+            event = json.loads(message)
+            if event.get("type") != "input_audio_buffer.append":
+                continue
+            self.frames_received += 1
+            sent_at, = struct.unpack_from("d", base64.b64decode(event["audio"]))
+            self.lags_ms.append((time.time() - sent_at) * 1000)
+            await websocket.send('{"type":"response.audio.delta","item_id":"item_harness","delta":"%s"}' % event["audio"])
+
+    def reset(self):
+        self.lags_ms = []
+        self.frames_received = 0
+
+async def fake_twilio_call(url: str, call_sid: str, seconds: float) -> Dict:
+    """Stream `seconds` of audio in real time and count the audio that comes back."""
+    import websockets
+
+    received_bytes = 0
+    async with websockets.connect(url, max_size=2 ** 20) as websocket:
+        async def receive():
+            nonlocal received_bytes
+            async for message in websocket:
+                event = json.loads(message)
+                if event.get("event") == "media":
+                    received_bytes += len(base64.b64decode(event["media"]["payload"]))
+
+        receiver = asyncio.ensure_future(receive())
+        await websocket.send(json.dumps({"event": "connected", "protocol": "Call"}))
+        await websocket.send(json.dumps({"event": "start", "start": {"streamSid": f"MZ{call_sid}", "callSid": call_sid}}))
+        frames = int(seconds * 1000 / FRAME_MS)
+        started = time.perf_counter()
+        for frame in range(frames):
+            payload = base64.b64encode(struct.pack("d", time.time()) + b"\xff" * (FRAME_BYTES - 8)).decode("ascii")
+            await websocket.send('{"event":"media","streamSid":"MZ%s","media":{"timestamp":"%d","payload":"%s"}}'
+                                 % (call_sid, frame * FRAME_MS, payload))
+            # Keep real-time pace against the start time, so a slow loop doesn't drift
+            await asyncio.sleep(max(0, started + (frame + 1) * FRAME_MS / 1000 - time.perf_counter()))
+        # Leave time for the echoed audio to drain before hanging up
+        await asyncio.sleep(1)
+        receiver.cancel()
+    return {"sent_bytes": frames * FRAME_BYTES, "received_bytes": received_bytes}
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def _wait_for_port(port: int, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.2)
+    raise TimeoutError(f"Nothing listening on port {port}")
+
+async def run_gateway(workers: int, call_counts: List[int], seconds: float, realtime: FakeRealtimeServer, realtime_port: int):
+    port = _free_port()
+    db_path = os.path.join(tempfile.mkdtemp(prefix="media_harness"), "calls.db")
+    env = dict(os.environ, OPENAI_API_KEY="harness", LOG_LEVEL="WARNING", CALL_STATE_DB=db_path, LIVE_SUMMARY="false",
+               OPENAI_REALTIME_URL=f"ws://127.0.0.1:{realtime_port}/", MEDIA_GATEWAY_WORKERS=str(workers))
+    gateway_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "media_gateway.py")
+    gateway = await asyncio.create_subprocess_exec(sys.executable, gateway_path, "--workers", str(workers), "--port", str(port),
+                                                   "--host", "127.0.0.1", "--fake-firestore", env=env)
+    try:
+        await _wait_for_port(port)
+        for worker in range(workers):
+            await _wait_for_port(port + 1 + worker)
+
+        store = CallStateStore(db_path)
+        for calls in call_counts:
+            realtime.reset()
+            sids = [f"CAharness{workers}x{calls}x{index:04d}" for index in range(calls)]
+            for sid in sids:
+                store.put(sid, user_id="harness", dialed_at_ms=time.time() * 1000)
+            results = await asyncio.gather(*(
+                fake_twilio_call(f"ws://127.0.0.1:{port}/media-stream/{gateway_worker_for(sid, workers)}", sid, seconds)
+                for sid in sids
+            ))
+            sent = sum(result["sent_bytes"] for result in results)
+            received = sum(result["received_bytes"] for result in results)
+            print(f"workers={workers:<3} calls={calls:<5} "
+                  f"inbound={realtime.frames_received * FRAME_BYTES / sent:6.1%} "
+                  f"outbound={received / sent:6.1%} "
+                  f"lag p50={percentile(realtime.lags_ms, 50) or 0:7.1f} ms "
+                  f"p99={percentile(realtime.lags_ms, 99) or 0:7.1f} ms", file=sys.stderr)
+    finally:
+        # Keep the loop running while the workers close their sessions with the fake server
+        gateway.terminate()
+        await gateway.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent-call capacity of the media gateway against local fakes")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--calls", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    async def main():
+        import websockets
+
+        realtime = FakeRealtimeServer()
+        realtime_port = _free_port()
+        async with websockets.serve(realtime.handle, "127.0.0.1", realtime_port, max_size=2 ** 20):
+            print(f"{os.cpu_count()} CPUs", file=sys.stderr)
+            for workers in args.workers:
+                await run_gateway(workers, args.calls, args.seconds, realtime, realtime_port)
+
+    asyncio.run(main())
@@ -0,0 +1,53 @@
+import uuid
+
+from langchain_core.messages import HumanMessage
+
+from agents import firebase
+from agents.agent_graph import MAX_TIMELINES, AgentGraph
+from fake_openai import TEXT_REPLY
+
+MESSAGE = ("I want to move from SF to Miami on Dec 10, a studio with 500 sq ft and no special items. "
+           "I need help with packing. My name is Dean, and my phone number is 650-321-4321.")
+
+def _run_job(user_id: str):
+    graph = AgentGraph(user_id, "movers")
+    thread_id = str(uuid.uuid4())
+    state = graph.graph.invoke({"messages": [HumanMessage(content=MESSAGE)]},
+                               config={"configurable": {"thread_id": thread_id}})
+    return graph, thread_id, state
+
+def test_analyst_folds_in_calls_as_they_finish(offline_graph, fake_openai):
+    user_id = f"test-{uuid.uuid4().hex[:8]}"
+    graph, thread_id, state = _run_job(user_id)
+
+    prompts = fake_openai.prompts()
+    updates = [prompt for prompt in prompts if "Analysis so far:" in prompt]
+    full_passes = [prompt for prompt in prompts if "Call Transcripts:" in prompt]
+    assert len(updates) == 3  # One per filtered provider
+    assert full_passes == []
+    assert "No calls yet." in updates[0] and TEXT_REPLY in updates[-1]
+
+    assert state["final_recommendation"] == TEXT_REPLY
+    assert offline_graph[user_id]["status"] == "completed"
+    assert offline_graph[user_id]["recommendation"] == TEXT_REPLY
+    assert set(graph.timelines[thread_id].report()["nodesMs"]) == {"chat", "providers", "strategist", "voice", "analyst"}
+
+def test_timelines_keep_recent_threads_only(offline_graph):
+    graph = AgentGraph(f"test-{uuid.uuid4().hex[:8]}", "movers")
+    for index in range(MAX_TIMELINES + 10):
+        graph.timeline(f"thread-{index}")
+    graph.timeline("thread-10")
+    graph.timeline("thread-new")
+    assert len(graph.timelines) == MAX_TIMELINES
+    assert "thread-10" in graph.timelines and "thread-11" not in graph.timelines
+
+def test_cancelled_session_no_longer_writes(offline_graph):
+    user_id = f"test-{uuid.uuid4().hex[:8]}"
+    old = AgentGraph(user_id, "movers")
+    new = AgentGraph(user_id, "movers")
+    assert old.sink is not new.sink
+
+    old.cancel("new_chat")
+    old.sink.update({"status": firebase.AppStatus.ANALYSING})
+    old.sink.flush()
+    assert offline_graph[user_id]["status"] == firebase.AppStatus.INFO_COLLECTION
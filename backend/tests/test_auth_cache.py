@@ -0,0 +1,94 @@
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from agents.auth_cache import PublicKeySet, TokenVerifier, VerifiedTokenCache
+
+PROJECT_ID = "test-project"
+KID = "test-key"
+PRIVATE_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+def _token(kid: str = KID, **claims) -> str:
+    now = int(time.time())
+    payload = {"iss": f"https://securetoken.google.com/{PROJECT_ID}", "aud": PROJECT_ID, "sub": "user-1",
+               "iat": now, "exp": now + 3600, **claims}
+    return jwt.encode(payload, PRIVATE_KEY, algorithm="RS256", headers={"kid": kid})
+
+def _verifier(keys=None, fallback=None) -> TokenVerifier:
+    key_set = PublicKeySet()
+    if keys is not False:
+        key_set.set_keys(keys or {KID: PRIVATE_KEY.public_key()})
+    return TokenVerifier(PROJECT_ID, key_set, fallback=fallback)
+
+def test_valid_token_is_verified_and_cached():
+    verifier = _verifier()
+    token = _token()
+    assert verifier.verify(token)["uid"] == "user-1"
+    assert verifier.verify(token)["uid"] == "user-1"
+    assert (verifier.cache.hits, verifier.cache.misses) == (1, 1)
+
+@pytest.mark.parametrize("claims, error", [
+    ({"aud": "other-project"}, jwt.InvalidAudienceError),
+    ({"iss": "https://securetoken.google.com/other-project"}, jwt.InvalidIssuerError),
+    ({"exp": int(time.time()) - 60}, jwt.ExpiredSignatureError),
+    ({"sub": ""}, ValueError),
+])
+def test_invalid_tokens_are_rejected_and_not_cached(claims, error):
+    verifier = _verifier()
+    with pytest.raises(error):
+        verifier.verify(_token(**claims))
+    assert len(verifier.cache) == 0
+
+def test_token_signed_by_another_key_is_rejected():
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    verifier = _verifier({KID: other_key.public_key()})
+    with pytest.raises(jwt.InvalidSignatureError):
+        verifier.verify(_token())
+
+def test_cache_entry_is_evicted_at_exp():
+    cache = VerifiedTokenCache()
+    cache.put("token", {"uid": "user-1", "exp": time.time() + 0.2})
+    assert cache.get("token")["uid"] == "user-1"
+    time.sleep(0.3)
+    assert cache.get("token") is None
+    assert len(cache) == 0
+
+@pytest.mark.parametrize("keys", [False, {"another-key": PRIVATE_KEY.public_key()}])
+def test_fallback_verifies_when_the_key_is_unavailable(keys):
+    calls = []
+
+    def fallback(token):
+        calls.append(token)
+        return {"uid": "user-1", "exp": time.time() + 3600}
+
+    token = _token()
+    verifier = _verifier(keys, fallback)
+    assert verifier.verify(token)["uid"] == "user-1"
+    assert calls == [token]
+    with pytest.raises(ValueError):
+        _verifier(keys).verify(token)
+
+def test_revoke_uid_drops_the_users_tokens():
+    verifier = _verifier()
+    revoked = []
+    verifier.cache.add_revocation_hook(revoked.append)
+    for claims in ({"sub": "user-1"}, {"sub": "user-1", "iat": int(time.time()) - 1}, {"sub": "user-2"}):
+        verifier.verify(_token(**claims))
+
+    assert verifier.cache.revoke_uid("user-1") == 2
+    assert len(verifier.cache) == 1
+    assert revoked == ["user-1"]
+
+def test_callers_get_their_own_copy_of_the_claims():
+    verifier = _verifier()
+    token = _token(firebase={"sign_in_provider": "password"})
+    first = verifier.verify(token)
+    first["admin"] = True
+    first["firebase"]["sign_in_provider"] = "custom"
+    second = verifier.verify(token)
+    assert "admin" not in second
+    assert second["firebase"]["sign_in_provider"] == "password"
+    second["uid"] = "someone-else"
+    assert verifier.verify(token)["uid"] == "user-1"
@@ -0,0 +1,61 @@
+import json
+
+from agents.batch_runner import BatchRunner, MemoryStatusDocuments, ResultWriter, read_requests, run_graph_job
+from fake_openai import TEXT_REPLY
+
+MESSAGE = ("I want to move from SF to Miami on Dec 10, a studio with 500 sq ft and no special items. "
+           "I need help with packing. My name is Dean, and my phone number is 650-321-4321.")
+
+def _run(tmp_path, rows, **runner_kwargs):
+    requests = tmp_path / "requests.jsonl"
+    requests.write_text("".join(row + "\n" for row in rows), encoding="utf-8")
+    out = tmp_path / "results.jsonl"
+    writer = ResultWriter(str(out), resume=False)
+    runner = BatchRunner(writer, workers=1, **runner_kwargs)
+    try:
+        runner.run(read_requests(str(requests)))
+    finally:
+        writer.close()
+    return runner, [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+
+def test_batch_job_runs_through_the_agent_graph(offline_graph, tmp_path):
+    runner, [result] = _run(tmp_path, [json.dumps({"id": "r-001", "messages": [MESSAGE]})])
+
+    assert result["status"] == "ok", result.get("error")
+    assert (result["id"], result["category"], result["userId"]) == ("r-001", "movers", "batch-r-001")
+    assert result["recommendation"] == TEXT_REPLY
+    assert result["numberOfCalls"] == 3  # One per filtered provider
+    assert set(result["timing"]["nodesMs"]) == {"chat", "providers", "strategist", "voice", "analyst"}
+    assert offline_graph["batch-r-001"]["status"] == "completed"
+
+    report = runner.report()
+    assert report["statuses"] == {"ok": 1}
+    assert "analyst" in report["stagesMs"] and "job (wall)" in report["stagesMs"]
+
+def test_status_writes_can_stay_in_memory(offline_graph, tmp_path):
+    documents = MemoryStatusDocuments()
+
+    def run_job(request):
+        return run_graph_job(request, status_documents=documents)
+
+    _, [result] = _run(tmp_path, [json.dumps({"id": "r-002", "messages": [MESSAGE]})], run_job=run_job)
+
+    assert result["status"] == "ok", result.get("error")
+    assert result["documentStatus"] == "completed"
+    assert "batch-r-002" not in offline_graph
+    assert documents.documents == {}
+
+def test_malformed_rows_are_reported_and_the_batch_goes_on(tmp_path):
+    rows = [json.dumps({"id": "a", "messages": ["hi"]}), json.dumps({"id": "b"}), "{not json",
+            json.dumps({"id": "c", "messages": ["hi"]})]
+
+    _, results = _run(tmp_path, rows, run_job=lambda request: {"status": "ok"})
+
+    assert [(result["id"], result["status"]) for result in results] == [
+        ("a", "ok"), ("b", "error"), ("3", "error"), ("c", "ok"),
+    ]
+    assert "has no messages" in results[1]["error"]
+    # Errors aren't finished, so --resume runs them again
+    resumed = ResultWriter(str(tmp_path / "results.jsonl"), resume=True)
+    resumed.close()
+    assert resumed.finished == {"a", "c"}
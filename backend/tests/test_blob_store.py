@@ -0,0 +1,20 @@
+import time
+
+from agents import blob_store
+from agents.blob_store import BlobStore
+
+def test_put_purges_expired_blobs(tmp_path, monkeypatch):
+    store = BlobStore(str(tmp_path / "blobs.db"), ttl_seconds=0.5)
+    old = store.put({"strategy": "old"})
+    time.sleep(0.6)
+    # Purges are spaced out; pretend the interval has passed since the first one
+    monkeypatch.setattr(blob_store, "PURGE_INTERVAL_SECONDS", 0)
+    new = store.put({"strategy": "new"})
+    refs = [row[0] for row in store._connect().execute("SELECT ref FROM blobs")]
+    assert refs == [new]
+    assert old not in refs
+
+def test_put_keeps_live_blobs(tmp_path):
+    store = BlobStore(str(tmp_path / "blobs.db"))
+    refs = [store.put(index) for index in range(3)]
+    assert sorted(row[0] for row in store._connect().execute("SELECT ref FROM blobs")) == sorted(refs)
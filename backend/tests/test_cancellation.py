@@ -0,0 +1,42 @@
+import threading
+
+import pytest
+
+from agents.cancellation import Cancelled, CancelToken, check_cancelled, current_token, run_cancellable
+
+def test_step_runs_inline_with_its_token():
+    token = CancelToken()
+
+    def step(value):
+        return threading.current_thread(), current_token(), value
+
+    assert run_cancellable(token, step, 1) == (threading.current_thread(), token, 1)
+    assert current_token() is None
+
+def test_step_stops_at_its_next_check():
+    token = CancelToken()
+    checks = []
+
+    def step():
+        for index in range(3):
+            if index == 1:
+                token.cancel("new_chat")
+            checks.append(index)
+            check_cancelled()
+
+    with pytest.raises(Cancelled) as cancelled:
+        run_cancellable(token, step)
+    assert cancelled.value.reason == "new_chat"
+    assert checks == [0, 1]
+
+def test_result_after_a_cancel_is_dropped():
+    token = CancelToken()
+
+    def step():
+        token.cancel("new_chat")
+        return "late"
+
+    with pytest.raises(Cancelled):
+        run_cancellable(token, step)
+    with pytest.raises(Cancelled):
+        run_cancellable(token, lambda: "never run")
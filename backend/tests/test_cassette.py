@@ -0,0 +1,44 @@
+import gzip
+import json
+import sys
+
+import pytest
+
+from agents import cassette, cassette_cli
+
+MESSAGE = ("I want to move from SF to Miami on Dec 10, a studio with 500 sq ft and no special items. "
+           "I need help with packing. My name is Dean, and my phone number is 650-321-4321.")
+
+def _cli(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["python -m agents.cassette_cli", *argv])
+    cassette_cli.main()
+
+def test_cli_records_a_job_and_replays_it_offline(offline_graph, fake_openai, monkeypatch, tmp_path, capsys):
+    # The CLI sets the process-wide cassette; put it back afterwards
+    monkeypatch.setattr(cassette, "_cassette", None)
+    monkeypatch.setattr(cassette, "_configured", True)
+    path = str(tmp_path / "job.jsonl.gz")
+
+    with pytest.raises(SystemExit) as exit_info:
+        _cli(monkeypatch, "record", "--message", MESSAGE, "--user", "cassette-test", "--out", path)
+    assert exit_info.value.code == 0
+    recorded_requests = len(fake_openai.requests)
+    assert recorded_requests > 0
+    assert cassette.get_cassette().mode == cassette.RECORD
+    assert "Recorded {'input': 1, 'llm': " in capsys.readouterr().err
+
+    _cli(monkeypatch, "replay", path, "--runs", "2")
+    assert len(fake_openai.requests) == recorded_requests
+    report = capsys.readouterr().err
+    assert "2 replays of" in report and "misses over all runs: 0" in report
+
+def test_recording_replaces_an_earlier_cassette(tmp_path):
+    path = str(tmp_path / "job.jsonl.gz")
+    for message in ("first", "second"):
+        recording = cassette.Cassette(path, cassette.RECORD)
+        recording.record("input", "job", "job", {"messages": [message]}, 0.0)
+        recording.save()
+
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f]
+    assert [record["response"]["messages"] for record in records] == [["second"]]
@@ -0,0 +1,58 @@
+import asyncio
+import random
+
+from agents.dialer import Dialer
+from dialer_harness import FakeTwilioServer, call_functions, serve, twilio_client
+
+ANSWERS = "+15550100001"
+NEVER_ANSWERS = "+15550100002"
+
+def _dial_all(server: FakeTwilioServer, numbers, **dialer_kwargs):
+    """Dials every number once, concurrently, through the real Twilio client against the fake server."""
+    async def main():
+        async with serve(server) as base_url:
+            place_call, wait_for_end = call_functions(twilio_client(base_url), poll_seconds=0.05)
+            dialer = Dialer(place_call, wait_for_end, rng=random.Random(7), **dialer_kwargs)
+            try:
+                return await asyncio.gather(*(dialer.dial(number, priority) for priority, number in enumerate(numbers)))
+            finally:
+                await dialer.close()
+    return asyncio.run(main())
+
+def test_dialer_paces_call_creation():
+    numbers = [f"+1555020{index:04d}" for index in range(6)]
+    server = FakeTwilioServer(10, {number: 1.0 for number in numbers}, ring_seconds=0.1, talk_seconds=0.1)
+
+    results = _dial_all(server, numbers, calls_per_second=4, burst=1, max_calls_per_number=1, max_attempts=1)
+
+    assert [result.status for result in results] == ["completed"] * len(numbers)
+    created = [at for at, _ in server.accepted]
+    assert len(created) == len(numbers)
+    # One token per 1/4 s after the first; allow for timer jitter
+    assert min(later - earlier for earlier, later in zip(created, created[1:])) >= 0.25 * 0.9
+    assert server.rejected == 0
+
+def test_dialer_retries_unanswered_calls_only():
+    server = FakeTwilioServer(10, {ANSWERS: 1.0, NEVER_ANSWERS: 0.0}, ring_seconds=0.1, talk_seconds=0.1)
+
+    answered, unanswered = _dial_all(server, [ANSWERS, NEVER_ANSWERS], calls_per_second=20, burst=2,
+                                     max_calls_per_number=1, max_attempts=3, backoff_seconds=0.1,
+                                     backoff_max_seconds=0.2)
+
+    assert (answered.status, answered.attempts) == ("completed", 1)
+    assert server.attempts(ANSWERS) == 1
+    assert unanswered.status in ("busy", "no-answer")
+    assert unanswered.attempts == 3
+    assert server.attempts(NEVER_ANSWERS) == 3
+    assert max(server.max_overlap.values()) == 1
+
+def test_rate_limited_creates_are_requeued_without_counting_an_attempt():
+    numbers = [f"+1555030{index:04d}" for index in range(4)]
+    # The dialer is paced faster than the account allows, so some creates get a 429
+    server = FakeTwilioServer(2, {number: 1.0 for number in numbers}, ring_seconds=0.1, talk_seconds=0.1)
+
+    results = _dial_all(server, numbers, calls_per_second=20, burst=4, max_calls_per_number=1, max_attempts=1)
+
+    assert server.rejected > 0
+    assert [(result.status, result.attempts) for result in results] == [("completed", 1)] * len(numbers)
+    assert [server.attempts(number) for number in numbers] == [1] * len(numbers)
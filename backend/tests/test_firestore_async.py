@@ -0,0 +1,57 @@
+import asyncio
+import gc
+
+from agents.firestore_async import AsyncFirestoreWriter, InMemoryAsyncFirestore
+
+def test_full_queue_keeps_write_order():
+    async def run():
+        store = InMemoryAsyncFirestore()
+        writer = AsyncFirestoreWriter(store, max_pending=2)
+        # Sync producers in the loop never block, even far past the queue size
+        for value in range(10):
+            writer.set_nowait("users/u1", {"status": value, f"field{value}": True})
+        await writer.flush()
+        return store, writer
+
+    store, writer = asyncio.run(run())
+    assert store.documents["users/u1"]["status"] == 9
+    assert all(store.documents["users/u1"][f"field{value}"] for value in range(10))
+    assert writer.writes_committed == 10
+
+def test_async_set_waits_behind_held_writes():
+    async def run():
+        store = InMemoryAsyncFirestore()
+        writer = AsyncFirestoreWriter(store, max_pending=1)
+        for value in range(5):
+            writer.set_nowait("users/u1", {"status": value})
+        await writer.set("users/u1", {"status": "last"})
+        await writer.flush()
+        return store
+
+    assert asyncio.run(run()).documents["users/u1"]["status"] == "last"
+
+class _FailingBatch:
+    def set(self, reference, data, merge=False):
+        pass
+
+    async def commit(self):
+        raise RuntimeError("unavailable")
+
+class _FailingFirestore(InMemoryAsyncFirestore):
+    def batch(self):
+        return _FailingBatch()
+
+def test_failed_commit_is_counted_without_unretrieved_futures():
+    errors = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        writer = AsyncFirestoreWriter(_FailingFirestore())
+        writer.set_nowait("users/u1", {"status": "lost"})
+        await writer.flush()
+        gc.collect()
+        return writer
+
+    writer = asyncio.run(run())
+    assert writer.writes_failed == 1
+    assert errors == []
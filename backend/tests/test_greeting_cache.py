@@ -0,0 +1,39 @@
+import io
+import wave
+
+import numpy as np
+
+from agents.greeting_cache import SAMPLE_RATE, read_wav, to_mulaw
+from agents.vad import decode_mulaw, encode_mulaw
+
+def test_encode_mulaw_round_trips_within_a_quantization_step():
+    samples = np.arange(-32768, 32768, 7, dtype=np.int16)
+    decoded = decode_mulaw(encode_mulaw(samples)).astype(np.int32)
+    # μ-law steps grow with the magnitude, up to 1024 in the loudest segment
+    assert np.all(np.abs(decoded - samples) <= np.maximum(16, np.abs(samples.astype(np.int32)) // 16))
+    assert encode_mulaw(np.array([0, 32767, -32768], dtype=np.int16)) == bytes([0xFF, 0x80, 0x00])
+
+def test_wav_is_trimmed_mixed_down_and_resampled():
+    rate = 24000
+    t = np.arange(rate) / rate
+    tone = (8000 * np.sin(2 * np.pi * 440 * t)).astype(np.int16)
+    silence = np.zeros(rate // 2, dtype=np.int16)
+    left = np.concatenate([silence, tone, silence])
+    data = io.BytesIO()
+    with wave.open(data, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.column_stack([left, left]).tobytes())
+
+    samples, frame_rate = read_wav(data.getvalue())
+    assert (samples.shape, frame_rate) == ((len(left), 2), rate)
+    audio = to_mulaw(samples, frame_rate)
+
+    # One byte per sample at 8 kHz, and about the tone's one second
+    assert abs(len(audio) - SAMPLE_RATE) < SAMPLE_RATE // 20
+    decoded = decode_mulaw(audio).astype(np.float64)
+    assert np.sqrt(np.mean(decoded ** 2)) > 8000 / np.sqrt(2) * 0.8
+
+def test_silence_only_gives_no_audio():
+    assert to_mulaw(np.zeros(4800, dtype=np.int16), 24000) == b""
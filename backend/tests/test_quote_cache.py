@@ -0,0 +1,34 @@
+from agents.quote_cache import QuoteCache, job_signature
+
+JOB = {
+    "current_address": "825 Menlo Ave, Menlo Park, CA 94025",
+    "destination_address": "200 First St, Miami, FL 33131",
+    "is_long_distance": True,
+    "apartment_size": "studio, 500 sq ft",
+    "move_out_date": "2024-12-10T00:00:00",
+}
+PROVIDER = {"name": "Bay Movers", "phone": "650-555-0100"}
+SUMMARY = "- Final negotiated price: **$1,900.00**"
+
+class UnusedDb:
+    """Fails any Firestore access: jobs without a signature must not touch the cache."""
+
+    def collection(self, name):
+        raise AssertionError(f"quote cache read or written: {name}")
+
+def test_complete_job_has_a_signature():
+    assert job_signature("movers", JOB) == "movers|xs|long-940-331|2024-w25"
+
+def test_job_with_an_unknown_bucket_has_no_signature():
+    assert job_signature("movers", {**JOB, "apartment_size": "a few rooms"}) is None
+    assert job_signature("movers", {**JOB, "current_address": "Menlo Park"}) is None
+    assert job_signature("movers", {**JOB, "destination_address": "Miami"}) is None
+    assert job_signature("movers", {**JOB, "move_out_date": "next month"}) is None
+    assert job_signature("movers", {}) is None
+
+def test_jobs_without_a_signature_skip_the_cache():
+    cache = QuoteCache(db=UnusedDb())
+    assert cache.lookup(PROVIDER, None) is None
+    assert cache.prioritize([PROVIDER], None) == [(PROVIDER, None)]
+    assert cache.record(PROVIDER, None, SUMMARY) is False
+    assert cache.stats == {"hit": 0, "weak": 0, "miss": 0, "stored": 0}
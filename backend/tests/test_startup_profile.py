@@ -0,0 +1,11 @@
+import os
+
+from agents.startup_profile import DEFAULT_BUDGET_MS, profile_import
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_app_cold_import_is_within_budget():
+    # A fresh interpreter, so the import is cold however much this test run has imported already
+    total_ms, imports = profile_import("app", BACKEND_DIR)
+    assert imports, "no -X importtime output"
+    assert total_ms <= DEFAULT_BUDGET_MS, f"cold import of app took {total_ms:.0f} ms"
@@ -0,0 +1,81 @@
+import threading
+import time
+
+from agents.cancellation import CancelToken
+from agents.state_sink import UserStateSink
+
+class SlowWriter:
+    """Records the documents the sink writes, each write taking `delay` seconds."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.writes = []
+        self.document = {}
+        self.in_flight = 0
+        self.overlapped = False
+
+    def __call__(self, user_id, data, merge=True):
+        self.in_flight += 1
+        self.overlapped |= self.in_flight > 1
+        time.sleep(self.delay)
+        self.writes.append((dict(data), merge))
+        self.document = {**self.document, **data} if merge else dict(data)
+        self.in_flight -= 1
+
+def test_flushes_commit_in_order():
+    writer = SlowWriter(delay=0.05)
+    sink = UserStateSink("u1", flush_delay=None, writer=writer)
+    sink.update({"movers": ["a"]})
+    first = threading.Thread(target=sink.flush)
+    first.start()
+    time.sleep(0.01)
+    sink.update({"movers": ["a", "b"]})
+    sink.flush()
+    first.join()
+    assert not writer.overlapped
+    assert writer.document["movers"] == ["a", "b"]
+
+def test_replace_is_not_overwritten_by_flush_in_flight():
+    writer = SlowWriter(delay=0.05)
+    sink = UserStateSink("u1", flush_delay=None, writer=writer)
+    sink.update({"status": "analyzing"})
+    flushing = threading.Thread(target=sink.flush)
+    flushing.start()
+    time.sleep(0.01)
+    sink.replace({"status": "info_collection"})
+    flushing.join()
+    assert writer.document == {"status": "info_collection"}
+
+def test_update_does_not_mutate_caller_values():
+    writer = SlowWriter()
+    sink = UserStateSink("u1", flush_delay=None, writer=writer)
+    info = {"name": "Dean"}
+    sink.update({"customerInfo": info})
+    sink.update({"customerInfo": {"phone": "650-321-4321"}})
+    sink.flush()
+    assert info == {"name": "Dean"}
+    assert writer.writes[-1][0]["customerInfo"] == {"name": "Dean", "phone": "650-321-4321"}
+
+def test_cancel_drops_pending_and_later_updates():
+    writer = SlowWriter()
+    token = CancelToken()
+    sink = UserStateSink("u1", flush_delay=0.05, writer=writer, cancel_token=token)
+    sink.update({"status": "negotiating"})
+    token.cancel("new_chat")
+    sink.update({"status": "analyzing"})
+    sink.flush()
+    time.sleep(0.1)  # Past the flush delay of both updates
+    assert writer.writes == []
+
+def test_cancel_waits_for_a_write_in_flight():
+    writer = SlowWriter(delay=0.1)
+    token = CancelToken()
+    sink = UserStateSink("u1", flush_delay=None, writer=writer, cancel_token=token)
+    sink.update({"status": "negotiating"})
+    flushing = threading.Thread(target=sink.flush)
+    flushing.start()
+    time.sleep(0.02)
+    token.cancel("new_chat")
+    # The old session's last write has landed before the next session starts writing
+    assert writer.in_flight == 0 and len(writer.writes) == 1
+    flushing.join()
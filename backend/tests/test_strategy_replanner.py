@@ -0,0 +1,33 @@
+import pytest
+
+from agents.strategy_replanner import StrategyReplanner, extract_offer
+
+@pytest.mark.parametrize("summary, expected", [
+    ("- Initial quoted price: **$2,400.00**\n- Final negotiated price: **$1,950.00**", 1950.0),
+    ("- **Final quote:** $1,800 flat", 1800.0),
+    ("- **Total:** $1,800 ($200 deposit due at booking)", 1800.0),
+    ("- **Quote:** $1,500 plus a $95 fuel fee", 1500.0),
+    ("- **Price:** $1,200 - $100 fee waived", 1200.0),
+    ("- **Quote:** $150/hr, 3 hour minimum, estimated total $450", 450.0),
+])
+def test_extract_offer_takes_total_amounts(summary, expected):
+    assert extract_offer(summary) == expected
+
+@pytest.mark.parametrize("summary", [
+    "- **Hourly rate:** $150",
+    "- **Quote:** $150/hr for 3 movers",
+    "- **Offer:** $140 per hour",
+    "- **Price:** $45 an hour per mover",
+    "- **Deposit:** $200 to hold the date",
+    "- **Booking fee:** $50",
+    "- Mentioned a $25 surcharge for stairs",
+])
+def test_extract_offer_ignores_rates_deposits_and_fees(summary):
+    assert extract_offer(summary) is None
+
+def test_rate_below_best_offer_does_not_trigger_replan():
+    replanner = StrategyReplanner()
+    assert replanner.update("Acme Movers", "- **Final quote:** $1,800")
+    assert not replanner.update("Budget Movers", "- **Quote:** $120/hr\n- **Deposit:** $300")
+    assert replanner.state.best_price == 1800.0
+    assert replanner.state.best_provider == "Acme Movers"
@@ -1,31 +1,45 @@
 import os
 import json
-import base64
 import asyncio
-import websockets
+import time
+import threading
+from functools import lru_cache
+from typing import Optional
 from fastapi import FastAPI, WebSocket, Request
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.websockets import WebSocketDisconnect
 from fastapi import BackgroundTasks
 # from twilio.twiml.voice_response import VoiceResponse, Connect, Say, Stream
 from twilio.twiml.voice_response import VoiceResponse, Gather, Connect, Say, Stream
-from twilio.rest import Client
 from dotenv import load_dotenv
-from flask import Blueprint, request, jsonify
 from fastapi import APIRouter, Request, HTTPException
-from agents import firebase
+from agents import cancellation, firebase, metrics, media_events
 from agents.firebase import CallStatus
-
-import openai
-import io
-from pydub import AudioSegment
+from agents.log import configure_logging, get_logger, bind_call
+from agents.call_timing import CallTimeline, aggregator as call_timing_aggregator
+from agents.config import Config
+from agents.media_relay import RelaySender
+from agents.audio_packetizer import AudioPacketizer, MULAW_BYTES_PER_MS
+from agents.call_store import gateway_worker_for, get_call_store
+from agents.transcripts import TranscriptWriter, format_for_summary, iter_transcript
 
 router = APIRouter()
 
 load_dotenv()
 
-twilio_client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'))
-client = openai.OpenAI()
+configure_logging()
+logger = get_logger("voice_server")
+
+@lru_cache(maxsize=None)
+def get_twilio_client():
+    """Create the Twilio REST client on first use, keeping twilio.rest off the import path."""
+    from twilio.rest import Client
+    from agents.cassette import get_cassette, twilio_http_client
+    client = Client(os.getenv('TWILIO_ACCOUNT_SID'), os.getenv('TWILIO_AUTH_TOKEN'),
+                    http_client=twilio_http_client() if get_cassette() is not None else None)
+    if Config.TWILIO_API_BASE_URL:
+        client.api.base_url = Config.TWILIO_API_BASE_URL
+    return client
 
 
 # Configuration
@@ -34,13 +48,8 @@ SERVER_ENDPOINT = os.getenv('SERVER_ENDPOINT')
 PORT = int(os.getenv('PORT', 5050))
 
 VOICE = 'alloy'
-LOG_EVENT_TYPES = [
-    'error', 'response.content.done', 'rate_limits.updated',
-    'response.done', 'input_audio_buffer.committed',
-    'input_audio_buffer.speech_stopped', 'input_audio_buffer.speech_started',
-    'session.created', 'transcript.final'
-]
-SHOW_TIMING_MATH = False
+# Twilio mark sent after the pre-rendered greeting, echoed back once it has played
+GREETING_MARK = "greeting"
 
 # Define the prompt at the top of the file
 INITIAL_PROMPT = (
@@ -53,10 +62,6 @@ INITIAL_CONVERSATION_TEXT = (
         "Hello! I'm interested in scheduling moving services. "
         "you have available?"
 )
-call_sid = None
-
-current_user_id = None
-
 app = FastAPI()
 
 if not OPENAI_API_KEY:
@@ -66,24 +71,44 @@ if not OPENAI_API_KEY:
 @router.api_route("/outgoing-call-twiml", methods=["GET", "POST"])
 async def outgoing_call_twiml(request: Request):
     """Provide TwiML instructions for the outgoing call."""
+    # Twilio sends the CallSid with the TwiML request; it picks the gateway worker for the stream
+    form = await request.form() if request.method == "POST" else {}
+    sid = form.get("CallSid") or request.query_params.get("CallSid")
     response = VoiceResponse()
-    response.say("Please wait while we connect your call to my assistant")
-    response.pause(length=1)
+    # The call store can be remote (CALL_STATE_STORE=firestore), keep its reads off the event loop
+    if not await asyncio.to_thread(_greeting_cached, sid):
+        response.say("Please wait while we connect your call to my assistant")
+        response.pause(length=1)
     # response.say("Hi, How's it going?")
     connect = Connect()
-    connect.stream(url=f'wss://{request.url.hostname}/media-stream')
+    connect.stream(url=media_stream_url(Config.MEDIA_GATEWAY_HOST or request.url.hostname, sid))
     response.append(connect)
     return HTMLResponse(content=str(response), media_type="application/xml")
 
+def _greeting_cached(call_sid):
+    """Whether the stream will open with a pre-rendered greeting, making the hold message unnecessary."""
+    if not Config.GREETING_CACHE or not call_sid:
+        return False
+    call = get_call_store().get(call_sid)
+    if call is None:
+        return False
+    from agents.greeting_cache import get_greeting_cache
+    return get_greeting_cache().has(
+        call.get("service_category", "movers"), call.get("conversation_text", INITIAL_CONVERSATION_TEXT), VOICE
+    )
+
+def media_stream_url(host, call_sid=None):
+    """The stream URL path names the media-gateway worker that relays the call."""
+    return f'wss://{host}/media-stream/{gateway_worker_for(call_sid, Config.MEDIA_GATEWAY_WORKERS)}'
+
 @router.api_route("/")
 async def index_page():
     return {"message": "Voice Server is running!"}
 
-def handle_outgoing_call_sync(to_number):
+def handle_outgoing_call_sync(to_number, user_id=None, initial_prompt=INITIAL_PROMPT, conversation_text=INITIAL_CONVERSATION_TEXT,
+                              service_category="movers"):
     """Initiate an outgoing call and return call SID."""
 
-    global call_sid
-
     if not to_number:
         raise ValueError("Missing 'to' phone number")
     
@@ -91,77 +116,268 @@ def handle_outgoing_call_sync(to_number):
         raise ValueError("Missing 'TWILIO_PHONE_NUMBER' environment variable")
 
     # Function to initiate the call
-    call = twilio_client.calls.create(
+    dialed_at_ms = time.time() * 1000
+    call = get_twilio_client().calls.create(
         to=to_number,
         from_=os.getenv('TWILIO_PHONE_NUMBER'),
         url=f'{os.getenv("SERVER_ENDPOINT")}/outgoing-call-twiml'
     )
-    print(f"Call initiated: {call.sid}")
+    logger.info("Call initiated", extra={"call_sid": call.sid})
+
+    # The media stream may be relayed by another process, which looks the call up by SID
+    get_call_store().put(
+        call.sid,
+        user_id=user_id,
+        initial_prompt=initial_prompt,
+        conversation_text=conversation_text,
+        service_category=service_category,
+        dialed_at_ms=dialed_at_ms,
+    )
 
-    firebase.update_call_data(current_user_id, call.sid, {
+    firebase.update_call_data(user_id, call.sid, {
                 "status": CallStatus.CALL_INITIATED
     })
 
-    call_sid = call.sid
-
     return call.sid
 
+def hang_up_call(call_sid):
+    """End a call, ringing or in progress, and stop its media stream if this process relays it."""
+    get_twilio_client().calls(call_sid).update(status="completed")
+    cancellation.cancel_call(call_sid)
+    logger.info("Call hung up", extra={"call_sid": call_sid})
+
 def check_call_status(call_sid):
-    call = twilio_client.calls(call_sid).fetch()
+    call = get_twilio_client().calls(call_sid).fetch()
         
     return call.status
 
 def get_call_data(call_sid):
     try:
-        call_data = firebase.get_call_data_as_json(current_user_id, call_sid)
+        call = get_call_store().get(call_sid) or {}
+        call_data = firebase.get_call_data_as_json(call.get("user_id"), call_sid)
         return call_data
     except Exception as e:
-        print(f"Error getting call data: {e}")
+        logger.warning("Error getting call data", extra={"error": str(e)})
         return None
 
-def initiate_call_with_prompt(phone_number, initial_prompt, conversation_text, user_id):
-    """Function to initiate a call with specific prompts."""
+CALL_ENDED_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+
+def wait_for_call_end(call_sid, poll_seconds=5.0, grace_seconds=20.0, cancel_token=None):
+    """
+    Block until the media stream has stored the call's transcript, or the call ended
+    without one. The call document is watched, so this returns as soon as the stream
+    closes; Twilio's call status is polled as a fallback for calls that never connect.
+
+    Polling stops as soon as `cancel_token`, by default the current one, is cancelled.
+
+    Returns:
+        str: The final Twilio call status, or "canceled" when cancelled
+    """
+    cancel_token = cancel_token or cancellation.current_token()
+    call = get_call_store().get(call_sid) or {}
+    finished = threading.Event()
+    unregister = cancel_token.on_cancel(finished.set) if cancel_token is not None else lambda: None
+    watch = None
+    try:
+        watch = firebase.watch_call_data(call.get("user_id"), call_sid,
+                                         lambda data: "transcript" in data and finished.set())
+    except Exception as e:
+        logger.warning("Could not watch call document, polling only", extra={"error": str(e)})
+
+    try:
+        status = None
+        ended_at = None
+        while not finished.wait(poll_seconds):
+            status = check_call_status(call_sid)
+            if status not in CALL_ENDED_STATUSES:
+                continue
+            if status != "completed" or watch is None:
+                break
+            # Answered calls: give the media stream a moment to write the transcript
+            ended_at = ended_at or time.monotonic()
+            if time.monotonic() - ended_at >= grace_seconds:
+                break
+        if cancel_token is not None and cancel_token.cancelled:
+            cancellation.reclaimed(cancel_token, "call_poller")
+            return "canceled"
+        return status or check_call_status(call_sid)
+    finally:
+        unregister()
+        if watch is not None:
+            watch.unsubscribe()
 
+def get_call_summary(call_sid):
+    """The summary the media stream folded during the call, if it finished one."""
+    try:
+        call = get_call_store().get(call_sid) or {}
+        return (firebase.get_call_data_as_json(call.get("user_id"), call_sid) or {}).get("summary")
+    except Exception as e:
+        logger.warning("Error reading call summary", extra={"error": str(e)})
+        return None
 
-    print(f"Initial prompt: {initial_prompt}")
-    print(f"Conversation text: {conversation_text}")
-    print(f"Phone number: {phone_number}")
-    # Set the initial prompt and conversation text
-    global INITIAL_PROMPT, INITIAL_CONVERSATION_TEXT, current_user_id
-    INITIAL_PROMPT = initial_prompt
-    INITIAL_CONVERSATION_TEXT = conversation_text
-    current_user_id = user_id
+def get_call_transcript(call_sid):
+    """The call's transcript as speaker turns, ready for the summarizer."""
+    try:
+        call = get_call_store().get(call_sid) or {}
+        return format_for_summary(iter_transcript(call.get("user_id"), call_sid)) or None
+    except Exception as e:
+        logger.warning("Error reading call transcript", extra={"error": str(e)})
+        return None
+
+@lru_cache(maxsize=None)
+def get_dialer():
+    """The process-wide dialer that paces, queues and retries outgoing calls."""
+    from agents.dialer import BackgroundDialer
+
+    async def place_call(to_number, **call_kwargs):
+        return await asyncio.to_thread(handle_outgoing_call_sync, to_number, **call_kwargs)
+
+    async def wait_for_end(call_sid):
+        return await asyncio.to_thread(wait_for_call_end, call_sid)
+
+    async def hang_up(call_sid):
+        await asyncio.to_thread(hang_up_call, call_sid)
+
+    return BackgroundDialer(place_call, wait_for_end, hang_up=hang_up)
+
+def dial_and_wait(phone_number, initial_prompt, conversation_text, user_id, service_category="movers", priority=None,
+                  cancel_token=None):
+    """
+    Place a call through the dialer and block until it is over, including retries
+    of busy or unanswered attempts. Cancelling `cancel_token` drops the call, or hangs
+    it up when live, and raises Cancelled.
+
+    Returns:
+        DialResult: The SID and final status of the last attempt
+    """
+    logger.debug("Call prompts", extra={"initial_prompt": initial_prompt, "conversation_text": conversation_text})
+    logger.info("Queueing call", extra={"phone_number": phone_number})
+    return get_dialer().dial(
+        phone_number,
+        priority,
+        cancel_token,
+        user_id=user_id,
+        initial_prompt=initial_prompt,
+        conversation_text=conversation_text,
+        service_category=service_category,
+    )
+
+def initiate_call_with_prompt(phone_number, initial_prompt, conversation_text, user_id, service_category="movers"):
+    """Function to initiate a call with specific prompts."""
 
-    print(f"Initiating call to {phone_number}")
+
+    logger.debug("Call prompts", extra={"initial_prompt": initial_prompt, "conversation_text": conversation_text})
+    logger.info("Initiating call", extra={"phone_number": phone_number})
 
     # Call the handle_outgoing_call function
-    response =  handle_outgoing_call_sync(phone_number)
+    response =  handle_outgoing_call_sync(phone_number, user_id, initial_prompt, conversation_text, service_category)
     return response
 
 
+async def _wait_for_start(messages) -> Optional[media_events.TwilioStart]:
+    """Read Twilio messages up to the start event, which carries the call SID."""
+    async for message in messages:
+        event = media_events.decode_twilio(message)
+        if isinstance(event, media_events.TwilioStart):
+            return event
+    return None
+
+async def _load_call_state(call_sid, wait_seconds=2.0):
+    """
+    Fetch the state stored when the call was placed. The call can be answered before
+    calls.create() returns to the process that placed it, so wait briefly for it.
+    """
+    store = get_call_store()
+    deadline = time.monotonic() + wait_seconds
+    while True:
+        call = await asyncio.to_thread(store.get, call_sid)
+        if call is not None:
+            return call
+        if time.monotonic() >= deadline:
+            # A gateway on another host than the API only sees the state with CALL_STATE_STORE=firestore
+            logger.warning("No stored state for call, using the default prompt",
+                           extra={"call_sid": call_sid, "call_state_store": Config.CALL_STATE_STORE})
+            return {}
+        await asyncio.sleep(0.05)
+
+async def _close_unused(connect_task):
+    """Cancel, or close, an OpenAI connection the stream ended up not using."""
+    if connect_task.cancel():
+        return
+    if not connect_task.cancelled() and connect_task.exception() is None:
+        await connect_task.result().close()
+
 @router.websocket("/media-stream")
-async def handle_media_stream(websocket: WebSocket):
+@router.websocket("/media-stream/{worker}")
+async def handle_media_stream(websocket: WebSocket, worker: Optional[int] = None):
     """Handle WebSocket connections between Twilio and OpenAI."""
-    print("Client connected")
+    import websockets
+    from agents.cassette import connect_realtime
+
     await websocket.accept()
+    metrics.MEDIA_ACTIVE_STREAMS.inc()
+    messages = websocket.iter_text()
+
+    # Open the Realtime session while waiting for Twilio's start event
+    openai_connect = asyncio.ensure_future(connect_realtime(lambda: websockets.connect(
+        Config.OPENAI_REALTIME_URL,
+        extra_headers={
+            "Authorization": f"Bearer {OPENAI_API_KEY}",
+            "OpenAI-Beta": "realtime=v1"
+        }
+    )))
 
-    # Initialize transcripts list
-    transcripts = []
+    call_sid = user_id = timeline = transcript = summarizer = openai_ws = None
 
     try:
-        async with websockets.connect(
-            'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01',
-            extra_headers={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "OpenAI-Beta": "realtime=v1"
-            }
-        ) as openai_ws:
+        try:
+            start = await _wait_for_start(messages)
+        except WebSocketDisconnect:
+            start = None
+        if start is None:
+            logger.info("Stream closed before it started")
+            return
+
+        call_sid = start.call_sid
+        call = await _load_call_state(call_sid)
+        user_id = call.get("user_id")
+        bind_call(call_sid, user_id)
+        logger.info("Client connected", extra={"worker": worker})
+        timeline = CallTimeline(call_sid, call.get("dialed_at_ms"))
+        timeline.on_pickup()
+        if Config.LIVE_SUMMARY:
+            from agents.live_summary import LiveSummarizer
+            summarizer = LiveSummarizer(user_id, call_sid, call.get("service_category", "movers"))
+        transcript = TranscriptWriter(user_id, call_sid, on_segment=summarizer.add if summarizer else None)
+
+        greeting = None
+        if Config.GREETING_CACHE:
+            from agents.greeting_cache import get_greeting_cache
+            greeting = get_greeting_cache().get(
+                call.get("service_category", "movers"), call.get("conversation_text", INITIAL_CONVERSATION_TEXT), VOICE
+            )
+        if greeting is not None:
+            # Play the opening line while the Realtime session connects and initializes
+            for payload in greeting.payloads():
+                await websocket.send_text(media_events.twilio_media(start.stream_sid, payload))
+            await websocket.send_text(media_events.twilio_mark(start.stream_sid, GREETING_MARK))
+            timeline.on_greeting(greeting.duration_ms)
+            await transcript.append("assistant", greeting.text)
+        greeting_playing = greeting is not None
+
+        openai_ws = await openai_connect
+        try:
             # When call is picked up, update status
-            firebase.update_call_data(current_user_id, call_sid, {
+            await firebase.update_call_data_async(user_id, call_sid, {
                 "status": CallStatus.CALL_INPROGRESS
             })
 
-            await initialize_session(openai_ws)
+            await initialize_session(
+                openai_ws,
+                call.get("initial_prompt", INITIAL_PROMPT),
+                call.get("conversation_text", INITIAL_CONVERSATION_TEXT),
+                greeting.text if greeting is not None else None,
+            )
 
             # Connection specific state
             stream_sid = None
@@ -169,197 +385,283 @@ async def handle_media_stream(websocket: WebSocket):
             last_assistant_item = None
             mark_queue = []
             response_start_timestamp_twilio = None
-            
-            audio_buffer = []  # Global state for accumulating audio data
+
+            async def send_mark():
+                """Send one mark per batch of audio frames written to Twilio."""
+                if stream_sid:
+                    await websocket.send_text(media_events.twilio_mark(stream_sid, "responsePart"))
+                    mark_queue.append('responsePart')
+
+            # One bounded queue and writer task per direction, so a slow peer only stalls itself
+            to_openai = RelaySender(
+                openai_ws.send,
+                metrics.TWILIO_TO_OPENAI,
+                render_audio=media_events.audio_append,
+                max_frames=Config.MEDIA_QUEUE_MAX_FRAMES,
+                policy=Config.MEDIA_AUDIO_POLICY,
+            )
+            to_twilio = RelaySender(
+                websocket.send_text,
+                metrics.OPENAI_TO_TWILIO,
+                render_audio=lambda payload: media_events.twilio_media(stream_sid, payload),
+                max_frames=Config.MEDIA_QUEUE_MAX_FRAMES,
+                policy=Config.MEDIA_AUDIO_POLICY,
+                after_audio=send_mark,
+            )
+            # Merges small audio deltas into frames, so Twilio gets fewer media messages and marks
+            packetizer = AudioPacketizer(Config.MEDIA_OUTBOUND_FRAME_MS)
+            vad = silence_filter = None
+            if Config.MEDIA_VAD:
+                from agents.vad import SilenceFilter, VoiceActivityDetector
+                vad = VoiceActivityDetector(hangover_ms=Config.MEDIA_VAD_HANGOVER_MS)
+                silence_filter = SilenceFilter(Config.MEDIA_VAD_SILENCE, Config.MEDIA_VAD_THIN_EVERY)
+
+            async def save_transcript(role, message):
+                await transcript.append(role, message)
+
+            def audio_in_flight() -> bool:
+                """The greeting or response audio sent to Twilio hasn't all been played yet."""
+                return greeting_playing or bool(mark_queue)
+
+            # Barge-ins started from the VAD of the media handler, held until they finish
+            local_barge_ins = set()
+
+            def on_local_barge_in_done(task):
+                local_barge_ins.discard(task)
+                if not task.cancelled() and task.exception() is not None:
+                    logger.error("Local barge-in failed", exc_info=task.exception())
+
+            # Twilio events
+            def on_twilio_media(event, received_at):
+                nonlocal latest_media_timestamp
+                latest_media_timestamp = event.timestamp
+                if vad is None:
+                    to_openai.put_audio(event.payload, received_at)
+                else:
+                    decision = vad.push(event.payload)
+                    frames = silence_filter.push(event.payload, decision.active)
+                    for payload in frames:
+                        to_openai.put_audio(payload, received_at)
+                    metrics.MEDIA_VAD_FRAMES.labels("forwarded" if frames else "suppressed").inc()
+                    if decision.started and Config.MEDIA_VAD_BARGE_IN:
+                        logger.info("Speech started detected locally")
+                        timeline.on_speech_started()
+                        if audio_in_flight():
+                            task = asyncio.ensure_future(barge_in("local"))
+                            local_barge_ins.add(task)
+                            task.add_done_callback(on_local_barge_in_done)
+                logger.debug("Queued audio for OpenAI", extra={"sample_every": 50, "queue_depth": to_openai.depth})
+
+            def on_twilio_start(event, received_at):
+                nonlocal stream_sid, latest_media_timestamp, last_assistant_item, response_start_timestamp_twilio
+                stream_sid = event.stream_sid
+                logger.info("Incoming stream has started", extra={"stream_sid": stream_sid})
+                response_start_timestamp_twilio = None
+                latest_media_timestamp = 0
+                last_assistant_item = None
+
+            def on_twilio_mark(event, received_at):
+                nonlocal greeting_playing
+                if event.name == GREETING_MARK:
+                    greeting_playing = False
+                elif mark_queue:
+                    mark_queue.pop(0)
+
+            twilio_handlers = {
+                media_events.TwilioMedia: on_twilio_media,
+                media_events.TwilioStart: on_twilio_start,
+                media_events.TwilioMark: on_twilio_mark,
+            }
 
             async def receive_from_twilio():
                 """Receive audio data from Twilio and send it to the OpenAI Realtime API."""
-                nonlocal stream_sid, latest_media_timestamp, transcripts
-
                 try:
-                    async for message in websocket.iter_text():
-                        data = json.loads(message)
-
-                        if data['event'] == 'media':
-                            latest_media_timestamp = int(data['media']['timestamp'])
-                            
-                            audio_buffer.append(base64.b64decode(data['media']['payload']))  # Accumulate audio data
-
-                            # Decode the base64 audio data to bytes
-                            audio_bytes = base64.b64decode(data['media']['payload'])
-
-                            # Create an in-memory file-like object for the binary audio data
-                            audio_stream = io.BytesIO(audio_bytes)
-
-                            audio_append = {
-                                "type": "input_audio_buffer.append",
-                                "audio": data['media']['payload']
-                            }
-
-                            # print("sending audio_append")
-                            await openai_ws.send(json.dumps(audio_append))
-
-                        elif data['event'] == 'start':
-                            stream_sid = data['start']['streamSid']
-                            print(f"Incoming stream has started {stream_sid}")
-                            response_start_timestamp_twilio = None
-                            latest_media_timestamp = 0
-                            last_assistant_item = None
-                        elif data['event'] == 'mark':
-                            if mark_queue:
-                                mark_queue.pop(0)
+                    async for message in messages:
+                        received_at = time.perf_counter()
+                        event = media_events.decode_twilio(message)
+                        handler = twilio_handlers.get(type(event))
+                        if handler is not None:
+                            handler(event, received_at)
                 except WebSocketDisconnect:
-                    print("Client disconnected.")
-                    if openai_ws.open:
-                        await openai_ws.close()
-                    # Update Firestore status to call disconnected
-                    firebase.update_call_data(current_user_id, call_sid, {
-                        "status": CallStatus.CALL_COMPLETED
-                    })
+                    pass
+                # iter_text() also ends without raising when Twilio hangs up
+                logger.info("Client disconnected")
+                if openai_ws.open:
+                    await openai_ws.close()
+                # Update Firestore status to call disconnected
+                await firebase.update_call_data_async(user_id, call_sid, {
+                    "status": CallStatus.CALL_COMPLETED
+                })
+
+            # OpenAI Realtime events
+            async def on_audio_delta(event):
+                nonlocal last_assistant_item, response_start_timestamp_twilio
+                for payload in packetizer.push(event.delta, event.item_id):
+                    to_twilio.put_audio(payload)
+                timeline.on_audio_delta()
+
+                if response_start_timestamp_twilio is None:
+                    response_start_timestamp_twilio = latest_media_timestamp
+                    logger.debug("Setting start timestamp for new response", extra={"timestamp_ms": response_start_timestamp_twilio})
+
+                if event.item_id:
+                    last_assistant_item = event.item_id
+
+            async def on_audio_done(event):
+                for payload in packetizer.flush():
+                    to_twilio.put_audio(payload)
+
+            async def on_response_done(event):
+                await on_audio_done(event)
+                for transcript in event.transcripts:
+                    logger.info("AI said", extra={"transcript": transcript})
+                    await save_transcript("assistant", transcript)
+
+            async def on_user_transcript(event):
+                logger.info("User said", extra={"transcript": event.transcript})
+                await save_transcript("user", event.transcript)
+
+            async def on_assistant_text(event):
+                logger.info("AI sent a message", extra={"text": event.text})
+                await save_transcript("assistant", event.text)
+
+            async def on_speech_stopped(event):
+                timeline.on_speech_stopped()
+
+            # Trigger an interruption. Your use case might work better using `input_audio_buffer.speech_stopped`, or combining the two.
+            async def on_speech_started(event):
+                logger.info("Speech started detected")
+                audio_start_ms = event.audio_start_ms
+                timeline.on_speech_started(latest_media_timestamp - audio_start_ms if audio_start_ms is not None else None)
+                await barge_in("server")
+
+            async def barge_in(source):
+                """
+                Stop the audio playing to the callee. A no-op when nothing is playing, e.g. once a
+                response has been heard in full, or when the local VAD already stopped it.
+                """
+                nonlocal greeting_playing
+                if not audio_in_flight():
+                    return
+                if greeting_playing:
+                    # The callee talks over the greeting; it isn't a model item, so there is nothing to truncate
+                    logger.info("Interrupting greeting", extra={"source": source})
+                    greeting_playing = False
+                    to_twilio.put_control(media_events.twilio_clear(stream_sid))
+                    timeline.on_interruption_handled()
+                elif last_assistant_item:
+                    logger.info("Interrupting response", extra={"item_id": last_assistant_item, "source": source})
+                    if source == "local":
+                        # The server hasn't heard the speech yet, so it would keep generating the response
+                        to_openai.put_control(media_events.response_cancel())
+                    await handle_speech_started_event()
+                else:
+                    return
+                metrics.MEDIA_BARGE_IN.labels(source).inc()
+
+            async def on_error(event):
+                logger.warning("OpenAI Realtime error", extra={"error": event.error})
+
+            realtime_handlers = {
+                media_events.AudioDelta: on_audio_delta,
+                media_events.AudioDone: on_audio_done,
+                media_events.ResponseDone: on_response_done,
+                media_events.UserTranscript: on_user_transcript,
+                media_events.AssistantText: on_assistant_text,
+                media_events.SpeechStopped: on_speech_stopped,
+                media_events.SpeechStarted: on_speech_started,
+                media_events.RealtimeError: on_error,
+            }
 
             async def send_to_twilio():
                 """Receive events from the OpenAI Realtime API, send audio back to Twilio."""
-                nonlocal stream_sid, last_assistant_item, response_start_timestamp_twilio, transcripts
                 try:
                     async for openai_message in openai_ws:
-                        response = json.loads(openai_message)
-                        # print(f"Received event: {response['type']}", response)
-
-                        # Log the conversation.item.input_audio_transcription.completed event
-                        if response['type'] == 'conversation.item.input_audio_transcription.completed':
-                            print(f"User input: {response['transcript']}")
-
-                            transcripts.append({
-                                "role": "user",
-                                "message": response['transcript']
-                            })
-
-                            firebase.update_call_data(current_user_id, call_sid, {
-                                "transcripts": transcripts
-                            })
-
-                        if response['type'] in LOG_EVENT_TYPES:                            
-                            # Parse transcript from response.done event
-                            if response['type'] == 'response.done':
-                                try:
-                                    output = response['response']['output']
-                                    for item in output:
-                                        if item['role'] == 'assistant':
-                                            for content in item['content']:
-                                                if content.get('transcript'):
-                                                    print(f"\n\nAI said: {content['transcript']}\n\n")
-                                                    transcripts.append({
-                                                        "role": "assistant",
-                                                        "message": content['transcript']
-                                                    })
-                                                    firebase.update_call_data(current_user_id, call_sid, {
-                                                        "status": CallStatus.CALL_INPROGRESS,
-                                                        "transcripts": transcripts
-                                                    })
-                                except KeyError as e:
-                                    print(f"Error parsing response.done event: {e}")
-
-                        if response.get('type') == 'transcript.final':
-                            print(f"\n\nUser said: {response['text']}\n\n")
-                            transcripts.append({
-                                "role": "user",
-                                "message": response['text']
-                            })
-                            firebase.update_call_data(current_user_id, call_sid, {
-                                "status": CallStatus.CALL_INPROGRESS,
-                                "transcripts": transcripts
-                            })
-
-                        if response.get('type') == 'response.audio.delta' and 'delta' in response:
-                            audio_payload = base64.b64encode(base64.b64decode(response['delta'])).decode('utf-8')
-                            audio_delta = {
-                                "event": "media",
-                                "streamSid": stream_sid,
-                                "media": {
-                                    "payload": audio_payload
-                                }
-                            }
-                            await websocket.send_json(audio_delta)
-
-                            if response_start_timestamp_twilio is None:
-                                response_start_timestamp_twilio = latest_media_timestamp
-                                if SHOW_TIMING_MATH:
-                                    print(f"Setting start timestamp for new response: {response_start_timestamp_twilio}ms")
-
-                            # Update last_assistant_item safely
-                            if response.get('item_id'):
-                                last_assistant_item = response['item_id']
-
-                            await send_mark(websocket, stream_sid)
-
-                        # Print AI response for debugging
-                        if response.get('type') == 'response.text' and 'text' in response:
-                            print(f"\n\nAI has send a message: {response['text']}\n\n")
-                            transcripts.append({
-                                "role": "assistant",
-                                "message": response['text']
-                            })
-                            firebase.update_call_data(current_user_id, call_sid, {
-                                "status": CallStatus.CALL_INPROGRESS,
-                                "transcripts": transcripts
-                            })
-
-                        # Trigger an interruption. Your use case might work better using `input_audio_buffer.speech_stopped`, or combining the two.
-                        if response.get('type') == 'input_audio_buffer.speech_started':
-                            print("Speech started detected.")
-                            if last_assistant_item:
-                                print(f"Interrupting response with id: {last_assistant_item}")
-                                await handle_speech_started_event()
-                except Exception as e:
-                    print(f"Error in send_to_twilio: {e}")
+                        event = media_events.decode_realtime(openai_message)
+                        handler = realtime_handlers.get(type(event))
+                        if handler is None:
+                            logger.debug("Received OpenAI event", extra={"event_type": event.type, "sample_every": 50})
+                            continue
+                        await handler(event)
+                except Exception:
+                    logger.exception("Error in send_to_twilio")
 
             async def handle_speech_started_event():
                 """Handle interruption when the caller's speech starts."""
                 nonlocal response_start_timestamp_twilio, last_assistant_item
-                print("Handling speech started event.")
+                logger.debug("Handling speech started event")
                 if mark_queue and response_start_timestamp_twilio is not None:
-                    elapsed_time = latest_media_timestamp - response_start_timestamp_twilio
-                    if SHOW_TIMING_MATH:
-                        print(f"Calculating elapsed time for truncation: {latest_media_timestamp} - {response_start_timestamp_twilio} = {elapsed_time}ms")
+                    # Audio still buffered or queued never reached the caller, so cap at what was sent
+                    packetizer.reset()
+                    unsent_ms = to_twilio.clear_audio() // MULAW_BYTES_PER_MS
+                    elapsed_time = packetizer.truncate_offset(latest_media_timestamp - response_start_timestamp_twilio, unsent_ms)
+                    logger.debug("Calculating elapsed time for truncation", extra={
+                        "latest_media_timestamp": latest_media_timestamp,
+                        "response_start_timestamp": response_start_timestamp_twilio,
+                        "elapsed_ms": elapsed_time,
+                        "unsent_ms": unsent_ms,
+                    })
 
                     if last_assistant_item:
-                        if SHOW_TIMING_MATH:
-                            print(f"Truncating item with ID: {last_assistant_item}, Truncated at: {elapsed_time}ms")
-
-                        truncate_event = {
-                            "type": "conversation.item.truncate",
-                            "item_id": last_assistant_item,
-                            "content_index": 0,
-                            "audio_end_ms": elapsed_time
-                        }
-                        # print(f"Sending truncate event: {truncate_event}")
-                        await openai_ws.send(json.dumps(truncate_event))
-
-                    await websocket.send_json({
-                        "event": "clear",
-                        "streamSid": stream_sid
-                    })
+                        logger.debug("Truncating item", extra={"item_id": last_assistant_item, "audio_end_ms": elapsed_time})
+
+                        to_openai.put_control(media_events.item_truncate(last_assistant_item, elapsed_time))
+
+                    to_twilio.put_control(media_events.twilio_clear(stream_sid))
 
                     mark_queue.clear()
                     last_assistant_item = None
                     response_start_timestamp_twilio = None
-
-            async def send_mark(connection, stream_sid):
-                if stream_sid:
-                    mark_event = {
-                        "event": "mark",
-                        "streamSid": stream_sid,
-                        "mark": {"name": "responsePart"}
-                    }
-                    await connection.send_json(mark_event)
-                    mark_queue.append('responsePart')
-
-            await asyncio.gather(receive_from_twilio(), send_to_twilio())
+                    timeline.on_interruption_handled()
+
+            on_twilio_start(start, time.perf_counter())
+            # Hanging up the call from this process (hang_up_call) stops the relay right away
+            call_token = cancellation.call_token(call_sid)
+            relay = asyncio.ensure_future(asyncio.gather(receive_from_twilio(), send_to_twilio()))
+            loop = asyncio.get_running_loop()
+            unregister = call_token.on_cancel(lambda: loop.call_soon_threadsafe(relay.cancel))
+            try:
+                await relay
+            except asyncio.CancelledError:
+                if not call_token.cancelled:
+                    raise
+                logger.info("Relay stopped, the call was hung up")
+                await websocket.close()
+                cancellation.reclaimed(call_token, "media_stream")
+            finally:
+                unregister()
+                await to_openai.close()
+                await to_twilio.close()
+        finally:
+            if openai_ws.open:
+                await openai_ws.close()
     finally:
-        print("CALL OVER")
-
-async def initialize_session(openai_ws):
-    """Control initial session with OpenAI."""
+        if openai_ws is None:
+            await _close_unused(openai_connect)
+        if timeline is not None:
+            if summarizer is not None:
+                summary = await summarizer.finish()
+                if summary is not None:
+                    await firebase.update_call_data_async(user_id, call_sid, {
+                        "summary": summary,
+                        "summaryStats": summarizer.stats(),
+                    })
+            # Written last: the transcript stats mark the call document as complete
+            await transcript.close()
+            await firebase.update_call_data_async(user_id, call_sid, {
+                "timeline": timeline.summary()
+            })
+            logger.info("Call timeline", extra={"timeline": timeline.summary(), "percentiles": call_timing_aggregator.percentiles()})
+            # Make sure the transcript is committed before the voice agent reads it back
+            await firebase.get_async_writer().flush()
+        if call_sid is not None:
+            cancellation.release_call(call_sid)
+        metrics.MEDIA_ACTIVE_STREAMS.dec()
+        logger.info("Call over")
+
+async def initialize_session(openai_ws, instructions=INITIAL_PROMPT, conversation_text=INITIAL_CONVERSATION_TEXT,
+                             greeting_text=None):
+    """Control initial session with OpenAI. `greeting_text` is the pre-rendered greeting already played to the callee."""
     session_update = {
         "type": "session.update",
         "session": {
@@ -367,7 +669,7 @@ async def initialize_session(openai_ws):
             "input_audio_format": "g711_ulaw",
             "output_audio_format": "g711_ulaw",
             "voice": VOICE,
-            "instructions": INITIAL_PROMPT,
+            "instructions": instructions,
             "modalities": ["text", "audio"],
             "temperature": 0.7,
             "input_audio_transcription": {
@@ -375,15 +677,14 @@ async def initialize_session(openai_ws):
             }
         }
     }
-    print('Sending session update:', json.dumps(session_update))
+    logger.info("Sending session update", extra={"voice": VOICE, "instructions_chars": len(instructions)})
     await openai_ws.send(json.dumps(session_update))
 
     # Ensure the AI starts the conversation
-    await send_initial_conversation_item(openai_ws)
+    await send_initial_conversation_item(openai_ws, conversation_text, greeting_text)
 
-async def send_initial_conversation_item(openai_ws):
-    """Send initial conversation item if AI talks first."""
-    initial_conversation_item = {
+def _assistant_item(text):
+    return {
         "type": "conversation.item.create",
         "item": {
             "type": "message",
@@ -391,12 +692,21 @@ async def send_initial_conversation_item(openai_ws):
             "content": [
                 {
                     "type": "input_text",
-                    "text": INITIAL_CONVERSATION_TEXT
+                    "text": text
                 }
             ]
         }
     }
-    await openai_ws.send(json.dumps(initial_conversation_item))
+
+async def send_initial_conversation_item(openai_ws, conversation_text=INITIAL_CONVERSATION_TEXT, greeting_text=None):
+    """
+    Send initial conversation item if AI talks first. When the greeting was already
+    played, it goes into the conversation instead and the model waits for the callee.
+    """
+    await openai_ws.send(json.dumps(_assistant_item(conversation_text)))
+    if greeting_text:
+        await openai_ws.send(json.dumps(_assistant_item(greeting_text)))
+        return
     await openai_ws.send(json.dumps({"type": "response.create"}))
 
 